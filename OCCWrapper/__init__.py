@@ -6,7 +6,9 @@
 #  without any warranty.
 #  pythonocc wrapper classes
 
+import hashlib
 import numpy
+from collections import OrderedDict
 from OCC.Core.TColStd import TColStd_Array1OfReal, TColStd_Array1OfInteger
 
 import OCCWrapper
@@ -26,12 +28,14 @@ from OCC.Core.BRepAlgoAPI import BRepAlgoAPI_Fuse, BRepAlgoAPI_BooleanOperation,
 from OCC.Core.BRepOffsetAPI import BRepOffsetAPI_MakeThickSolid, BRepOffsetAPI_ThruSections
 from OCC.Core.BRepLib import breplib
 from OCC.Core.BRep import BRep_Tool_Surface, BRep_Builder
-from OCC.Core.TopoDS import topods, TopoDS_Compound, TopoDS_Face, TopoDS_Edge, TopoDS_Wire, TopoDS_Solid, TopoDS_Shape
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import topods, TopoDS_Compound, TopoDS_Face, TopoDS_Edge, TopoDS_Wire, TopoDS_Solid, TopoDS_Shape, \
+    TopoDS_Vertex
 from OCC.Core.TopExp import TopExp_Explorer
 from OCC.Core.TopAbs import TopAbs_EDGE, TopAbs_FACE
 from OCC.Core.TopTools import TopTools_ListOfShape
 from OCC.Core.BRep import BRep_Tool
-from OCC.Core.BRepAdaptor import BRepAdaptor_HCurve
+from OCC.Core.BRepAdaptor import BRepAdaptor_HCurve, BRepAdaptor_Curve, BRepAdaptor_Surface
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakePolygon
 from OCC.Core.BRepFill import BRepFill_CurveConstraint
 from OCC.Display.SimpleGui import init_display
@@ -125,6 +129,27 @@ class OccWire(OccBase):
         return self.wire
 
 
+# Construct a polygonal wire through an array of points in one operation
+class OccPolygon(OccBase):
+    def __init__(self, points, closed=False):
+        super().__init__()
+        self.wire = None
+        mkpolygon = BRepBuilderAPI_MakePolygon()
+        for p in points:
+            mkpolygon.Add(gp_Pnt(p[0], p[1], p[2]))
+        if closed:
+            mkpolygon.Close()
+        if not mkpolygon.IsDone():
+            OCCWrapper.OccError('OccPolygon', mkpolygon)
+        else:
+            self.done = True
+            self.wire = mkpolygon.Wire()
+        return
+
+    def Wire(self) -> TopoDS_Wire:
+        return self.wire
+
+
 class OccPlane:
     def __init__(self, p: numpy, v: numpy):
         self.plane
@@ -209,6 +234,13 @@ class OccArc(OccBase):
         # p3: IntermediatePoint
         super().__init__()
         self.edge = TopAbs_EDGE
+        # The arc is keyed on the points in construction order, start, intermediate and end point
+        key = curvecache.key('Arc', [p1, p3, p2])
+        edge = curvecache.get(key)
+        if edge is not None:
+            self.done = True
+            self.edge = edge
+            return
         gp1 = OccPoint(p1)
         gp2 = OccPoint(p2)
         gp3 = OccPoint(p3)
@@ -222,6 +254,7 @@ class OccArc(OccBase):
             else:
                 self.done = True
                 self.edge = mkedge.Edge()
+                curvecache.add(key, self.edge)
         return
 
     def Edge(self) -> TopoDS_Edge:
@@ -289,6 +322,12 @@ class OccNURBS(OccBase):
     def __init__(self, controlpoints: numpy, knots: numpy, m: int, degree: int, periodic: bool):
         super().__init__()
         self.edge = TopAbs_EDGE
+        key = curvecache.key('NURBS', [controlpoints, knots, [degree, periodic]])
+        edge = curvecache.get(key)
+        if edge is not None:
+            self.done = True
+            self.edge = edge
+            return
         array = []
         for pnt in controlpoints:
             p = OccPoint(pnt)
@@ -315,6 +354,7 @@ class OccNURBS(OccBase):
         else:
             self.done = True
             self.edge = mkedge.Edge()
+            curvecache.add(key, self.edge)
         return
 
     def Edge(self) -> TopoDS_Edge:
@@ -341,3 +381,167 @@ class OccMultiplicities:
         return self.uknots
     def multiplcity(self):
         return self.mult
+
+
+# Memoizes the edges of curves shared between neighbouring parts.
+# The key is an md5 hash of the curve type and its parameters quantized by the tolerance.
+class OccCurveCache:
+    def __init__(self, tolerance=1e-6, maxsize=10000):
+        self.tolerance = tolerance
+        self.maxsize = maxsize  # The least recently used edges are dropped beyond this size
+        self.edges = OrderedDict()  # The curve edge with the hash as key, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, type: str, parameters: list) -> str:
+        md5 = hashlib.md5(type.encode())
+        for p in parameters:
+            q = numpy.round(numpy.asarray(p, dtype=float) / self.tolerance).astype(numpy.int64)
+            md5.update(str(q.shape).encode())
+            md5.update(q.tobytes())
+        return md5.hexdigest()
+
+    def get(self, key: str):
+        edge = self.edges.get(key)
+        if edge is None:
+            self.misses = self.misses + 1
+        else:
+            self.hits = self.hits + 1
+            self.edges.move_to_end(key)
+        return edge
+
+    def add(self, key: str, edge: TopoDS_Edge):
+        self.edges[key] = edge
+        self.edges.move_to_end(key)
+        if len(self.edges) > self.maxsize:
+            self.edges.popitem(last=False)
+
+    def hitRate(self) -> float:
+        n = self.hits + self.misses
+        if n == 0:
+            return 0
+        return self.hits / n
+
+    def clear(self):
+        self.edges = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def printStatistics(self):
+        print('Curve cache lookups  : ', self.hits + self.misses)
+        print('Curve cache hits     : ', self.hits)
+        print('Curve cache hit rate :  {:.1f}%'.format(100 * self.hitRate()))
+
+
+curvecache = OccCurveCache()  # Shared by the curve constructors of a geometry build, cleared when a build starts
+
+
+# Samples each edge of a shape at npoints uniformly spaced curve parameters.
+# Edges() returns a (npoints,3) array for each edge and Value() all the points as one (n,3) array
+class OccEdgePoints:
+    def __init__(self, shape: TopoDS_Shape, npoints=20):
+        self.edges = []
+        topo = TopologyExplorer(shape)
+        for edge in topo.edges():
+            curve = BRepAdaptor_Curve(edge)
+            pts = []
+            for u in numpy.linspace(curve.FirstParameter(), curve.LastParameter(), npoints):
+                p = curve.Value(u)
+                pts.append([p.X(), p.Y(), p.Z()])
+            self.edges.append(numpy.array(pts))
+
+    def Edges(self) -> list:
+        return self.edges
+
+    def Value(self) -> numpy.array:
+        if len(self.edges) == 0:
+            return numpy.zeros((0, 3))
+        return numpy.concatenate(self.edges)
+
+
+# Returns the vertex positions and the edge mid points of a shape as a (n,3) array
+# The signature counts the faces by surface type and the edges by curve type
+class OccShapePoints:
+    def __init__(self, shape: TopoDS_Shape):
+        pts = []
+        types = {}
+        topo = TopologyExplorer(shape)
+        for vertex in topo.vertices():
+            p = BRep_Tool.Pnt(vertex)
+            pts.append([p.X(), p.Y(), p.Z()])
+        for edge in topo.edges():
+            curve = BRepAdaptor_Curve(edge)
+            u = 0.5 * (curve.FirstParameter() + curve.LastParameter())
+            p = curve.Value(u)
+            pts.append([p.X(), p.Y(), p.Z()])
+            key = 'E{}'.format(int(curve.GetType()))
+            types[key] = types.get(key, 0) + 1
+        for face in topo.faces():
+            key = 'F{}'.format(int(BRepAdaptor_Surface(face).GetType()))
+            types[key] = types.get(key, 0) + 1
+        self.points = numpy.array(pts).reshape(-1, 3)
+        self.signature = ','.join('{}:{}'.format(key, types[key]) for key in sorted(types))
+
+    def Value(self) -> numpy.array:
+        return self.points
+
+    def Signature(self) -> str:
+        return self.signature
+
+
+# Returns the coordinates of the first and last point of an edge
+class OccEdgeEnds:
+    def __init__(self, edge: TopoDS_Edge):
+        curve = BRepAdaptor_Curve(edge)
+        p1 = curve.Value(curve.FirstParameter())
+        p2 = curve.Value(curve.LastParameter())
+        self.start = numpy.array([p1.X(), p1.Y(), p1.Z()])
+        self.end = numpy.array([p2.X(), p2.Y(), p2.Z()])
+
+    def StartPoint(self) -> numpy.array:
+        return self.start
+
+    def EndPoint(self) -> numpy.array:
+        return self.end
+
+
+# Rebuilds a curve edge with its end vertices moved to the given points.
+# The vertex tolerance covers the distance to the curve ends, so the points must be within the tolerance
+class OccSnappedEdge:
+    def __init__(self, edge: TopoDS_Edge, start: numpy.array, end: numpy.array, tolerance: float):
+        self.done = False
+        self.edge = edge
+        curve, first, last = BRep_Tool.Curve(edge)
+        builder = BRep_Builder()
+        vertices = []
+        for p in (start, end):
+            vertex = TopoDS_Vertex()
+            builder.MakeVertex(vertex, gp_Pnt(p[0], p[1], p[2]), tolerance)
+            vertices.append(vertex)
+        mkedge = BRepBuilderAPI_MakeEdge(curve, vertices[0], vertices[1], first, last)
+        if mkedge.IsDone():
+            self.edge = mkedge.Edge()
+            self.done = True
+
+    def IsDone(self) -> bool:
+        return self.done
+
+    def Value(self) -> TopoDS_Edge:
+        return self.edge
+
+
+# A right-handed local frame given by its origin and the x and z axis
+class OccFrame:
+    def __init__(self, origin: numpy.array, xdir: numpy.array, zdir: numpy.array):
+        ax3 = gp_Ax3(gp_Pnt(origin[0], origin[1], origin[2]), gp_Dir(zdir[0], zdir[1], zdir[2]),
+                     gp_Dir(xdir[0], xdir[1], xdir[2]))
+        self.tolocal = gp_Trsf()
+        self.tolocal.SetTransformation(ax3)  # Maps global coordinates into the frame
+
+    # Return a copy of the shape expressed in the local frame
+    def toLocal(self, shape: TopoDS_Shape) -> TopoDS_Shape:
+        return BRepBuilderAPI_Transform(shape, self.tolocal, True).Shape()
+
+    # The location placing a shape defined in the local frame at its global position
+    def Location(self) -> TopLoc_Location:
+        return TopLoc_Location(self.tolocal.Inverted())
@@ -5,12 +5,21 @@
 #  notice and this notice are preserved.  This file is offered as-is,
 #  without any warranty.
 
+import hashlib
+import numpy
+
 # Class for UnitsML encapsulation
 
 class OCXUnit: #TODO: Implement parsing of UnitsML types
+    lengths = {'Um': 1.0, 'Udm': 0.1, 'Ucm': 0.01, 'Umm': 0.001}  # Metres per length unit with the unit id as key
+
     def __init__(self, namespace=None):
         self.namespace = namespace
 
+    # The length of the unit in metres, None if the unit is not a known length unit
+    def lengthScale(self, unit: str):
+        return OCXUnit.lengths.get(unit)
+
 
 #Retrive the quantity numeric value
     def numericValue(self, quantity): #TODO: Implement unit conversion
@@ -33,4 +42,204 @@ class Message:
         tag = object.tag
         id = object.get('id')
         print('OCX message: in {} with id {}: {} '.format(tag, id, msg))
-        return
\ No newline at end of file
+        return
+
+
+# Read access to the common attributes of a structure part element
+class StructurePart:
+    def __init__(self, object, dict: dict):
+        self.object = object
+        self.dict = dict
+        self.unit = OCXUnit()
+
+    def getGuid(self) -> str:
+        return self.object.get(self.dict['guidref'])
+
+    # The guid without the enclosing braces
+    def getCleanGuid(self) -> str:
+        guid = self.getGuid()
+        return '' if guid is None else guid.strip('{}')
+
+    def getType(self) -> str:
+        return self.object.tag.rsplit('}', 1)[-1]
+
+    def getName(self) -> str:
+        return self.object.get('name')
+
+    def getId(self) -> str:
+        return self.object.get('id')
+
+    def hasPysicalProperties(self) -> bool:
+        return self.object.find(self.dict['physicalproperties']) is not None
+
+    # The dry weight of the part, 0 if it is not given
+    def getDryWeight(self) -> float:
+        properties = self.object.find(self.dict['physicalproperties'])
+        weight = None if properties is None else properties.find(self.dict['dryweight'])
+        if weight is None or weight.get('numericvalue') is None:
+            return 0.0
+        return self.unit.numericValue(weight)
+
+
+# Generates unique part names in linear time.
+# A repeated name gets the suffix _<n> where n is a running count of the renamed parts
+class UniqueNames:
+    def __init__(self):
+        self.names = set()
+        self.count = 0
+
+    def unique(self, name: str) -> str:
+        if name in self.names:
+            self.count = self.count + 1
+            unique = name + '_' + str(self.count)
+            while unique in self.names:
+                self.count = self.count + 1
+                unique = name + '_' + str(self.count)
+            name = unique
+        self.names.add(name)
+        return name
+
+    def resetCount(self):
+        self.count = 0
+
+    def hasName(self, name: str) -> bool:
+        return name in self.names
+
+
+# Splits the structure parts of a model into panel children and root parts not owned by any panel
+class PanelPartition:
+    def __init__(self, model):
+        self.model = model
+        self.children = set()  # Guids of all parts owned by a panel
+        for panel in model.panelchildren:
+            self.children.update(model.panelchildren[panel])
+
+    def isRoot(self, guid: str) -> bool:
+        return guid not in self.children
+
+    def rootParts(self, objects: list) -> list:
+        roots = []
+        for object in objects:
+            if self.model.getGUID(object) not in self.children:
+                roots.append(object)
+        return roots
+
+
+# Canonical md5 hash of the content of an xml element subtree.
+# Volatile attributes are excluded and nested structure parts are represented by their guid only,
+# so the hash of a part changes only when the content of the part itself changes.
+# Sub elements with an excluded tag are left out of the hash.
+class ContentHash:
+    def __init__(self, guidref: str, parttags=(), volatile=('id',), excluded=(), reftype='refType'):
+        self.guidref = guidref  # The guid attribute
+        self.reftype = reftype  # The attribute marking a reference
+        self.parttags = set(parttags)  # Tags of nested parts hashed by reference
+        self.volatile = set(volatile)  # Attributes excluded from the hash
+        self.excluded = set(excluded)  # Tags of sub elements excluded from the hash
+
+    def hexdigest(self, element) -> str:
+        md5 = hashlib.md5()
+        self.update(md5, element, True)
+        return md5.hexdigest()
+
+    def update(self, md5, element, root: bool):
+        if not root and element.tag in self.parttags:
+            md5.update(self.reference(element.get(self.guidref)))
+        else:
+            md5.update(self.start(element.tag, element.attrib))
+            md5.update(self.text(element.text))
+            for child in element:
+                if child.tag not in self.excluded:
+                    self.update(md5, child, False)
+                md5.update(self.text(child.tail))
+            md5.update(b'E\0')
+
+    # The canonical tokens. Used by all hashers so hashes from different parsers compare equal
+    def start(self, tag: str, attrib: dict) -> bytes:
+        token = 'S' + tag
+        for key in sorted(attrib):
+            if key not in self.volatile:
+                token = token + '\1' + key + '=' + attrib[key]
+        return (token + '\0').encode()
+
+    def text(self, text: str) -> bytes:
+        if text is None:
+            return b''
+        text = text.strip()
+        if text == '':
+            return b''
+        return ('T' + text + '\0').encode()
+
+    def reference(self, guid: str) -> bytes:
+        return ('R' + str(guid) + '\0').encode()
+
+    # The hash of the element content and of the definitions it refers to with reference elements.
+    # definition(guid) returns the hash of the referenced definition, or None if it does not exist
+    def hexdigestReferences(self, element, definition) -> str:
+        md5 = hashlib.md5()
+        self.update(md5, element, True)
+        for child in element.iter():
+            if child.get(self.reftype) is not None or child.get('refType') is not None:
+                guid = child.get(self.guidref)
+                if guid is not None:
+                    md5.update(self.reference(guid))
+                    md5.update(str(definition(guid)).encode())
+        return md5.hexdigest()
+
+
+# Rolls the dry weights of the panel children up to the panels in one vectorized pass.
+# The children of all panels are flattened with the index of their panel and summed with numpy.bincount
+class WeightRollUp:
+    def __init__(self, weights: dict, panels: dict, panelweights=None):
+        # weights: the part dry weight with the guid as key
+        # panels: the child guids with the panel guid as key
+        # panelweights: the reported panel dry weight with the panel guid as key. Taken from weights if None
+        if panelweights is None:
+            panelweights = weights
+        self.panels = list(panels)  # The panel guids in index order
+        self.index = {guid: i for i, guid in enumerate(self.panels)}
+        counts = numpy.fromiter((len(panels[guid] or ()) for guid in self.panels), numpy.int64, len(self.panels))
+        children = [child for guid in self.panels for child in panels[guid] or ()]
+        self.parent = numpy.repeat(numpy.arange(len(self.panels)), counts)  # The panel index of each child
+        self.childweights = numpy.fromiter((weights.get(child, 0.0) for child in children), float, len(children))
+        self.rolledup = numpy.bincount(self.parent, weights=self.childweights, minlength=len(self.panels))
+        self.reported = numpy.fromiter((panelweights.get(guid, numpy.nan) for guid in self.panels), float,
+                                       len(self.panels))
+        owned = set(children)
+        owned.update(self.panels)
+        self.rootweight = sum(weight for guid, weight in weights.items() if guid not in owned)
+
+    def getRolledUp(self, guid: str) -> float:
+        return float(self.rolledup[self.index[guid]])
+
+    def getReported(self, guid: str) -> float:
+        return float(self.reported[self.index[guid]])
+
+    # The sum of the child weights of all panels and the weight of the parts outside panels
+    def totalWeight(self) -> float:
+        return float(self.rolledup.sum()) + self.rootweight
+
+    def reportedWeight(self) -> float:
+        return float(numpy.nansum(self.reported)) + self.rootweight
+
+    # The relative deviation of the rolled up weight from the reported weight. NaN for panels without weight
+    def deviations(self) -> numpy.ndarray:
+        deviation = numpy.full(len(self.panels), numpy.nan)
+        valid = self.reported > 0
+        deviation[valid] = numpy.abs(1 - self.rolledup[valid] / self.reported[valid])
+        return deviation
+
+    # Tuples of (guid, reported weight, rolled up weight) of the panels deviating more than limit
+    def deviating(self, limit=0.1) -> list:
+        deviation = self.deviations()
+        return [(self.panels[i], float(self.reported[i]), float(self.rolledup[i]))
+                for i in numpy.flatnonzero(deviation > limit)]
+
+    # The relative change of the rolled up weight of the panels in both roll-ups with the guid as key
+    def changes(self, baseline) -> dict:
+        common = [guid for guid in self.panels if guid in baseline.index]
+        w1 = numpy.fromiter((baseline.rolledup[baseline.index[guid]] for guid in common), float, len(common))
+        w2 = numpy.fromiter((self.rolledup[self.index[guid]] for guid in common), float, len(common))
+        valid = w1 > 0
+        change = w2[valid] / w1[valid] - 1
+        return dict(zip((guid for guid, v in zip(common, valid) if v), change.tolist()))
@@ -5,9 +5,21 @@
 #  notice and this notice are preserved.  This file is offered as-is,
 #  without any warranty.
 
+import concurrent.futures
+import hashlib
+import heapq
+import os
+import pickle
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+import numpy
 from pathlib import Path
 import OCXParser
 import logging
+from OCXCommon import StructurePart, ContentHash, WeightRollUp
+
 
 class OCXDiff:
     def __init__(self, ocx1: str, ocx2: str, schema: str, outputfile: str, log=False):
@@ -16,18 +28,812 @@ class OCXDiff:
         self.schema = Path(schema)
         self.out = Path(outputfile)
         self.logging = log
-        logger = logging.getLogger('ocx')
+        self.logger = logging.getLogger('ocx')
+        self.timings = []  # Tuples of (phase, wall clock seconds)
+        self.clock = time.perf_counter()
 
     def importModels(self) -> True:
-        self.ocx1 = OCXParser.OCXmodel(self.path1.name, self.schema.name, log)
-        self.ocx2 = OCXParser.OCXmodel(self.path2.name, self.schema.name, log)
+        self.ocx1 = OCXParser.OCXmodel(str(self.path1), str(self.schema), self.logging)
+        self.ocx2 = OCXParser.OCXmodel(str(self.path2), str(self.schema), self.logging)
         self.ocx1.importModel()
         self.ocx2.importModel()
+        self.phase('Import models')
+        return True
+
+    # Record the wall clock time since the previous phase
+    def phase(self, name: str, seconds=None):
+        now = time.perf_counter()
+        if seconds is None:
+            seconds = now - self.clock
+        self.clock = now
+        self.timings.append((name, seconds))
+
+    def printTimings(self):
+        print('Phase timings')
+        print('-------------')
+        for name, seconds in self.timings:
+            print('{:34}: {:8.2f} s'.format(name, seconds))
+        print('')
 
+
+# Content fingerprints of the structure parts of a model arranged as a Merkle tree.
+# The fingerprint of a part is the ContentHash of its xml subtree, where nested parts only contribute their guid.
+# A changed plate therefore changes the fingerprint of the plate but not of its parent panel.
+# The part fingerprints roll up into a hash of each panel with its children, the parts outside panels into a
+# root hash, and the panel and root hashes into the vessel hash.
+# The tables are cached in the file <model>.fp next to the model and reused as long as the model, the schema
+# and the hash configuration are unchanged
 class FingerPrint:
-    def __init__(self, ocx: OCXParser.OCXmodel):
+    parttypes = ['panel', 'plate', 'stiffener', 'bracket', 'pillar']
+    volatile = ('id',)  # The attributes left out of the part hashes
+
+    def __init__(self, ocxfile: Path, schema: Path):
+        self.file = Path(ocxfile)
+        self.cache = self.file.parent / (self.file.name + '.fp')
+        stat = self.file.stat()
+        schema = Path(schema)
+        schemastamp = None
+        if schema.is_file():
+            schemastat = schema.stat()
+            schemastamp = (str(schema.resolve()), schemastat.st_size, schemastat.st_mtime_ns)
+        self.stamp = (stat.st_size, stat.st_mtime_ns, schemastamp, tuple(FingerPrint.parttypes), FingerPrint.volatile)
+        self.ocx = None
+        self.fingerprints = {}  # The part fingerprint with the guid as key
+        self.weights = {}  # The part dry weight with the guid as key
+        self.descriptions = {}  # The tuple (type, name, clean guid) of the part with the guid as key
+        self.panels = {}  # The panel children guids with the panel guid as key
+        self.roots = []  # The guids of the parts outside panels
+        self.tree = {}  # The hash of the panel and its children with the panel guid as key
+        self.roothash = ''
+        self.vessel = ''  # The hash of the whole model
+        self.objects = {}  # The part with the guid as key
+
+    # Load the cached tables. Returns False if there is no valid cache for the model file
+    def load(self) -> bool:
+        if not self.cache.is_file():
+            return False
+        try:
+            with open(self.cache, 'rb') as fd:
+                tables = pickle.load(fd)
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError):
+            return False
+        if tables[0] != self.stamp or len(tables) != len(self.tables()):
+            return False
+        self.setTables(tables)
+        print('Using the cached fingerprints of {}'.format(self.file.name))
+        return True
+
+    # The compact state of the fingerprints without the model
+    def tables(self) -> tuple:
+        return (self.stamp, self.fingerprints, self.weights, self.descriptions, self.panels, self.roots, self.tree,
+                self.roothash, self.vessel)
+
+    def setTables(self, tables: tuple):
+        self.fingerprints, self.weights, self.descriptions, self.panels, self.roots, self.tree, self.roothash, \
+            self.vessel = tables[1:]
+
+    def save(self):
+        try:
+            with open(self.cache, 'wb') as fd:
+                pickle.dump(self.tables(), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            print('Could not write the fingerprint cache {}'.format(self.cache))
+
+    # Index the parts of the imported model by guid
+    def setModel(self, ocx: OCXParser.OCXmodel):
         self.ocx = ocx
+        self.objects = {}
+        for parts in [ocx.panels, ocx.plates, ocx.stiffeners, ocx.brackets, ocx.pillars]:
+            for part in parts:
+                guid = ocx.getGUID(part)
+                if guid not in self.objects:  # Duplicate guids are reported by the model import
+                    self.objects[guid] = part
+
+    # Compute the fingerprint tables of the imported model and cache them
+    def build(self, ocx: OCXParser.OCXmodel):
+        self.setModel(ocx)
+        dict = ocx.dict
+        contenthash = ContentHash(dict['guidref'], [dict[type] for type in FingerPrint.parttypes],
+                                  FingerPrint.volatile)
+        for guid, part in self.objects.items():
+            self.fingerprints[guid] = contenthash.hexdigest(part)
+            structurepart = StructurePart(part, dict)
+            self.descriptions[guid] = (structurepart.getType(), structurepart.getName(),
+                                       structurepart.getCleanGuid())
+            if structurepart.hasPysicalProperties():
+                self.weights[guid] = structurepart.getDryWeight()
+        children = set()
+        for part in ocx.panels:
+            guid = ocx.getGUID(part)
+            self.panels[guid] = ocx.getPanelChildren(guid)
+            children.update(self.panels[guid])
+        self.roots = [guid for guid in self.objects if guid not in children and guid not in self.panels]
+        self.merkleTree()
+        self.save()
+
+    def merkleTree(self):
+        vessel = hashlib.md5()
+        for guid in sorted(self.panels):
+            md5 = hashlib.md5(self.fingerprints.get(guid, '').encode())
+            for child in sorted(self.panels[guid]):
+                md5.update((child + self.fingerprints.get(child, '')).encode())
+            self.tree[guid] = md5.hexdigest()
+            vessel.update((guid + self.tree[guid]).encode())
+        md5 = hashlib.md5()
+        for guid in sorted(self.roots):
+            md5.update((guid + self.fingerprints[guid]).encode())
+        self.roothash = md5.hexdigest()
+        vessel.update(self.roothash.encode())
+        self.vessel = vessel.hexdigest()
+
+    def partFingerPrints(self) -> dict:
+        return self.fingerprints
+
+    def panelFingerPrint(self, guid: str) -> str:
+        # The Panel fingerprint is the hash of the Panel and its children
+        return self.tree.get(guid)
+
+    def getFingerPrint(self, guid: str):
+        return self.fingerprints.get(guid)
+
+    def getObject(self, guid: str):
+        return self.objects.get(guid)
+
+    # The panel weights rolled up from the cached part weights
+    def rollUp(self) -> WeightRollUp:
+        return WeightRollUp(self.weights, self.panels)
+
+
+# Compares a baseline and a revised model by the part fingerprints.
+# The comparison starts at the vessel hash and only descends into the panels with a changed hash.
+# The baseline model is only imported when its fingerprints are not cached or its parts are needed for a report
+class DiffAgent(OCXDiff):
+    # The dry weight change categories as tuples of (upper relative change, label)
+    weightchanges = [(-0.1, 'Weight decrease > 10%'),
+                     (-0.01, 'Weight decrease 1-10%'),
+                     (0.01, 'Weight unchanged'),
+                     (0.1, 'Weight increase 1-10%'),
+                     (float('inf'), 'Weight increase > 10%')]
+
+    def __init__(self, ocx1: str, ocx2: str, schema: str, outputfile: str, log=False):
+        super().__init__(ocx1, ocx2, schema, outputfile, log)
+        self.ocx1 = None
+        self.importModels()
+        self.dict = self.ocx2.dict
+        self.deletedpart = None  # Baseline parts not in the revision with the guid as key. Resolved on first use
+        self.deletedguids = []
+        self.newpart = {}  # Revision parts not in the baseline
+        self.modifiedpart = {}  # Revision parts with a changed fingerprint
+        self.samepart = {}  # Revision parts with an unchanged fingerprint
+        self.changes = {}  # The change category of the modified parts after a geometric diff
+        self.compare()
+
+    # The baseline fingerprints are computed in a separate process while the revision is imported.
+    # Only the compact fingerprint tables are returned from the process. They include the part descriptions
+    # needed by the baseline report, so the baseline model is only imported in this process for a geometric diff
+    def importModels(self) -> True:
+        self.baseline = FingerPrint(self.path1, self.schema)
+        worker = None
+        try:
+            if not self.baseline.load():
+                worker = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+                future = worker.submit(_fingerPrintTables, str(self.path1), str(self.schema), self.logging)
+            self.ocx2 = OCXParser.OCXmodel(str(self.path2), str(self.schema), self.logging)
+            self.ocx2.importModel()
+            self.phase('Import revision')
+            self.revision = FingerPrint(self.path2, self.schema)
+            if self.revision.load():
+                self.revision.setModel(self.ocx2)
+            else:
+                self.revision.build(self.ocx2)
+            self.phase('Revision fingerprints')
+            if worker is not None:
+                tables, seconds = future.result()
+                self.baseline.setTables(tables)
+                self.phase('Wait for baseline')
+                self.timings.append(('Baseline import and fingerprints', seconds))
+        finally:
+            if worker is not None:
+                worker.shutdown()
+        return True
+
+    # Import the baseline model on first use
+    def baselineModel(self) -> OCXParser.OCXmodel:
+        if self.ocx1 is None:
+            self.ocx1 = OCXParser.OCXmodel(str(self.path1), str(self.schema), self.logging)
+            self.ocx1.importModel()
+            self.baseline.setModel(self.ocx1)
+            self.phase('Import baseline')
+        return self.ocx1
+
+    def compare(self):
+        baseline = self.baseline
+        revision = self.revision
+        fp1 = baseline.fingerprints
+        fp2 = revision.fingerprints
+        changed = []  # Revision guids in changed subtrees
+        if baseline.vessel == revision.vessel:
+            self.samepart = dict(revision.objects)
+        else:
+            # Only the panels with a changed hash are compared part by part.
+            # The parts of a deleted baseline part can only be in a changed baseline panel or the changed roots
+            samepart = self.samepart
+            for guid, children in revision.panels.items():
+                if baseline.tree.get(guid) == revision.tree[guid]:
+                    samepart[guid] = revision.getObject(guid)
+                    for child in children:
+                        samepart[child] = revision.getObject(child)
+                else:
+                    changed.append(guid)
+                    changed.extend(children)
+            candidates = []  # Baseline guids in changed subtrees
+            for guid, children in baseline.panels.items():
+                if revision.tree.get(guid) != baseline.tree[guid]:
+                    candidates.append(guid)
+                    candidates.extend(children)
+            if baseline.roothash == revision.roothash:
+                for guid in revision.roots:
+                    samepart[guid] = revision.getObject(guid)
+            else:
+                changed.extend(revision.roots)
+                candidates.extend(baseline.roots)
+            self.deletedguids = list(dict.fromkeys(guid for guid in candidates if guid not in fp2))
+        for guid in changed:
+            fp = fp1.get(guid)
+            if fp is None:
+                self.newpart[guid] = revision.getObject(guid)
+            elif fp != fp2[guid]:
+                self.modifiedpart[guid] = revision.getObject(guid)
+            else:
+                self.samepart[guid] = revision.getObject(guid)
+        print('')
+        print('Model differences')
+        print('-----------------')
+        print('Deleted parts        : ', len(self.deletedguids))
+        print('New parts            : ', len(self.newpart))
+        print('Modified parts       : ', len(self.modifiedpart))
+        print('Unchanged parts      : ', len(self.samepart))
+        print('')
+        self.phase('Compare')
+
+    # Separate geometry changes from attribute changes and numerical noise in the modified parts.
+    # Parts only changed within the tolerance are moved to the unchanged parts
+    def geometricDiff(self, tolerance: float):
+        self.baselineModel()
+        geometry = GeometryDiff(self.dict, tolerance)
+        noise = 0
+        for guid in list(self.modifiedpart):
+            part = self.modifiedpart[guid]
+            change = geometry.classify(self.baseline.getObject(guid), part)
+            self.changes[guid] = change
+            if change == GeometryDiff.NOISE:
+                self.samepart[guid] = self.modifiedpart.pop(guid)
+                noise = noise + 1
+        print('Geometric diff with tolerance {}:'.format(tolerance))
+        for change in [GeometryDiff.GEOMETRY, GeometryDiff.ATTRIBUTE, GeometryDiff.NOISE]:
+            print('{:21}: {}'.format(change, list(self.changes.values()).count(change)))
+        geometry.printStatistics()
+        self.phase('Geometric diff')
+        return self.changes
+
+    def deletedParts(self) -> dict:
+        if self.deletedpart is None:
+            self.baselineModel()
+            self.deletedpart = {guid: self.baseline.getObject(guid) for guid in self.deletedguids}
+        return self.deletedpart
+
+    def newParts(self) -> dict:
+        return self.newpart
+
+    def modifiedParts(self) -> dict:
+        return self.modifiedpart
+
+    def sameParts(self) -> dict:
+        return self.samepart
+
+    # The baseline version of the modified parts
+    def baselineModified(self) -> dict:
+        self.baselineModel()
+        return {guid: self.baseline.getObject(guid) for guid in self.modifiedpart}
+
+    # The change categories of an array of relative weight changes
+    @staticmethod
+    def weightLabels(changes: numpy.ndarray) -> list:
+        limits = numpy.array([limit for limit, label in DiffAgent.weightchanges])
+        labels = [label for limit, label in DiffAgent.weightchanges]
+        return [labels[i] for i in numpy.searchsorted(limits, changes, side='right')]
+
+    # The relative dry weight change category of the modified parts with the clean lower case guid as key
+    def weightRatios(self) -> dict:
+        guids = [guid for guid in self.modifiedpart
+                 if self.baseline.weights.get(guid, 0) > 0 and guid in self.revision.weights]
+        w1 = numpy.fromiter((self.baseline.weights[guid] for guid in guids), float, len(guids))
+        w2 = numpy.fromiter((self.revision.weights[guid] for guid in guids), float, len(guids))
+        ratios = {}
+        for guid, label in zip(guids, DiffAgent.weightLabels(w2 / w1 - 1)):
+            part = StructurePart(self.modifiedpart[guid], self.dict)
+            ratios[part.getCleanGuid().lower()] = label
+        return ratios
+
+    # The change category of the rolled up child weights of the panels with a changed hash
+    # with the clean lower case guid as key
+    def panelWeightRatios(self) -> dict:
+        changes = self.revision.rollUp().changes(self.baseline.rollUp())
+        guids = [guid for guid in changes if self.baseline.tree.get(guid) != self.revision.tree.get(guid)]
+        labels = DiffAgent.weightLabels(numpy.array([changes[guid] for guid in guids], dtype=float))
+        ratios = {}
+        for guid, label in zip(guids, labels):
+            part = StructurePart(self.revision.getObject(guid), self.dict)
+            ratios[part.getCleanGuid().lower()] = (label, self.revision.getObject(guid))
+        return ratios
+
+    def dryWeightChange(self, file: str, map: bool, entitymap: str):
+        from OCXJson import DryWeightChange  # The json reports are only needed when a report is written
+        changes = DryWeightChange(self.ocx2, map, entitymap)
+        changes.reportChanges(self.newpart, self.modifiedpart, self.weightRatios(), file, self.panelWeightRatios())
+        changes.writeJson()
+        self.phase('Report dryWeightChange')
+
+    def revisedChanges(self, file: str, map: bool, entitymap: str):
+        from OCXJson import TrackChanges
+        changes = TrackChanges(self.ocx2, map, entitymap)
+        changes.revisionChanges(self.newpart, self.modifiedpart, file)
+        changes.writeJson()
+        self.phase('Report revisedChanges')
+
+    # The baseline parts are taken from the imported baseline model if it is already imported,
+    # otherwise they are described by the baseline fingerprint tables
+    def baselineChanges(self, file: str, map: bool, entitymap: str):
+        from OCXJson import TrackChanges
+        if self.ocx1 is None:
+            descriptions = self.baseline.descriptions
+            changes = TrackChanges(self.ocx2, map, entitymap)
+            changes.baselineChanges({guid: descriptions[guid] for guid in self.deletedguids},
+                                    {guid: descriptions[guid] for guid in self.modifiedpart}, file)
+        else:
+            changes = TrackChanges(self.ocx1, map, entitymap)
+            changes.baselineChanges(self.deletedParts(), self.baselineModified(), file)
+        changes.writeJson()
+        self.phase('Report baselineChanges')
+
+
+# Classifies a modified part as changed geometry, changed attributes or numerical noise.
+# The fast path compares the numeric values of the geometry sub elements in document order. If the geometry
+# elements are structured differently, the outer contours are sampled and compared as point arrays, which needs OCC.
+class GeometryDiff:
+    GEOMETRY = 'Geometry changed'
+    ATTRIBUTE = 'Attribute changed'
+    NOISE = 'Numerical noise'
+    geometrytags = ['outercontour', 'innercontours', 'unboundedgeometry', 'traceline']
+
+    def __init__(self, dict: dict, tolerance: float, npoints=20):
+        self.dict = dict
+        self.tolerance = tolerance
+        self.npoints = npoints  # Contour sample points on each edge
+        self.tags = [dict[tag] for tag in GeometryDiff.geometrytags if tag in dict]
+        # The physical properties are recomputed by the exporting system and compared within the tolerance
+        self.physical = [dict[tag] for tag in ['physicalproperties'] if tag in dict]
+        self.attributes = ContentHash(dict['guidref'], [dict[type] for type in FingerPrint.parttypes],
+                                      excluded=self.tags + self.physical)
+        self.volatile = self.attributes.volatile
+        self.fallbacks = 0  # Number of parts compared by the sampled contours
+
+    def classify(self, old, new) -> str:
+        if self.geometryDeviation(old, new) > self.tolerance:
+            return GeometryDiff.GEOMETRY
+        if self.attributes.hexdigest(old) != self.attributes.hexdigest(new):
+            return GeometryDiff.ATTRIBUTE
+        if self.valueDeviation(old, new, self.physical) > self.tolerance:
+            return GeometryDiff.ATTRIBUTE
+        return GeometryDiff.NOISE
+
+    # The numeric attribute values of the sub elements with the given tags and a hash of their structure
+    def numericValues(self, part, tags: list) -> tuple:
+        md5 = hashlib.md5()
+        values = []
+        for tag in tags:
+            for geometry in part.findall(tag):
+                for element in geometry.iter():
+                    md5.update(self.attributes.start(element.tag, {}))
+                    for key in sorted(element.attrib):
+                        if key in self.volatile:
+                            continue
+                        value = element.attrib[key]
+                        try:
+                            values.append(float(value))
+                            md5.update((key + '\0').encode())
+                        except ValueError:
+                            md5.update((key + '=' + value + '\0').encode())
+                    for value in (element.text or '').split():  # Lists of values like knot vectors
+                        try:
+                            values.append(float(value))
+                        except ValueError:
+                            md5.update(self.attributes.text(value))
+        return md5.hexdigest(), numpy.array(values)
+
+    # The largest change of the numeric values, infinite if the sub elements differ in structure
+    def valueDeviation(self, old, new, tags: list) -> float:
+        structure1, values1 = self.numericValues(old, tags)
+        structure2, values2 = self.numericValues(new, tags)
+        if structure1 != structure2:
+            return float('inf')
+        if len(values1) == 0:
+            return 0.0
+        return float(numpy.max(numpy.abs(values2 - values1)))
+
+    def geometryDeviation(self, old, new) -> float:
+        deviation = self.valueDeviation(old, new, self.tags)
+        if deviation != float('inf'):
+            return deviation
+        self.fallbacks = self.fallbacks + 1
+        return self.contourDeviation(old, new)
+
+    # The largest distance from the contour samples of one part to the sampled contour of the other
+    def contourDeviation(self, old, new) -> float:
+        try:
+            import OCC
+        except ImportError:
+            return float('inf')  # Can not compare the contours without OCC
+        import OCXGeometry
+        polylines = []
+        for part in [old, new]:
+            if part.find(self.dict['outercontour']) is None:
+                return float('inf')
+            contour = OCXGeometry.OuterContour(part, self.dict)
+            contour.curveResolution(self.npoints)
+            polyline = contour.contourAsPolylines()
+            if len(polyline) == 0:
+                return float('inf')
+            polylines.append(polyline)
+        return max(self.polylineDistance(polylines[0], polylines[1]),
+                   self.polylineDistance(polylines[1], polylines[0]))
+
+    # The largest distance from the points of the first polylines to the segments of the second
+    def polylineDistance(self, polylines1: list, polylines2: list) -> float:
+        points = numpy.concatenate(polylines1)
+        start = numpy.concatenate([polyline[:-1] for polyline in polylines2])
+        end = numpy.concatenate([polyline[1:] for polyline in polylines2])
+        direction = end - start
+        length = numpy.maximum(numpy.einsum('ij,ij->i', direction, direction), 1e-30)
+        deviation = 0.0
+        for chunk in range(0, len(points), 256):  # Bounds the size of the distance matrix
+            p = points[chunk:chunk + 256, None, :]
+            t = numpy.clip(numpy.einsum('ijk,jk->ij', p - start, direction) / length, 0.0, 1.0)
+            closest = start + t[:, :, None] * direction
+            distance = numpy.linalg.norm(p - closest, axis=2).min(axis=1)
+            deviation = max(deviation, float(distance.max()))
+        return deviation
+
+    def printStatistics(self):
+        print('Parts compared by sampled contours: {}'.format(self.fallbacks))
+
+
+# Runs in a separate process: import a model and return its compact fingerprint tables and the elapsed time
+def _fingerPrintTables(ocxfile: str, schema: str, log: bool) -> tuple:
+    start = time.perf_counter()
+    fingerprint = FingerPrint(ocxfile, schema)
+    if not fingerprint.load():
+        ocx = OCXParser.OCXmodel(ocxfile, schema, log)
+        ocx.importModel()
+        fingerprint.build(ocx)
+    return fingerprint.tables(), time.perf_counter() - start
+
+
+# Change history of the parts over an ordered list of model revisions.
+# The fingerprint tables of the revisions are taken from the cache or computed once in parallel worker processes.
+# The sorted tables are merged in a single pass to a timeline of the changes of each part
+class RevisionChain(OCXDiff):
+    CREATED = 'Created'
+    MODIFIED = 'Modified'
+    DELETED = 'Deleted'
+
+    maxprocesses = 4  # The default bound on the worker processes, each holds an imported model
+
+    def __init__(self, revisions: list, schema: str, outputfile: str, log=False, processes=None):
+        super().__init__(revisions[0], revisions[-1], schema, outputfile, log)
+        self.revisions = [Path(revision) for revision in revisions]
+        if processes is None:
+            processes = min(RevisionChain.maxprocesses, os.cpu_count() or 1)
+        self.processes = max(1, processes)
+        self.fingerprints = []  # The fingerprint table of each revision
+        self.timelines = {}  # The list of (revision, change) with the guid as key for the changed parts
+        self.unchanged = 0  # Number of parts in all revisions without changes
+
+    def importModels(self) -> True:
+        missing = []
+        for revision in self.revisions:
+            fingerprint = FingerPrint(revision, self.schema)
+            if not fingerprint.load():
+                missing.append(fingerprint)
+            self.fingerprints.append(fingerprint)
+        if len(missing) > 0:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.processes, len(missing))) as pool:
+                futures = [pool.submit(_fingerPrintTables, str(fingerprint.file), str(self.schema), self.logging)
+                           for fingerprint in missing]
+                for fingerprint, future in zip(missing, futures):
+                    tables, seconds = future.result()
+                    fingerprint.setTables(tables)
+        self.phase('Fingerprints of {} revisions'.format(len(self.revisions)))
+        return True
+
+    # The records (guid, revision, fingerprint) of a revision sorted by guid
+    def records(self, revision: int):
+        fingerprints = self.fingerprints[revision].fingerprints
+        for guid in sorted(fingerprints):
+            yield guid, revision, fingerprints[guid]
+
+    def compare(self):
+        self.importModels()
+        last = len(self.revisions) - 1
+        merged = heapq.merge(*[self.records(revision) for revision in range(len(self.revisions))])
+        guid = None
+        timeline = []
+        previous = None  # The (revision, fingerprint) of the part in the previous revision it was found in
+        for record in merged:
+            if record[0] != guid:
+                self.endTimeline(guid, timeline, previous, last)
+                guid = record[0]
+                timeline = []
+                previous = None
+            revision, fp = record[1], record[2]
+            if previous is None or previous[0] < revision - 1:
+                if previous is not None:
+                    timeline.append((previous[0] + 1, RevisionChain.DELETED))
+                timeline.append((revision, RevisionChain.CREATED))
+            elif previous[1] != fp:
+                timeline.append((revision, RevisionChain.MODIFIED))
+            previous = (revision, fp)
+        self.endTimeline(guid, timeline, previous, last)
+        self.phase('Merge revisions')
+        self.printChanges()
+
+    def endTimeline(self, guid, timeline: list, previous: tuple, last: int):
+        if guid is None:
+            return
+        if previous[0] < last:
+            timeline.append((previous[0] + 1, RevisionChain.DELETED))
+        if timeline == [(0, RevisionChain.CREATED)]:
+            self.unchanged = self.unchanged + 1
+        else:
+            self.timelines[guid] = timeline
+
+    def getTimeline(self, guid: str) -> list:
+        return self.timelines.get(guid, [])
+
+    def printChanges(self):
+        counts = [{RevisionChain.CREATED: 0, RevisionChain.MODIFIED: 0, RevisionChain.DELETED: 0}
+                  for revision in self.revisions]
+        for timeline in self.timelines.values():
+            for revision, change in timeline:
+                counts[revision][change] = counts[revision][change] + 1
+        print('')
+        print('Revision changes')
+        print('----------------')
+        for revision, count in enumerate(counts):
+            print('r{} {:30}: created {:8}, modified {:8}, deleted {:8}'.format(
+                revision, self.revisions[revision].name, count[RevisionChain.CREATED],
+                count[RevisionChain.MODIFIED], count[RevisionChain.DELETED]))
+        print('Parts unchanged in all revisions: {}'.format(self.unchanged))
+        print('')
+
+    # Write the timeline of each changed part to the output file
+    def writeTimelines(self):
+        with open(self.out, 'w') as fd:
+            for revision, path in enumerate(self.revisions):
+                fd.write('r{}: {}\n'.format(revision, path))
+            for guid in sorted(self.timelines):
+                changes = ', '.join('{} in r{}'.format(change, revision) for revision, change in self.timelines[guid])
+                fd.write('{}: {}\n'.format(guid, changes))
+        print('Wrote the timelines of {} parts to {}'.format(len(self.timelines), self.out))
+
+
+# Streams an OCX file with expat and writes the tuples (guid, fingerprint, byte offset) of the structure parts
+# to sorted runs on disk, so only one run is held in memory.
+# The fingerprints are computed with the ContentHash tokens and are equal to the fingerprints of the imported model
+class StreamFingerPrint:
+    def __init__(self, ocxfile: str, dict: dict, tmpdir: str, runsize=200000):
+        self.file = Path(ocxfile)
+        self.dict = dict
+        self.guidref = dict['guidref']
+        self.parttags = set(dict[type] for type in FingerPrint.parttypes)
+        self.contenthash = ContentHash(self.guidref, self.parttags)
+        self.tmpdir = Path(tempfile.mkdtemp(dir=tmpdir))  # Each stream has its own runs, the file names may be equal
+        self.runsize = runsize
+        self.runs = []  # The sorted run files
+        self.namespaces = {}  # The namespace declarations with the prefix as key
+        self.records = []  # The records of the current run
+        self.stack = []  # The open part hashers as tuples of (md5, guid, offset, depth)
+        self.depth = 0
+        self.text = []  # Character data since the last start or end tag
+        self.parts = 0
+
+    def parse(self):
+        parser = xml.parsers.expat.ParserCreate(namespace_separator='}')
+        parser.buffer_text = True
+        parser.StartElementHandler = self.startElement
+        parser.EndElementHandler = self.endElement
+        parser.CharacterDataHandler = self.text.append
+        parser.StartNamespaceDeclHandler = self.namespaceDecl
+        self.parser = parser
+        with open(self.file, 'rb') as fd:
+            parser.ParseFile(fd)
+        self.spill()
+        print('Streamed {} parts of {} to {} sorted runs'.format(self.parts, self.file.name, len(self.runs)))
+
+    def namespaceDecl(self, prefix, uri):
+        self.namespaces[prefix or ''] = uri
+
+    # Expat names are 'uri}name'. The ElementTree names are '{uri}name'
+    def name(self, name: str) -> str:
+        if '}' in name:
+            return '{' + name
+        return name
+
+    def flushText(self):
+        if self.stack and self.text:
+            self.stack[-1][0].update(self.contenthash.text(''.join(self.text)))
+        self.text.clear()
+
+    def startElement(self, name, attributes):
+        self.flushText()
+        self.depth = self.depth + 1
+        tag = self.name(name)
+        if self.stack or tag in self.parttags:
+            attrib = {self.name(key): attributes[key] for key in attributes}
+            if tag in self.parttags:
+                guid = attrib.get(self.guidref)
+                if self.stack:  # A nested part is hashed by reference in its parent
+                    self.stack[-1][0].update(self.contenthash.reference(guid))
+                self.stack.append((hashlib.md5(), guid, self.parser.CurrentByteIndex, self.depth))
+            self.stack[-1][0].update(self.contenthash.start(tag, attrib))
+
+    def endElement(self, name):
+        self.flushText()
+        if self.stack:
+            md5, guid, offset, depth = self.stack[-1]
+            md5.update(b'E\0')
+            if depth == self.depth:
+                self.stack.pop()
+                self.records.append((guid, md5.hexdigest(), offset))
+                self.parts = self.parts + 1
+                if len(self.records) >= self.runsize:
+                    self.spill()
+        self.depth = self.depth - 1
+
+    # Write the current records sorted by guid to a new run file
+    def spill(self):
+        if len(self.records) == 0:
+            return
+        self.records.sort(key=lambda record: record[0])
+        run = self.tmpdir / '{}.{}.run'.format(self.file.name, len(self.runs))
+        with open(run, 'w') as fd:
+            for guid, fp, offset in self.records:
+                fd.write('{}\t{}\t{}\n'.format(guid, fp, offset))
+        self.runs.append(run)
+        self.records = []
+
+    def readRun(self, run: Path):
+        with open(run) as fd:
+            for line in fd:
+                guid, fp, offset = line.rstrip('\n').split('\t')
+                yield guid, fp, int(offset)
+
+    # All records merged in guid order. Only the first part of a duplicate guid is kept
+    def sortedRecords(self):
+        previous = None
+        for record in heapq.merge(*[self.readRun(run) for run in self.runs], key=lambda record: record[0]):
+            if record[0] != previous:
+                previous = record[0]
+                yield record
+
+    # Parse the part starting at the byte offset
+    def fetch(self, offset: int):
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        declarations = ''
+        for prefix, uri in self.namespaces.items():
+            declarations = declarations + ' xmlns{}="{}"'.format(':' + prefix if prefix else '', uri)
+        parser.feed('<fetch{}>'.format(declarations).encode())
+        depth = 0
+        with open(self.file, 'rb') as fd:
+            fd.seek(offset)
+            for chunk in iter(lambda: fd.read(65536), b''):
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    if event == 'start':
+                        depth = depth + 1
+                    else:
+                        depth = depth - 1
+                        if depth == 1:
+                            return element
+        return None
+
+
+# Compares two OCX files in bounded memory without importing the models.
+# Both files are streamed to sorted fingerprint runs which are merge-joined on the guid.
+# The new, deleted and modified parts are kept as guids with byte offsets and parsed on request.
+# writeReport() lists the changed parts in the output file, parsing one part at a time
+class StreamDiff(OCXDiff):
+    def __init__(self, ocx1: str, ocx2: str, schema: str, outputfile: str, log=False, runsize=200000):
+        super().__init__(ocx1, ocx2, schema, outputfile, log)
+        self.runsize = runsize
+        self.dict = OCXParser.OCXschema(self.schema.resolve()).dict
+        self.newpart = {}  # The revision offset with the guid as key
+        self.deletedpart = {}  # The baseline offset with the guid as key
+        self.modifiedpart = {}  # The tuple (baseline offset, revision offset) with the guid as key
+        self.same = 0
+
+    def compare(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.baseline = StreamFingerPrint(self.path1, self.dict, tmpdir, self.runsize)
+            self.revision = StreamFingerPrint(self.path2, self.dict, tmpdir, self.runsize)
+            self.baseline.parse()
+            self.revision.parse()
+            self.phase('Stream fingerprints')
+            self.join(self.baseline.sortedRecords(), self.revision.sortedRecords())
+            self.phase('Merge join')
+        print('')
+        print('Model differences')
+        print('-----------------')
+        print('Deleted parts        : ', len(self.deletedpart))
+        print('New parts            : ', len(self.newpart))
+        print('Modified parts       : ', len(self.modifiedpart))
+        print('Unchanged parts      : ', self.same)
+        print('')
+
+    # Merge-join of two record streams sorted by guid
+    def join(self, baseline, revision):
+        end = (None, None, None)
+        old = next(baseline, end)
+        new = next(revision, end)
+        while old[0] is not None or new[0] is not None:
+            if new[0] is None or (old[0] is not None and old[0] < new[0]):
+                self.deletedpart[old[0]] = old[2]
+                old = next(baseline, end)
+            elif old[0] is None or new[0] < old[0]:
+                self.newpart[new[0]] = new[2]
+                new = next(revision, end)
+            else:
+                if old[1] != new[1]:
+                    self.modifiedpart[new[0]] = (old[2], new[2])
+                else:
+                    self.same = self.same + 1
+                old = next(baseline, end)
+                new = next(revision, end)
+
+    def deletedParts(self) -> dict:
+        return self.deletedpart
+
+    def newParts(self) -> dict:
+        return self.newpart
+
+    def modifiedParts(self) -> dict:
+        return self.modifiedpart
+
+    # Write a tab separated line (change, type, name, guid) for each deleted, new and modified part
+    def writeReport(self):
+        changes = [('Deleted', self.deletedpart, self.baseline),
+                   ('New', self.newpart, self.revision),
+                   ('Modified', {guid: offsets[1] for guid, offsets in self.modifiedpart.items()}, self.revision)]
+        lines = 0
+        with open(self.out, 'w') as fd:
+            fd.write('Change\tType\tName\tGUID\n')
+            for change, parts, stream in changes:
+                for guid, offset in parts.items():
+                    part = stream.fetch(offset)
+                    type = '' if part is None else part.tag.rsplit('}', 1)[-1]
+                    name = '' if part is None else part.get('name', '')
+                    fd.write('{}\t{}\t{}\t{}\n'.format(change, type, name, guid))
+                    lines = lines + 1
+        self.phase('Write report')
+        print('Wrote {} changed parts to {}'.format(lines, self.out))
+
+    # The baseline and revision versions of a modified part
+    def modifiedPart(self, guid: str) -> tuple:
+        old, new = self.modifiedpart[guid]
+        return self.baseline.fetch(old), self.revision.fetch(new)
 
-    def panelFingerPrint(self):
-        # The Panel fingerprint is an md5 checksum of the Panel children guids
+    def newPart(self, guid: str):
+        return self.revision.fetch(self.newpart[guid])
 
+    def deletedPart(self, guid: str):
+        return self.baseline.fetch(self.deletedpart[guid])
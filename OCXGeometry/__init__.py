@@ -4,6 +4,7 @@
 #  are permitted in any medium without royalty provided the copyright
 #  notice and this notice are preserved.  This file is offered as-is,
 #  without any warranty.
+import hashlib
 import os
 import pathlib
 from pathlib import Path
@@ -19,7 +20,7 @@ from OCC.Core.TDataStd import TDataStd_Name
 from OCC.Core.TDocStd import TDocStd_Document
 from OCC.Core.TopAbs import TopAbs_EDGE
 from OCC.Core.TopExp import TopExp_Explorer
-from OCC.Core.TopoDS import TopoDS_Solid, TopoDS_Face, TopoDS_Shape, TopoDS_Wire, TopoDS_Compound
+from OCC.Core.TopoDS import TopoDS_Solid, TopoDS_Face, TopoDS_Shape, TopoDS_Wire, TopoDS_Compound, TopoDS_Edge
 from OCC.Core.gp import gp_Vec
 from OCC.Extend.DataExchange import read_iges_file, read_step_file
 from OCC.Core.XCAFDoc import (XCAFDoc_DocumentTool_ShapeTool,
@@ -61,6 +62,8 @@ class OCXGeometry(GeometryBase):
 
     def createGeometry(self, solid=False):
         # Loop over all brackets and create a Brep body if solid=True, else return the face
+        # The curve edges are only shared between the parts of this build
+        OCCWrapper.curvecache.clear()
         shapes = []
         for br in self.model.brackets:
             OCXCommon.LogMessage(br, self.logging)
@@ -82,6 +85,8 @@ class OCXGeometry(GeometryBase):
                 else:
                     shapes.append((mkgeom.face))
         # TODO: Create stiffeners geometry
+        if self.logging:
+            OCCWrapper.curvecache.printStatistics()
         return shapes
 
     def createPartGeometry(self, guid, solid=False):
@@ -131,10 +136,17 @@ class OCXGeometry(GeometryBase):
                 shapes.append(extg.Shape())
         return shapes
 
-    def externalGeometryAssembly(self):
+    # The geometric tolerance in the length unit of the model given the precision in metres
+    def modelTolerance(self, precision=1e-4) -> float:
+        return unitTolerance(self.model.root, self.dict, precision)
+
+    def externalGeometryAssembly(self, tolerance=None):
         # Create a TDoc holding the assembly of structure parts with external geometry. When assembled, write the STEP file
+        # Identical part geometry is stored once as a prototype and placed in the assembly as located instances
+        # The default tolerance for identical geometry is 0.1 mm expressed in the model units
+        if tolerance is None:
+            tolerance = self.modelTolerance()
         # Initialize the  writer
-        shapes = []
         step_writer = STEPCAFControl_Writer()
         step_writer.SetNameMode(True)
         step_writer.SetPropsMode(True)
@@ -146,90 +158,59 @@ class OCXGeometry(GeometryBase):
         l_colors = XCAFDoc_DocumentTool_ColorTool(doc.Main())
         l_layers = XCAFDoc_DocumentTool_LayerTool(doc.Main())
         l_materials = XCAFDoc_DocumentTool_MaterialTool(doc.Main())
-        aBuilder = BRep_Builder()
+        instances = ShapeInstances(shape_tool, tolerance, self.logging)
+        partition = OCXCommon.PanelPartition(self.model)
         # Loop over all Panels
-        panelchildren = []
         for panel in self.model.panels:
             OCXCommon.LogMessage(panel, self.logging)
             guid = self.model.getGUID(panel)
             children = self.model.getPanelChildren(guid)
-            panelchildren = panelchildren + children
-            # Build the Panel compound
-            compound = TopoDS_Compound()
-            aBuilder.MakeCompound(compound)
-            label = shape_tool.AddShape(compound)
-            pname = panel.get('name')
-            tname = TDataStd_Name()
-            tname.Set(TCollection_ExtendedString(pname))
-            label.AddAttribute(tname)
+            # Build the Panel assembly
+            label = shape_tool.NewShape()
+            instances.labelName(label, panel.get('name'))
             for child in children:
                 object = self.model.getObject(child)
                 name = object.get('name')
                 extg = ExternalGeometry(self.model, object, self.dict, self.logging)  # Init the creator
                 extg.readExtGeometry()  # Read the Brep
                 if extg.IsDone():
-                    aBuilder.Add(compound, extg.Shape())
-                    tname = TDataStd_Name()
-                    label = shape_tool.AddShape(extg.Shape())
-                    tname.Set(TCollection_ExtendedString(name))
-                    label.AddAttribute(tname)
+                    instances.addInstance(label, extg.Shape(), name)
         # Root brackets
-        compound = TopoDS_Compound()
-        aBuilder.MakeCompound(compound)
-        label = shape_tool.AddShape(compound)
-        tname = TDataStd_Name()
-        tname.Set(TCollection_ExtendedString('Brackets'))
-        label.AddAttribute(tname)
+        label = shape_tool.NewShape()
+        instances.labelName(label, 'Brackets')
         for br in self.model.brackets:
             guid = self.model.getGUID(br)
             name = br.get('name')
-            if guid not in panelchildren:
+            if partition.isRoot(guid):
                 extg = ExternalGeometry(self.model, br, self.dict, self.logging)  # Init the creator
                 extg.readExtGeometry()  # Read the Brep
                 if extg.IsDone():
-                    aBuilder.Add(compound, extg.Shape())
-                    tname = TDataStd_Name()
-                    label = shape_tool.AddShape(extg.Shape())
-                    tname.Set(TCollection_ExtendedString(name))
-                    label.AddAttribute(tname)
+                    instances.addInstance(label, extg.Shape(), name)
         # Root plates
-        compound = TopoDS_Compound()
-        aBuilder.MakeCompound(compound)
-        label = shape_tool.AddShape(compound)
-        tname = TDataStd_Name()
-        tname.Set(TCollection_ExtendedString('Plates'))
-        label.AddAttribute(tname)
+        label = shape_tool.NewShape()
+        instances.labelName(label, 'Plates')
         for pl in self.model.plates:
             guid = self.model.getGUID(pl)
             name = pl.get('name')
-            if guid not in panelchildren:
+            if partition.isRoot(guid):
                 extg = ExternalGeometry(self.model, pl, self.dict, self.logging)  # Init the creator
                 extg.readExtGeometry()  # Read the Brep
                 if extg.IsDone():
-                    aBuilder.Add(compound, extg.Shape())
-                    tname = TDataStd_Name()
-                    label = shape_tool.AddShape(extg.Shape())
-                    tname.Set(TCollection_ExtendedString(name))
-                    label.AddAttribute(tname)
+                    instances.addInstance(label, extg.Shape(), name)
         # Root pillars
-        compound = TopoDS_Compound()
-        aBuilder.MakeCompound(compound)
-        label = shape_tool.AddShape(compound)
-        tname = TDataStd_Name()
-        tname.Set(TCollection_ExtendedString('Pillars'))
-        label.AddAttribute(tname)
+        label = shape_tool.NewShape()
+        instances.labelName(label, 'Pillars')
         for pil in self.model.pillars:
             guid = self.model.getGUID(pil)
             name = pil.get('name')
-            if guid not in panelchildren:
+            if partition.isRoot(guid):
                 extg = ExternalGeometry(self.model, pil, self.dict, self.logging)  # Init the creator
                 extg.readExtGeometry()  # Read the Brep
                 if extg.IsDone():
-                    aBuilder.Add(compound, extg.Shape())
-                    tname = TDataStd_Name()
-                    label = shape_tool.AddShape(extg.Shape())
-                    tname.Set(TCollection_ExtendedString(name))
-                    label.AddAttribute(tname)
+                    instances.addInstance(label, extg.Shape(), name)
+        shape_tool.UpdateAssemblies()
+        if self.logging:
+            instances.printStatistics()
         step_writer.Perform(doc, TCollection_AsciiString(self.model.ocxfile.stem + '.stp'))
         return
 
@@ -246,6 +227,88 @@ class OCXGeometry(GeometryBase):
                 shape = extg.Shape()
         return shape
 
+# The precision in metres expressed in the length unit of the first point below the element
+def unitTolerance(element, dict: dict, precision: float) -> float:
+    scale = None
+    point = element.find('.//' + dict['point3d'])
+    if point is not None:
+        for coordinate in point:
+            scale = OCXCommon.OCXUnit().lengthScale(coordinate.get('unit'))
+            break
+    if scale is None:
+        scale = 0.001  # Assume millimetres if the model does not declare a known length unit
+    return precision / scale
+
+
+# The canonical local frame of a point cloud: origin in the centroid and axes along the principal directions.
+# Points expressed in the frame are quantized by the tolerance and hashed together with the topology signature
+# of the shape, so parts with identical geometry get the same key independent of their position and orientation
+# in the model.
+class CanonicalFrame:
+    def __init__(self, points: numpy.array, tolerance: float, signature=''):
+        self.origin = points.mean(axis=0)
+        centered = points - self.origin
+        w, v = numpy.linalg.eigh(centered.T @ centered)
+        axes = v[:, numpy.argsort(w)[::-1]]  # Principal axes, largest spread first
+        local = centered @ axes
+        # Resolve the sign ambiguity of the principal axes by the skewness of the points
+        for i in range(2):
+            if numpy.sum(local[:, i] ** 3) < 0:
+                axes[:, i] = -axes[:, i]
+        axes[:, 2] = numpy.cross(axes[:, 0], axes[:, 1])  # Keep the frame right-handed
+        self.axes = axes
+        local = centered @ axes
+        q = numpy.unique(numpy.round(local / tolerance).astype(numpy.int64), axis=0)
+        md5 = hashlib.md5(signature.encode())
+        md5.update(q.tobytes())
+        self.key = md5.hexdigest()
+
+    def Key(self) -> str:
+        return self.key
+
+    def xAxis(self) -> numpy.array:
+        return self.axes[:, 0]
+
+    def zAxis(self) -> numpy.array:
+        return self.axes[:, 2]
+
+
+# Adds part shapes to an XCAF assembly as located instances of shared prototypes
+class ShapeInstances:
+    def __init__(self, shape_tool, tolerance: float, log=False):
+        self.shape_tool = shape_tool
+        self.tolerance = tolerance
+        self.logging = log
+        self.prototypes = {}  # Prototype label with the canonical geometry key as key
+        self.instances = 0
+
+    def addInstance(self, parent: TDF_Label, shape: TopoDS_Shape, name: str) -> TDF_Label:
+        shapepoints = OCCWrapper.OccShapePoints(shape)
+        frame = CanonicalFrame(shapepoints.Value(), self.tolerance, shapepoints.Signature())
+        occframe = OCCWrapper.OccFrame(frame.origin, frame.xAxis(), frame.zAxis())
+        key = frame.Key()
+        if key not in self.prototypes:
+            # First occurrence: store the geometry once, expressed in its local frame
+            prototype = self.shape_tool.AddShape(occframe.toLocal(shape), False)
+            self.labelName(prototype, name)
+            self.prototypes[key] = prototype
+        elif self.logging:
+            print('Part {} is an instance of {}'.format(name, key))
+        label = self.shape_tool.AddComponent(parent, self.prototypes[key], occframe.Location())
+        self.labelName(label, name)
+        self.instances = self.instances + 1
+        return label
+
+    def labelName(self, label: TDF_Label, name: str):
+        tname = TDataStd_Name()
+        tname.Set(TCollection_ExtendedString(name))
+        label.AddAttribute(tname)
+
+    def printStatistics(self):
+        print('Number of part instances : ', self.instances)
+        print('Number of unique shapes  : ', len(self.prototypes))
+
+
 class CreateShape(GeometryBase):
     def __init__(self, model, object, dict, solid: bool,log: bool):
         super().__init__()
@@ -446,19 +509,22 @@ class CircumCircle(GeometryBase):
 
 # Return the OuterContour as a closed wire
 class OuterContour(GeometryBase):
-    def __init__(self, object, dict, log=False):
+    def __init__(self, object, dict, log=False, tolerance=None):
         super().__init__()
         self.dict = dict
         self.object = object
         self.wire = TopoDS_Wire
         self.logging = log
         self.npoints = 100
+        # End points closer than the tolerance are connected. The default is 0.001 mm in the contour units
+        self.tolerance = tolerance if tolerance is not None else unitTolerance(object, dict, 1e-6)
 
     def countourAsWire(self) -> TopoDS_Wire:
         # OuterContour
         outercontour = self.object.find(self.dict['outercontour'])
         children = outercontour.findall('*')  # Retrieve all children
-        edges = []
+        # The open curves are ordered and connected before the wire is built
+        assembly = ContourAssembly(self.object, self.dict, self.tolerance, self.logging)
         for child in children:
             # if child.tag == self.dict['ellipse3d']:
             # edge = self.ellipse(child)
@@ -476,31 +542,12 @@ class OuterContour(GeometryBase):
                 if closed.IsDone():
                     self.wire = closed.Value()
                     self.done = True
-            elif child.tag == self.dict['circumarc3d']:
-                edge = CircumArc(child, self.dict)
-                if edge.IsDone():
-                    edges.append(edge.Value())
-            elif child.tag == self.dict['line3d']:
-                edge = Line3D(child, self.dict)
-                if edge.IsDone():
-                    edges.append(edge.Value())
-            elif child.tag == self.dict['compositecurve3d']:
-                composite = CompositeCurve(child, self.dict, self.logging)
-                edges.append(composite.countourAsEdges())
-
-            # elif child.tag == self.dict['polyline3d']:
-            # edge = self.polyline(child)
-
-            elif child.tag == self.dict['nurbs3d']:
-                edge = NURBS(child, self.dict)
-                if edge.done:
-                    edges.append(edge.Value())
             else:
-                print('OuterContour: Unknown child ', child.tag)
-        if len(edges) > 0:
-            mkwire = OCCWrapper.OccWire(edges)
-            if mkwire.IsDone():
-                self.wire = mkwire.Wire()
+                assembly.addCurve(child)
+        if assembly.size() > 0:
+            wire = assembly.Wire()
+            if assembly.IsDone():
+                self.wire = wire
                 self.done = True
         #            else:
         #                BrepError(self.object, mkwire)
@@ -509,19 +556,201 @@ class OuterContour(GeometryBase):
     def curveResolution(self, res: int):
         self.npoints = res
 
+    def connectionTolerance(self, tol: float):
+        self.tolerance = tol
+
+    # The contour sampled at curveResolution() points on each edge as one (n,3) array
     def contourAsPoints(self) -> numpy.array:
-        # Create the wire
+        return numpy.concatenate([numpy.zeros((0, 3))] + self.contourAsPolylines())
+
+    # The contour sampled as a list of (npoints,3) arrays, one for each edge
+    def contourAsPolylines(self) -> list:
         wire = self.countourAsWire()
-        pts = []
-        if self.done:
-            # Loop over the wire to get the edges
-            edge_explorer = TopExp_Explorer(wire, TopAbs_EDGE)
-            while edge_explorer.More():
-                edge = OCC.Core.TopoDS.topods_Edge(edge_explorer.Current())
-                curve = edge.Value()
-                # TODO: Get the coordinates from the edge curve
-                edge_explorer.Next()
-        return pts
+        if not self.done:
+            return []
+        return OCCWrapper.OccEdgePoints(wire, self.npoints).Edges()
+
+
+# Orders the open curves of a contour into a connected chain before the wire is built.
+# Curve end points closer than the tolerance are snapped to a common node found by a spatial hash
+# on the quantized coordinates, so ordering is linear in the number of segments.
+# Line segments are created from the snapped nodes and therefore always connect. Runs of consecutive
+# line segments are built as one polygon.
+# Used for the open curves of OuterContour, InnerContours and CompositeCurve, so no contour builds its
+# Line3D segments one edge at a time.
+class ContourAssembly(GeometryBase):
+    def __init__(self, object, dict, tolerance: float, log=False):
+        super().__init__()
+        self.object = object  # The owner of the contour, used for reporting
+        self.dict = dict
+        self.tolerance = tolerance
+        self.logging = log
+        self.lines = []  # Tuples of (start, end) for the line segments
+        self.curves = []  # Tuples of (edge, start, end) for curve segments
+        self.cells = {}  # Node indices with the quantized position as key
+        self.nodes = []  # The snapped node positions
+        self.gaps = []  # Gap distances found when ordering
+        self.wire = TopoDS_Wire
+
+    def size(self) -> int:
+        return len(self.lines) + len(self.curves)
+
+    def addCurve(self, child):
+        if child.tag == self.dict['line3d']:
+            line = Line3D(child, self.dict, False)
+            self.lines.append((line.StartPoint(), line.EndPoint()))
+        elif child.tag == self.dict['polyline3d']:
+            polyline = PolyLine3D(child, self.dict)
+            points = polyline.Points()
+            for i in range(len(points) - 1):
+                self.lines.append((points[i], points[i + 1]))
+        elif child.tag == self.dict['circumarc3d']:
+            edge = CircumArc(child, self.dict)
+            if edge.IsDone():
+                self.addEdge(edge.Value())
+        elif child.tag == self.dict['nurbs3d']:
+            edge = NURBS(child, self.dict)
+            if edge.IsDone():
+                self.addEdge(edge.Value())
+        elif child.tag == self.dict['compositecurve3d']:
+            for curve in child.findall('*'):
+                self.addCurve(curve)
+        else:
+            print('ContourAssembly: Unknown child ', child.tag)
+
+    def addEdge(self, edge: TopoDS_Edge):
+        ends = OCCWrapper.OccEdgeEnds(edge)
+        self.curves.append((edge, ends.StartPoint(), ends.EndPoint()))
+
+    # Return the index of the node within the tolerance of p. A new node is created if none is found
+    def node(self, p: numpy.array) -> int:
+        cell = numpy.floor(p / self.tolerance).astype(int)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    key = (cell[0] + dx, cell[1] + dy, cell[2] + dz)
+                    for n in self.cells.get(key, []):
+                        if numpy.linalg.norm(self.nodes[n] - p) <= self.tolerance:
+                            return n
+        n = len(self.nodes)
+        self.nodes.append(p)
+        self.cells.setdefault((cell[0], cell[1], cell[2]), []).append(n)
+        return n
+
+    # Returns the segments in chain order as a list of tuples (segment, start node, end node).
+    # The list is empty if all segments are degenerate
+    def order(self) -> list:
+        segments = []
+        # Curve end points are merged first so the lines are stretched to the exact curve ends
+        for edge, p1, p2 in self.curves:
+            n1 = self.node(p1)
+            n2 = self.node(p2)
+            segments.append((self.snap(edge, p1, p2, n1, n2), n1, n2))
+        for p1, p2 in self.lines:
+            n1 = self.node(p1)
+            n2 = self.node(p2)
+            if n1 != n2:  # Skip degenerate lines
+                segments.append((None, n1, n2))
+        if len(segments) == 0:
+            return []
+        adjacent = {}
+        for i, (edge, n1, n2) in enumerate(segments):
+            adjacent.setdefault(n1, []).append(i)
+            adjacent.setdefault(n2, []).append(i)
+        # Start an open chain in one of its loose ends
+        start = segments[0][1]
+        for n in adjacent:
+            if len(adjacent[n]) % 2 == 1:
+                start = n
+                break
+        used = [False] * len(segments)
+        chain = []
+        current = start
+        for k in range(len(segments)):
+            segment = None
+            for i in adjacent[current]:
+                if not used[i]:
+                    segment = i
+                    break
+            if segment is None:
+                # Disconnected: continue from the closest unused segment end
+                segment, current, distance = self.closest(segments, used, current)
+                self.gaps.append(distance)
+            edge, n1, n2 = segments[segment]
+            used[segment] = True
+            if n1 == current:
+                chain.append((edge, n1, n2))
+                current = n2
+            else:
+                chain.append((edge, n2, n1))
+                current = n1
+        if current != start:
+            self.gaps.append(numpy.linalg.norm(self.nodes[current] - self.nodes[start]))
+        return chain
+
+    # Move the curve ends merged with the end of another curve to the node
+    def snap(self, edge: TopoDS_Edge, p1: numpy.array, p2: numpy.array, n1: int, n2: int) -> TopoDS_Edge:
+        if numpy.array_equal(self.nodes[n1], p1) and numpy.array_equal(self.nodes[n2], p2):
+            return edge
+        snapped = OCCWrapper.OccSnappedEdge(edge, self.nodes[n1], self.nodes[n2], self.tolerance)
+        if snapped.IsDone():
+            return snapped.Value()
+        OCXCommon.Message(self.object, 'could not snap a curve to the contour end points')
+        return edge
+
+    def closest(self, segments: list, used: list, node: int):
+        best = (None, None, numpy.inf)
+        for i, (edge, n1, n2) in enumerate(segments):
+            if not used[i]:
+                for n in (n1, n2):
+                    d = numpy.linalg.norm(self.nodes[n] - self.nodes[node])
+                    if d < best[2]:
+                        best = (i, n, d)
+        return best
+
+    def Wire(self) -> TopoDS_Wire:
+        chain = self.order()
+        if len(chain) == 0:
+            OCXCommon.Message(self.object, 'contour has only degenerate segments')
+            return self.wire
+        if len(self.gaps) > 0:
+            OCXCommon.Message(self.object, 'contour has {} gap(s), the largest is {:.6f}'
+                              .format(len(self.gaps), max(self.gaps)))
+        # Collect the runs of connected lines as point arrays
+        edges = []
+        run = []
+        for edge, n1, n2 in chain:
+            if edge is None:
+                if len(run) == 0 or run[-1] != n1:
+                    self.addPolygon(edges, run)
+                    run = [n1]
+                run.append(n2)
+            else:
+                self.addPolygon(edges, run)
+                run = []
+                edges.append(edge)
+        if len(edges) == 0 and len(run) > 2 and run[0] == run[-1]:
+            # The contour is a single closed polygon
+            mkpolygon = OCCWrapper.OccPolygon([self.nodes[n] for n in run[:-1]], True)
+            if mkpolygon.IsDone():
+                self.wire = mkpolygon.Wire()
+                self.done = True
+            return self.wire
+        self.addPolygon(edges, run)
+        mkwire = OCCWrapper.OccWire(edges)
+        if mkwire.IsDone():
+            self.wire = mkwire.Wire()
+            self.done = True
+        return self.wire
+
+    def addPolygon(self, edges: list, run: list):
+        if len(run) > 1:
+            mkpolygon = OCCWrapper.OccPolygon([self.nodes[n] for n in run])
+            if mkpolygon.IsDone():
+                edges.append(mkpolygon.Wire())
+
+    def Gaps(self) -> list:
+        return self.gaps
 
 
 class Point3D:
@@ -558,26 +787,60 @@ class Vector3D:
 
 
 class Line3D(GeometryBase):
-    def __init__(self, line, dict):
+    def __init__(self, line, dict, edge=True):
         super().__init__()
         #
         # Function to construct an edge from the coordinates from 'Line3D'
         # RETURNS:   The (x,y,z) of StartPoint and EndPoint
+        # If edge=False only the end points are retrieved
         #
+        self.edge = None
         startpoint = line.find(dict['startpoint'])
         pt3d = Point3D(startpoint, dict)
-        p1 = pt3d.GetPoint()
+        self.p1 = pt3d.GetPoint()
         endpoint = line.find(dict['endpoint'])
         pt3d = Point3D(endpoint, dict)
-        p2 = pt3d.GetPoint()
-        edge = OCCWrapper.OccEdge(p1, p2)
-        if edge.IsDone():
-            self.done = True
-            self.edge = edge.Value()
+        self.p2 = pt3d.GetPoint()
+        if edge:
+            mkedge = OCCWrapper.OccEdge(self.p1, self.p2)
+            if mkedge.IsDone():
+                self.done = True
+                self.edge = mkedge.Value()
 
     def Value(self):
         return self.edge
 
+    def StartPoint(self) -> numpy.array:
+        return self.p1
+
+    def EndPoint(self) -> numpy.array:
+        return self.p2
+
+
+class PolyLine3D(GeometryBase):
+    def __init__(self, polyline, dict):
+        super().__init__()
+        #
+        # Function to retrieve the points of a 'PolyLine3D'
+        # RETURNS:   A polygonal wire through the points
+        #
+        self.wire = None
+        self.points = []
+        for pt in polyline.findall(dict['point3d']):
+            p = Point3D(pt, dict)
+            self.points.append(p.GetPoint())
+
+    def Points(self) -> list:
+        return self.points
+
+    def Value(self) -> TopoDS_Wire:
+        if self.wire is None:
+            mkpolygon = OCCWrapper.OccPolygon(self.points)
+            if mkpolygon.IsDone():
+                self.done = True
+                self.wire = mkpolygon.Wire()
+        return self.wire
+
 
 class ExternalGeometry(GeometryBase):
     def __init__(self, model, object, dict, log=False):
@@ -668,16 +931,20 @@ class CircumArc(GeometryBase):
         return cs(xs)
 
 
+# The curves of a CompositeCurve3D. Closed circles are returned as they are, the open curves are ordered
+# and connected by a ContourAssembly and returned as one wire
 class CompositeCurve:
-    def __init__(self, object, dict, log=False):
+    def __init__(self, object, dict, log=False, tolerance=None):
         self.dict = dict
         self.object = object
         self.edges = []
         self.logging = log
+        self.tolerance = tolerance if tolerance is not None else unitTolerance(object, dict, 1e-6)
 
     def countourAsEdges(self):
         # CompositeCurve
         children = self.object.findall('*')  # Retrieve all children
+        assembly = ContourAssembly(self.object, self.dict, self.tolerance, self.logging)
         for child in children:
             tag = child.tag
             id = child.get('id')
@@ -695,40 +962,29 @@ class CompositeCurve:
                 closed = Circle(child, self.dict)
                 if closed.IsDone():
                     self.edges.append(closed.Value())
-
-            elif child.tag == self.dict['circumarc3d']:
-                edge = CircumArc(child, self.dict)
-                if edge.IsDone():
-                    self.edges.append(edge.Value())
-
-            elif child.tag == self.dict['line3d']:
-                edge = Line3D(child, self.dict)
-                if edge.IsDone():
-                    self.edges.append(edge.Value())
-
-            # elif child.tag == self.dict['polyline3d']:
-            # edge = self.polyline(child)
-
-            elif child.tag == self.dict['nurbs3d']:
-                edge = NURBS(child, self.dict)
-                if edge.done:
-                    self.edges.append(edge.Value())
             else:
-                print('CompositeCurve: Unknown child ', child.tag)
+                assembly.addCurve(child)
+        if assembly.size() > 0:
+            wire = assembly.Wire()
+            if assembly.IsDone():
+                self.edges.append(wire)
         return self.edges
 
 # Ther can be several closed inner contours, treat differently than OuterContour
+# Each circle and CompositeCurve3D is a closed contour of its own. The remaining open curves are ordered
+# and connected by a ContourAssembly into one closed contour
 class InnerContours:
-    def __init__(self, parentface, contour, dictionary: dict, log=True):
+    def __init__(self, parentface, contour, dictionary: dict, log=True, tolerance=None):
         self.closed = False
         self.contour = contour
         self.face = parentface  # The parent face to be cut
-        self.edges = []
         self.dict = dictionary
         self.logging = log
+        self.tolerance = tolerance if tolerance is not None else unitTolerance(contour, dictionary, 1e-6)
 
     def cutOut(self):  # Returns the parent face cut by all inner contours
         children = self.contour.findall('*')  # Retrieve all children contours
+        assembly = ContourAssembly(self.contour, self.dict, self.tolerance, self.logging)
         for child in children:
             tag = child.tag
             id = child.get('id')
@@ -741,39 +997,23 @@ class InnerContours:
                 closed = CircumCircle(child, self.dict)
                 if closed.IsDone():
                     # Cut out a hole
-                    self.face = self.cutFace(self.face, closed.Value())
+                    self.face = self.cutFace(self.face, [closed.Value()])
             elif child.tag == self.dict['circle3d']:  # A closed contour
                 closed = Circle(child, self.dict)
                 if closed.IsDone():
                     # Cut out a hole
-                    self.face = self.cutFace(self.face, closed.Value())
-
-            elif child.tag == self.dict['circumarc3d']:
-                edge = CircumArc(child, self.dict)
-                if edge.done:
-                    self.edges.append(edge.Value())
-
-            elif child.tag == self.dict['line3d']:
-                edge = Line3D(child, self.dict)
-                if edge.done:
-                    self.edges.append(edge.Value())
-            # TODO: Check for closed contour
-            elif child.tag == self.dict['compositecurve3d']:
-                composite = CompositeCurve(child, self.dict)
-                self.edges.append(composite.countourAsEdges())
-
-            # elif child.tag == self.dict['polyline3d']:
-            # edge = self.polyline(child)
-            # TODO: A nurbs may also be closed?
-            elif child.tag == self.dict['nurbs3d']:
-                edge = NURBS(child, self.dict)
-                if edge.done:
-                    self.edges.append(edge.Value())
+                    self.face = self.cutFace(self.face, [closed.Value()])
+            elif child.tag == self.dict['compositecurve3d']:  # A closed contour
+                composite = CompositeCurve(child, self.dict, self.logging, self.tolerance)
+                self.face = self.cutFace(self.face, composite.countourAsEdges())
             else:
-                print('InnerContour: Unknown child ', child.tag)
-            # Cut the remaining openings from the set of edges forming a closed contour
-            self.face = self.cutFace(self.face, self.edges)
-            return self.face
+                assembly.addCurve(child)
+        # Cut the remaining opening from the open curves forming a closed contour
+        if assembly.size() > 0:
+            wire = assembly.Wire()
+            if assembly.IsDone():
+                self.face = self.cutFace(self.face, [wire])
+        return self.face
 
     def cutFace(self, face, contour):
         wire = OCCWrapper.OccWire(contour)
@@ -5,14 +5,116 @@
 #  notice and this notice are preserved.  This file is offered as-is,
 #  without any warranty.
 
+import hashlib
 import json
+import multiprocessing
+import numpy
+import pickle
 import uuid
 import re
+from pathlib import Path
 from bidict import bidict
 
-from OCXCommon import StructurePart, LogMessage, Material, ConnectionConfiguration, BarSection
+from OCXCommon import StructurePart, LogMessage, Message, Material, ConnectionConfiguration, BarSection, UniqueNames, \
+    PanelPartition, ContentHash, OCXUnit
 from OCXParser import Panel, OCXmodel, Plate, Bracket, Stiffener
 
+# Namespace of the name based (deterministic) value and property ids
+PROPERTY_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/ocastrup/OCX/properties')
+# Layout version of the <output>.parts records
+PARTS_FORMAT = 2
+
+
+# The fingerprint of a part for the incremental output: the hash of the part content and of the definitions
+# it refers to (Material, Section, ...), so a changed material also changes the parts using it.
+# The hash of each definition is computed once. Nested parts of a definition only contribute their guid
+class PartFingerPrint:
+    parttypes = ['panel', 'plate', 'stiffener', 'bracket', 'pillar']
+
+    def __init__(self, ocxmodel: OCXmodel):
+        dict = ocxmodel.dict
+        self.index = ocxmodel.getReferenceIndex()
+        self.contenthash = ContentHash(dict['guidref'], reftype=dict.get('reftype', 'refType'))
+        self.definitionhash = ContentHash(dict['guidref'], [dict[type] for type in PartFingerPrint.parttypes])
+        self.definitions = {}  # The hash of the referenced definition with the guid as key
+
+    def definition(self, guid: str):
+        if guid not in self.definitions:
+            element = self.index.getDefinition(guid)
+            self.definitions[guid] = None if element is None else self.definitionhash.hexdigest(element)
+        return self.definitions[guid]
+
+    def hexdigest(self, part) -> str:
+        return self.contenthash.hexdigestReferences(part, self.definition)
+
+
+# Serializes JSON documents. The fast encoder (orjson) is used if requested and installed.
+# orjson only indents by two spaces, its indentation is doubled to match the standard encoder
+class JSONEncoder:
+    def __init__(self, compact=False, fast=False):
+        self.compact = compact
+        self.orjson = None
+        if fast:
+            try:
+                import orjson
+                self.orjson = orjson
+            except ImportError:
+                print('orjson is not installed, using the standard json encoder')
+
+    def dumps(self, object) -> str:
+        if self.orjson is not None:
+            if self.compact:
+                return self.orjson.dumps(object).decode()
+            # The strings are escaped, so every line break in the output is followed by indentation only
+            text = self.orjson.dumps(object, option=self.orjson.OPT_INDENT_2).decode()
+            return re.sub(r'(?m)^( +)', r'\1\1', text)
+        if self.compact:
+            return json.dumps(object, separators=(',', ':'))
+        return json.dumps(object, indent=4)
+
+
+# Writes a properties document to file while the properties are generated.
+# The header entries are written when the writer is opened and each property as it is added,
+# so the properties of the whole model are never held in memory.
+class JSONStreamWriter:
+    def __init__(self, file: str, header: dict, encoder: JSONEncoder):
+        self.encoder = encoder
+        self.count = 0
+        if encoder.compact:
+            self.separator = ','
+            self.newline = ''
+        else:
+            self.separator = ',\n'
+            self.newline = '\n'
+        self.fd = open(file, 'w')
+        try:
+            self.fd.write('{' + self.newline)
+            for key in header:
+                self.fd.write(json.dumps(key) + ':' + self.encoder.dumps(header[key]) + self.separator)
+            self.fd.write('"properties":[' + self.newline)
+        except BaseException:
+            self.fd.close()
+            raise
+
+    def write(self, property: dict):
+        if self.count > 0:
+            self.fd.write(self.separator)
+        self.fd.write(self.encoder.dumps(property))
+        self.count = self.count + 1
+
+    def flush(self):
+        self.fd.flush()
+
+    def close(self):
+        try:
+            self.fd.write(self.newline + ']' + self.newline + '}' + self.newline)
+        finally:
+            self.fd.close()
+
+    # Close the file of an incomplete document
+    def abort(self):
+        self.fd.close()
+
 
 class JSONProperties:
     def __init__(self):
@@ -24,6 +126,19 @@ class JSONProperties:
         self.file = 'properties.json'
         self.lookuptable = bidict({'lookup': 'table'})
         self.attributedefinition = {}
+        self.encoder = JSONEncoder()
+        self.streaming = False
+        self.writer = None
+        self.propertylist = []
+        self.incremental = False
+        self.previousparts = {}  # (fingerprint, propertyIds) of the previous output with the part guid as key
+        self.previousproperties = {}  # The previous output properties with the propertyId as key
+        self.partrecords = {}
+        self.currentpart = None
+        self.recorded = None
+        self.reused = 0
+        self.unique = set()  # The unique keys of the added properties
+        self.fragment = None  # Properties collected by a worker process
 
     def getPropertyID(self, value):
         return self.lookuptable.inverse[value]
@@ -31,17 +146,226 @@ class JSONProperties:
     def getPropertyValue(self, id):
         return self.lookuptable[id]
 
+    # Compact output drops the indentation. A fast encoder is used if available
+    def jsonFormat(self, compact=False, fast=False):
+        self.encoder = JSONEncoder(compact, fast)
+
+    # Write the properties directly to the output file as they are generated
+    def streamJson(self, compact=False, fast=False):
+        self.streaming = True
+        self.jsonFormat(compact, fast)
+
+    def beginProperties(self):
+        if self.streaming:
+            header = dict(self.dict)
+            header.update(self.attributevalues)
+            self.writer = JSONStreamWriter(self.file, header, self.encoder)
+        else:
+            self.propertylist = []
+        self.unique = set()
+
+    # Only the first property with a given unique key is added.
+    # The properties generated for a part are recorded with their unique key, so a reused part replays them
+    # through the same de-duplication as a full run
+    def addProperty(self, property: dict, unique=None):
+        if self.recorded is not None:
+            self.recorded.append((property['propertyId'], unique))
+        if self.fragment is not None:  # Merged in order by the parent process
+            self.fragment.append((property, unique))
+            return
+        self.emitProperty(property, unique)
+
+    def emitProperty(self, property: dict, unique=None):
+        if unique is not None:
+            if unique in self.unique:
+                return
+            self.unique.add(unique)
+        if self.writer is not None:
+            self.writer.write(property)
+        else:
+            self.propertylist.append(property)
+
+    # Collect the properties generated by a worker process as a fragment
+    def beginFragment(self):
+        self.fragment = []
+        self.partrecords = {}
+        self.reused = 0
+
+    def endFragment(self) -> tuple:
+        fragment = (self.fragment, self.partrecords, self.reused)
+        self.fragment = None
+        return fragment
+
+    # Add the properties of a worker fragment in the order they were generated.
+    # The worker has already recorded them in its part records
+    def mergeFragment(self, fragment: list, partrecords: dict, reused: int):
+        for property, unique in fragment:
+            self.emitProperty(property, unique)
+        self.partrecords.update(partrecords)
+        self.reused = self.reused + reused
+
+    # Flush the streamed output before forking worker processes
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    # Close the streamed output if the generation failed before endProperties()
+    def abortProperties(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+
+    def endProperties(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        else:
+            self.properties['properties'] = self.propertylist
+            self.propertylist = []
+        if self.incremental:
+            self.savePartRecords()
+            print('{}: reused the properties of {} unchanged parts'.format(self.file, self.reused))
+
+    # Name based ids: the same part, property name and value always give the same id
+    def propertyId(self, guid, name: str, value) -> str:
+        return str(uuid.uuid5(PROPERTY_NAMESPACE, '{}/{}/{}'.format(guid, name, value)))
+
+    def valueId(self, value) -> str:
+        return str(uuid.uuid5(PROPERTY_NAMESPACE, '{}/{}'.format(type(self).__name__, value)))
+
+    # Only regenerate the properties of parts changed since the previous output file.
+    # The part fingerprints are kept in the file <output>.parts next to the output
+    def incrementalJson(self, incremental=True):
+        self.incremental = incremental
+
+    def valuesHash(self) -> str:
+        md5 = hashlib.md5(json.dumps(self.dict, sort_keys=True).encode())
+        md5.update(json.dumps(self.attributevalues, sort_keys=True).encode())
+        if self.map:
+            md5.update(str(self.entitymap.index.stamp).encode())
+        return md5.hexdigest()
+
+    def loadPartRecords(self):
+        self.previousparts = {}
+        self.previousproperties = {}
+        self.partrecords = {}
+        self.reused = 0
+        self.fingerprint = PartFingerPrint(self.model)
+        records = Path(self.file + '.parts')
+        if not records.is_file() or not Path(self.file).is_file():
+            return
+        with open(records) as fd:
+            previous = json.load(fd)
+        if previous.get('format') != PARTS_FORMAT or previous['values'] != self.valuesHash():
+            return  # The attribute values changed: regenerate everything
+        with open(self.file) as fd:
+            for property in json.load(fd)['properties']:
+                self.previousproperties[property['propertyId']] = property
+        self.previousparts = previous['parts']
+
+    def savePartRecords(self):
+        with open(self.file + '.parts', 'w') as fd:
+            json.dump({'format': PARTS_FORMAT, 'values': self.valuesHash(), 'parts': self.partrecords}, fd)
+        self.previousparts = {}
+        self.previousproperties = {}
+
+    # Emit the previous properties of an unchanged part and return True.
+    # Otherwise start recording the properties generated for the part until endPart()
+    def reusePart(self, part, fingerprint=None) -> bool:
+        if not self.incremental:
+            return False
+        guid = part.get(self.model.dict['guidref'])
+        if fingerprint is None:
+            fingerprint = self.fingerprint.hexdigest(part)
+        previous = self.previousparts.get(guid)
+        if previous is not None and previous[0] == fingerprint \
+                and all(id in self.previousproperties for id, unique in previous[1]):
+            for id, unique in previous[1]:
+                self.addProperty(self.previousproperties[id], unique)
+            self.partrecords[guid] = previous
+            self.reused = self.reused + 1
+            return True
+        self.currentpart = (guid, fingerprint)
+        self.recorded = []
+        return False
+
+    def endPart(self):
+        if self.currentpart is not None:
+            guid, fingerprint = self.currentpart
+            self.partrecords[guid] = (fingerprint, self.recorded)
+            self.currentpart = None
+            self.recorded = None
+
     def writeJson(self):
+        if self.streaming:  # Already written by endProperties()
+            return
         self.dict.update(self.attributevalues)
         self.dict.update(self.properties)
         with open(self.file, 'w') as json_file:
-            json.dump(self.dict, json_file, indent=4, sort_keys=False)
+            json_file.write(self.encoder.dumps(self.dict))
+        return
+
+    # The entity map may be given as a file name or as an already loaded EntitiesMap
+    def loadEntityMap(self, ocxmodel: OCXmodel, entitymap):
+        if isinstance(entitymap, EntitiesMap):
+            return entitymap
+        return EntitiesMap(ocxmodel, entitymap)
+
+    # The entity id of a part: the guid from the name map or the part guid
+    def entityId(self, name: str, part):
+        if self.map:
+            return self.entitymap.getEntityId(name)  # Use guid from name map
+        return part.getGuid()
+
+    def propertyEntry(self, name: str, guid: str, description: str, definition: str, valueid: str) -> dict:
+        property = {'name': name,
+                    'position': None,
+                    'entityRef': {
+                        'entityId': guid,
+                        'description': description
+                    },
+                    'propertyId': self.propertyId(guid, description + '/' + name, valueid),
+                    'attributes': [
+                        {
+                            'definitionName': definition,
+                            'valueId': valueid
+                        }
+                    ]
+                    }
+        return property
+
+    # Part visitors used by PropertyExporter. A generator overrides the visitors of the part types it uses
+    def begin(self, file: str):
+        self.file = file
+        if self.incremental:
+            self.loadPartRecords()
+        self.beginProperties()
+
+    def visitParts(self, parts: list, visitor, wrapper):
+        for part in parts:
+            if not self.reusePart(part):
+                if wrapper is None:
+                    visitor(part, None)
+                else:
+                    visitor(part, wrapper(self.model, part, self.model.dict, self.model.namespace))
+                self.endPart()
+
+    def visitPlate(self, part, plate: Plate):
+        return
+
+    def visitBracket(self, part, bracket: Bracket):
+        return
+
+    def visitStiffener(self, part, stiffener: Stiffener):
+        return
+
+    def visitPillar(self, part, pillar: Stiffener):
         return
 
     def addSingleAttributeValues(self, values):
         attributes = []
         for val in values:
-            guid = uuid.uuid1()
+            guid = self.valueId(val)
             # json fields
             attr = {'valueId': str(guid),
                     'value': val,
@@ -56,7 +380,7 @@ class JSONProperties:
         attributes = []
         for name in valuedict:
             # json fields
-            guid = uuid.uuid1()
+            guid = self.valueId(name)
             attr = {'valueId': str(guid),
                     'value': name,
                     'metaData': valuedict[name]}
@@ -95,20 +419,25 @@ class TrackChanges(JSONProperties):
         self.filterid = filter.filterid
         self.dict.update(self.attributedefinition)
 
+    # The tuple (type, name, clean guid) of a part element, or the cached tuple itself
+    def describe(self, part) -> tuple:
+        if isinstance(part, tuple):
+            return part
+        part = StructurePart(part, self.model.dict)
+        return part.getType(), part.getName(), part.getCleanGuid()
+
+    # The parts are given as elements or as the (type, name, clean guid) tuples of the baseline fingerprints
     def baselineChanges(self, deletedparts: dict, modifiedparts: dict, file: str):
         self.file = file
         # Set the property attributes
         values = ['Deleted', 'Modified']
         self.addSingleAttributeValues(values)
-        properties = []
+        self.beginProperties()
         # Find all deleted parts
         id = 0
         for deleted in deletedparts:
-            part = StructurePart(deletedparts[deleted], self.model.dict)
-            type = part.getType()
+            type, name, guid = self.describe(deletedparts[deleted])
             if type == 'Plate' or type == 'Stiffener' or type == 'Bracket':
-                name = part.getName()
-                guid = part.getCleanGuid()
                 gguid = guid.lower()
                 if gguid in self.filterid:
                     id = id + 1
@@ -119,7 +448,7 @@ class TrackChanges(JSONProperties):
                                     'entityId': gguid,
                                     'description': type + '_' + name
                                 },
-                                'propertyId': str(uuid.uuid1()),
+                                'propertyId': self.propertyId(gguid, type + '_' + name, propRef),
                                 'attributes': [
                                     {
                                         'definitionName': 'ModelChange',
@@ -127,14 +456,11 @@ class TrackChanges(JSONProperties):
                                     }
                                 ]
                                 }
-                    properties.append(property)
+                    self.addProperty(property)
         im = 0
         for mod in modifiedparts:
-            part = StructurePart(modifiedparts[mod], self.model.dict)
-            type = part.getType()
+            type, name, guid = self.describe(modifiedparts[mod])
             if type == 'Plate' or type == 'Stiffener' or type == 'Bracket':
-                name = part.getName()
-                guid = part.getCleanGuid()
                 gguid = guid.lower()
                 if gguid in self.filterid:
                     im = im + 1
@@ -145,7 +471,7 @@ class TrackChanges(JSONProperties):
                                     'entityId': gguid,
                                     'description': type + '_' + name
                                 },
-                                'propertyId': str(uuid.uuid1()),
+                                'propertyId': self.propertyId(gguid, type + '_' + name, propRef),
                                 'attributes': [
                                     {
                                         'definitionName': 'ModelChange',
@@ -153,8 +479,8 @@ class TrackChanges(JSONProperties):
                                     }
                                 ]
                                 }
-                    properties.append(property)
-        self.properties['properties'] = properties
+                    self.addProperty(property)
+        self.endProperties()
         print('Baseline: Deleted parts: {}'.format(id))
         print('Baseline: Modified or kept parts: {}'.format(im))
 
@@ -163,7 +489,7 @@ class TrackChanges(JSONProperties):
         # Set the property attributes
         values = ['New', 'Modified']
         self.addSingleAttributeValues(values)
-        properties = []
+        self.beginProperties()
         # Find all new parts
         id = 0
         for new in newparts:
@@ -182,7 +508,7 @@ class TrackChanges(JSONProperties):
                                     'entityId': gguid,
                                     'description': type + '_' + name
                                 },
-                                'propertyId': str(uuid.uuid1()),
+                                'propertyId': self.propertyId(gguid, type + '_' + name, propRef),
                                 'attributes': [
                                     {
                                         'definitionName': 'ModelChange',
@@ -190,7 +516,7 @@ class TrackChanges(JSONProperties):
                                     }
                                 ]
                                 }
-                    properties.append(property)
+                    self.addProperty(property)
         im = 0
         for mod in modifiedparts:
             part = StructurePart(modifiedparts[mod], self.model.dict)
@@ -208,7 +534,7 @@ class TrackChanges(JSONProperties):
                                     'entityId': gguid,
                                     'description': type + '_' + name
                                 },
-                                'propertyId': str(uuid.uuid1()),
+                                'propertyId': self.propertyId(gguid, type + '_' + name, propRef),
                                 'attributes': [
                                     {
                                         'definitionName': 'ModelChange',
@@ -216,8 +542,8 @@ class TrackChanges(JSONProperties):
                                     }
                                 ]
                                 }
-                    properties.append(property)
-        self.properties['properties'] = properties
+                    self.addProperty(property)
+        self.endProperties()
         print('Revision: New parts: {}'.format(id))
         print('Revision: Modified or kept parts: {}'.format(im))
 
@@ -238,15 +564,22 @@ class DryWeightChange(JSONProperties):
         self.filterid = filter.filterid
         self.dict.update(self.attributedefinition)
 
-    def reportChanges(self, newparts: dict, modifiedparts: dict, weightratio: dict, file: str):
+    # panelratio: tuples of (change label, panel) of the panels with a changed child weight roll-up
+    # with the clean lower case guid as key
+    def reportChanges(self, newparts: dict, modifiedparts: dict, weightratio: dict, file: str, panelratio=None):
         self.file = file
+        if panelratio is None:
+            panelratio = {}
         # Set the property attributes
         values = ['New', 'Modified']
         for w in weightratio:
             if weightratio[w] not in values:
                 values.append(weightratio[w])
+        for label, panel in panelratio.values():
+            if label not in values:
+                values.append(label)
         self.addSingleAttributeValues(sorted(values))
-        properties = []
+        self.beginProperties()
         # Find all deleted parts
         id = 0
         for new in newparts:
@@ -265,7 +598,7 @@ class DryWeightChange(JSONProperties):
                                     'entityId': gguid,
                                     'description': type + '_' + name
                                 },
-                                'propertyId': str(uuid.uuid1()),
+                                'propertyId': self.propertyId(gguid, type + '_' + name, propRef),
                                 'attributes': [
                                     {
                                         'definitionName': 'DryWeightChange',
@@ -273,7 +606,7 @@ class DryWeightChange(JSONProperties):
                                     }
                                 ]
                                 }
-                    properties.append(property)
+                    self.addProperty(property)
         im = 0
         for mod in modifiedparts:
             part = StructurePart(modifiedparts[mod], self.model.dict)
@@ -294,7 +627,7 @@ class DryWeightChange(JSONProperties):
                                     'entityId': gguid,
                                     'description': type + '_' + name
                                 },
-                                'propertyId': str(uuid.uuid1()),
+                                'propertyId': self.propertyId(gguid, type + '_' + name, propRef),
                                 'attributes': [
                                     {
                                         'definitionName': 'DryWeightChange',
@@ -302,8 +635,28 @@ class DryWeightChange(JSONProperties):
                                     }
                                 ]
                                 }
-                    properties.append(property)
-        self.properties['properties'] = properties
+                    self.addProperty(property)
+        for gguid, (label, panel) in panelratio.items():
+            if gguid in self.filterid:
+                part = StructurePart(panel, self.model.dict)
+                description = part.getType() + '_' + part.getName()
+                propRef = self.getPropertyID(label)
+                property = {'name': 'PanelChange',
+                            'position': None,
+                            'entityRef': {
+                                'entityId': gguid,
+                                'description': description
+                            },
+                            'propertyId': self.propertyId(gguid, description, propRef),
+                            'attributes': [
+                                {
+                                    'definitionName': 'DryWeightChange',
+                                    'valueId': propRef
+                                }
+                            ]
+                            }
+                self.addProperty(property)
+        self.endProperties()
 #        print('New parts: {}'.format(id))
 #        print('Modified or kept parts: {}'.format(im))
 
@@ -332,7 +685,7 @@ class PanelChanges(JSONProperties):
             if weightratio[w] not in values:
                 values.append(weightratio[w])
         self.addSingleAttributeValues(sorted(values))
-        properties = []
+        self.beginProperties()
         # Find all deleted parts
         im = 0
         for mod in modifiedparts:
@@ -354,7 +707,7 @@ class PanelChanges(JSONProperties):
                                     'entityId': gguid,
                                     'description': type + '_' + name
                                 },
-                                'propertyId': str(uuid.uuid1()),
+                                'propertyId': self.propertyId(gguid, type + '_' + name, propRef),
                                 'attributes': [
                                     {
                                         'definitionName': 'Panel Changes',
@@ -362,18 +715,18 @@ class PanelChanges(JSONProperties):
                                     }
                                 ]
                                 }
-                    properties.append(property)
-        self.properties['properties'] = properties
+                    self.addProperty(property)
+        self.endProperties()
         print('Modified or kept parts: {}'.format(im))
 
 
 class TightnessProperty(JSONProperties):
-    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap: str):
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap):
         super().__init__()
         self.model = ocxmodel
         self.map = map
         if self.map:
-            self.entitymap = EntitiesMap(ocxmodel, entitymap)
+            self.entitymap = self.loadEntityMap(ocxmodel, entitymap)
         self.attributedefinition['attributeDefinitions'] = [{'definitionName': 'Tightness',
                                                              'type': 'string',
                                                              'enableColorCoding': True,
@@ -381,74 +734,120 @@ class TightnessProperty(JSONProperties):
                                                              'colorCodingSettings': None}]
         self.dict.update(self.attributedefinition)
 
-    def tightnessProperty(self, file: str):
-        self.file = file
+    def begin(self, file: str):
         # Set the property attributes
         enums = self.model.getEnumeration('tightness')
         self.addSingleAttributeValues(enums)
-        properties = []
-        for part in self.model.getPlates():
-            panel = Panel(self.model, part, self.model.dict, self.model.namespace)
-            name = panel.getName()
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = panel.getGuid()
-            name = panel.getName()
-            tight = panel.tightness()
-            propRef = self.getPropertyID(tight)
-            property = {'name': 'Tightness',
-                        'position': None,
-                        'entityRef': {
-                            'entityId': guid,
-                            'description': name
-                        },
-                        'propertyId': str(uuid.uuid1()),
-                        'attributes': [
-                            {
-                                'definitionName': 'Tightness',
-                                'valueId': propRef
-                            }
-                        ]
-                        }
-            properties.append(property)
-        self.properties['properties'] = properties
+        super().begin(file)
+
+    def tightnessProperty(self, file: str):
+        self.begin(file)
+        self.visitParts(self.model.plates, self.visitPlate, Plate)
+        self.endProperties()
+
+    # The plate wrapper is shared with the other generators. The tightness is read from the plate element
+    def visitPlate(self, part, plate: Plate):
+        name = plate.getName()
+        guid = self.entityId(name, plate)
+        tight = part.get(self.model.dict['tightness'])
+        if tight is None or tight not in self.lookuptable.inverse:
+            Message(part, 'No valid tightness: {}. The plate has no Tightness property'.format(tight))
+            return
+        propRef = self.getPropertyID(tight)
+        self.addProperty(self.propertyEntry('Tightness', guid, name, 'Tightness', propRef))
+
+
+# Index of a Sesam Insight entity map file with hash based lookups.
+# The parsed index is cached in a compact binary file next to the entity file and reused by later runs
+# as long as the entity file is unchanged. Within a run each file is only indexed once.
+class EntityIndex:
+    indexes = {}  # Loaded indexes with the resolved entity file as key
+
+    def __init__(self, entityfile):
+        self.file = Path(entityfile)
+        self.cache = self.file.parent / (self.file.name + '.idx')
+        self.ids = set()  # All entity ids in the map
+        self.roots = []  # Tuples of (name, entityId, [(name, entityId)]) in file order
+        stat = self.file.stat()
+        self.stamp = (stat.st_size, stat.st_mtime_ns)
+        if not self.loadCache():
+            self.parse()
+            self.saveCache()
+
+    def parse(self):
+        self.ids = set()
+        self.roots = []
+        with open(self.file) as json_file:
+            entities = json.load(json_file)
+        for ent in entities['roots']:
+            children = []
+            if 'children' in ent:
+                for child in ent['children']:
+                    children.append((child['name'], child['entityId']))
+                    self.ids.add(child['entityId'])
+            entityid = ent.get('entityId')
+            if entityid is not None:
+                self.ids.add(entityid)
+            self.roots.append((ent['name'], entityid, children))
+
+    def loadCache(self) -> bool:
+        if not self.cache.is_file():
+            return False
+        try:
+            with open(self.cache, 'rb') as fd:
+                stamp, roots, ids = pickle.load(fd)
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError):
+            return False
+        if stamp != self.stamp:
+            return False
+        self.roots = roots
+        self.ids = ids
+        return True
+
+    def saveCache(self):
+        try:
+            with open(self.cache, 'wb') as fd:
+                pickle.dump((self.stamp, self.roots, self.ids), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            print('Could not write the entity index cache {}'.format(self.cache))
+
+    def hasId(self, entityid: str) -> bool:
+        return entityid in self.ids
+
+    def getIds(self) -> set:
+        return self.ids
+
+    def getRoots(self) -> list:
+        return self.roots
+
+
+# Return the index of the entity file. The index is only built once per run
+def loadEntityIndex(entityfile) -> EntityIndex:
+    key = Path(entityfile).resolve()
+    if key not in EntityIndex.indexes:
+        EntityIndex.indexes[key] = EntityIndex(key)
+    return EntityIndex.indexes[key]
 
 
 class FilterId:
     def __init__(self, ocxmodel: OCXmodel, entityfile):
         self.model = ocxmodel
         self.logging = ocxmodel.logging
-        self.entities = []
+        self.index = loadEntityIndex(entityfile)
         self.filterid = self.findIds(entityfile)
 
     def filter(self):
-        filterid = []
-        for ent in self.entities['roots']:
-            if 'children' in ent:
-                for child in ent['children']:
-                    entityid = child['entityId']
-                    filterid.append(entityid)
+        filterid = set()
+        for name, entityid, children in self.index.getRoots():
+            for child in children:
+                filterid.add(child[1])
         print('')
         print('Number of parts filtered: {}'.format(len(filterid)))
         self.filterid = filterid
 
-    def findIds(self, entityfile):
-        filter = []
-        pattern = 'entityId'
-        n = 0
-        with open(entityfile, mode='r') as fd:
-            for line in fd:
-                if re.search(pattern, line):
-                    id = line.split(':')
-                    entityid = id[1].replace('"', '')
-                    entityid = entityid.replace('\n', '')
-                    entityid = entityid.replace(' ', '')
-                    filter.append(entityid)
-                    n = n + 1
-        fd.close()
-#        print('Number of ids: ', n)
-        return filter
+    def findIds(self, entityfile) -> set:
+        # All entity ids in the map as a set for constant time membership tests
+        return self.index.getIds()
 
 
 class EntitiesMap:
@@ -457,36 +856,22 @@ class EntitiesMap:
         self.logging = ocxmodel.logging
         self.json = dict([('modelName', ocxmodel.ocxfile.name)])  # Init  template
         self.root = {}
-        self.entities = {}
+        self.index = loadEntityIndex(entityfile)
         self.partmap = {}
         self.filterid = []
-        with open(entityfile) as json_file:
-            self.entities = json.load(json_file)
         self.createIdentityMap()
 
     def createIdentityMap(self):
         filterid = []
-        i = 0
-        names = []
-        for ent in self.entities['roots']:
-            name = ent['name']
-            if name in names:
-                i = i + 1
-                name = name + '_' + str(i)
-            entityid = ent['entityId']
+        names = UniqueNames()
+        for name, entityid, children in self.index.getRoots():
+            name = names.unique(name)
             filterid.append(entityid)
             self.partmap[name] = entityid
-            names.append(name)
-            if 'children' in ent:
-                for child in ent['children']:
-                    name = child['name']
-                    if name in names:
-                        i = i + 1
-                        name = name + '_' + str(i)
-                    entityid = child['entityId']
-                    self.partmap[name] = entityid
-                    filterid.append(entityid)
-                    names.append(name)
+            for name, entityid in children:
+                name = names.unique(name)
+                self.partmap[name] = entityid
+                filterid.append(entityid)
         print('')
         print('Number of parts mapped: {}'.format(len(self.partmap)))
         self.filterid = filterid
@@ -508,36 +893,21 @@ class EntitiesMap:
     def createMap(self):
         # Loop over all Panels
         roots = []
-        names = []
+        names = UniqueNames()
         index = 0
-        ncount = 0
-        panelchildren = []
-        for part in self.model.getPanels():
+        partition = PanelPartition(self.model)
+        for part in self.model.panels:
             LogMessage(part, self.logging)
             panel = StructurePart(part, self.model.dict)
             guid = panel.getGuid()
             children = self.model.getPanelChildren(guid)
-            # Collect all panel children guids so we later can exclude them from the  root parts
-            panelchildren = panelchildren + children
-            panelname = panel.getName()
-            if panelname in names:
-                ncount = ncount + 1
-                panelname = panelname + '_' + str(ncount)
-                names.append(panelname)
-            else:
-                names.append(panelname)
+            panelname = names.unique(panel.getName())
             mchildren = []
-            ncount = 0
+            names.resetCount()
             for child in children:
                 object = self.model.getObject(child)
                 part = StructurePart(object, self.model.dict)
-                name = part.getName()
-                if name in names:
-                    ncount = ncount + 1
-                    name = name + '_' + str(ncount)
-                    names.append(name)
-                else:
-                    names.append(name)
+                name = names.unique(part.getName())
                 entityid = part.getCleanGuid()
                 mchild = {'name': name,
                           'geoPartIndices': [index],
@@ -552,115 +922,46 @@ class EntitiesMap:
                       }
             roots.append(mpanel)
         # Root brackets
-        mchildren = []
-        ncount = 0
-        for object in self.model.getBrackets():
-            br = StructurePart(object, self.model.dict)
-            guid = br.getGuid()
-            if guid not in panelchildren:
-                name = br.getName()
-                if name in names:
-                    ncount = ncount + 1
-                    name = name + '_' + str(ncount)
-                    names.append(name)
-                else:
-                    names.append(name)
-                entityid = br.getCleanGuid()
-                mchild = {'name': name,
-                          'geoPartIndices': [index],
-                          'entityId': entityid
-                          }
-                index = index + 1
-                mchildren.append(mchild)
-        mparts = {'name': 'Brackets',
-                  'children': mchildren
-                  }
-        roots.append(mparts)
+        names.resetCount()
+        index = self.rootChildren(roots, 'Brackets', partition.rootParts(self.model.brackets), names, index)
         # Root plates
-        mchildren = []
-        for object in self.model.getPlates():
-            part = StructurePart(object, self.model.dict)
-            guid = part.getGuid()
-            if guid not in panelchildren:
-                name = part.getName()
-                if name in names:
-                    ncount = ncount + 1
-                    name = name + '_' + str(ncount)
-                    names.append(name)
-                else:
-                    names.append(name)
-                entityid = part.getCleanGuid()
-                mchild = {'name': name,
-                          'geoPartIndices': [index],
-                          'entityId': entityid
-                          }
-                index = index + 1
-                mchildren.append(mchild)
-        mparts = {'name': 'Plates',
-                  'children': mchildren
-                  }
-        roots.append(mparts)
+        index = self.rootChildren(roots, 'Plates', partition.rootParts(self.model.plates), names, index)
         # Root pillars
-        ncount = 0
-        mchildren = []
-        for object in self.model.getPillars():
-            part = StructurePart(object, self.model.dict)
-            guid = part.getGuid()
-            if guid not in panelchildren:
-                name = part.getName()
-                if name in names:
-                    ncount = ncount + 1
-                    name = name + '_' + str(ncount)
-                    names.append(name)
-                else:
-                    names.append(name)
-                entityid = part.getCleanGuid()
-                mchild = {'name': name,
-                          'geoPartIndices': [index],
-                          'entityId': entityid
-                          }
-                index = index + 1
-                mchildren.append(mchild)
-        mparts = {'name': 'Pillars',
-                  'children': mchildren
-                  }
-        roots.append(mparts)
+        names.resetCount()
+        index = self.rootChildren(roots, 'Pillars', partition.rootParts(self.model.pillars), names, index)
         # Root stiffeners
-        ncount = 0
+        names.resetCount()
+        index = self.rootChildren(roots, 'Stiffeners', partition.rootParts(self.model.stiffeners), names, index)
+        self.root['roots'] = roots
+        return
+
+    # Add the root parts as children of a named root and return the next geometry part index
+    def rootChildren(self, roots: list, rootname: str, objects: list, names: UniqueNames, index: int) -> int:
         mchildren = []
-        for object in self.model.getStiffeners():
+        for object in objects:
             part = StructurePart(object, self.model.dict)
-            guid = part.getGuid()
-            if guid not in panelchildren:
-                name = part.getName()
-                if name in names:
-                    ncount = ncount + 1
-                    name = name + '_' + str(ncount)
-                    names.append(name)
-                else:
-                    names.append(name)
-                entityid = part.getCleanGuid()
-                mchild = {'name': name,
-                          'geoPartIndices': [index],
-                          'entityId': entityid
-                          }
-                index = index + 1
-                mchildren.append(mchild)
-        mparts = {'name': 'Pillars',
+            name = names.unique(part.getName())
+            entityid = part.getCleanGuid()
+            mchild = {'name': name,
+                      'geoPartIndices': [index],
+                      'entityId': entityid
+                      }
+            index = index + 1
+            mchildren.append(mchild)
+        mparts = {'name': rootname,
                   'children': mchildren
                   }
         roots.append(mparts)
-        self.root['roots'] = roots
-        return
+        return index
 
 
 class FunctionProperty(JSONProperties):
-    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap: str):
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap):
         super().__init__()
         self.model = ocxmodel
         self.map = map
         if self.map:
-            self.entitymap = EntitiesMap(ocxmodel, entitymap)
+            self.entitymap = self.loadEntityMap(ocxmodel, entitymap)
         self.attributedefinition['attributeDefinitions'] = [{'definitionName': 'Structure Function',
                                                              'type': 'string',
                                                              'enableColorCoding': True,
@@ -668,9 +969,7 @@ class FunctionProperty(JSONProperties):
                                                              'colorCodingSettings': None}]
         self.dict.update(self.attributedefinition)
 
-    def functionType(self,  file: str):
-
-        self.file = file
+    def begin(self, file: str):
         # Set the property attributes
         enums = self.model.getEnumeration('functionType')
         pretty = []
@@ -678,64 +977,26 @@ class FunctionProperty(JSONProperties):
 #            pretty.append(self.prettyType(enum))
             pretty.append(enum)
         self.addSingleAttributeValues(pretty)
-        properties = []
+        super().begin(file)
+
+    def functionType(self,  file: str):
+        self.begin(file)
         # Plates
-        for part in self.model.getPlates():
-            plate = Plate(self.model, part, self.model.dict, self.model.namespace)
-            name = plate.getName()
-            function = plate.functionType()
-            pfunc = self.prettyType(function)
-            self.prettyType(function)
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = plate.getGuid()
-#            propRef = self.getPropertyID(pfunc)
-            propRef = self.getPropertyID(function)
-            property = {'name': 'Structure Function',
-                        'position': None,
-                        'entityRef': {
-                            'entityId': guid,
-                            'description': name
-                        },
-                        'propertyId': str(uuid.uuid1()),
-                        'attributes': [
-                            {
-                                'definitionName': 'Structure Function',
-                                'valueId': propRef
-                            }
-                        ]
-                        }
-            properties.append(property)
+        self.visitParts(self.model.plates, self.visitPlate, Plate)
         # Brackets
-        for part in self.model.getBrackets():
-            plate = Bracket(self.model, part, self.model.dict, self.model.namespace)
-            name = plate.getName()
-            function = plate.functionType()
-            pfunc = self.prettyType(function)
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = panel.getGuid()
-            propRef = self.getPropertyID(function)
-            property = {'name': 'Structure Function',
-                        'position': None,
-                        'entityRef':
-                            {
-                                'entityId': guid,
-                                'description': name
-                            },
-                        'propertyId': str(uuid.uuid1()),
-                        'attributes':
-                            [
-                                {
-                                    'definitionName': 'Structure Function',
-                                    'valueId': propRef
-                                }
-                            ]
-                        }
-            properties.append(property)
-        self.properties['properties'] = properties
+        self.visitParts(self.model.brackets, self.visitBracket, Bracket)
+        self.endProperties()
+
+    def visitPlate(self, part, plate: Plate):
+        name = plate.getName()
+        function = plate.functionType()
+        guid = self.entityId(name, plate)
+#        propRef = self.getPropertyID(self.prettyType(function))
+        propRef = self.getPropertyID(function)
+        self.addProperty(self.propertyEntry('Structure Function', guid, name, 'Structure Function', propRef))
+
+    def visitBracket(self, part, bracket: Bracket):
+        self.visitPlate(part, bracket)
 
     def prettyType(self, type: str):  # Returns a human readable type
         # The function Type comes in two standard forms:
@@ -757,19 +1018,19 @@ class FunctionProperty(JSONProperties):
 
 
 class MaterialProperties(JSONProperties):
-    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap: str):
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap):
         super().__init__()
         self.model = ocxmodel
         self.map = map
         if self.map:
-            self.entitymap = EntitiesMap(ocxmodel, entitymap)
+            self.entitymap = self.loadEntityMap(ocxmodel, entitymap)
         self.dict.update(self.attributeDefinitions('Material'))
         self.propertyValues()
 
     def propertyValues(self):
         # Loop over materials
         propertyvalues = {}
-        for mat in self.model.getMaterials():
+        for mat in self.model.materials:
             material = Material(mat, self.model.dict)
             name = material.getName()
             property = material.getProperty()
@@ -785,222 +1046,104 @@ class MaterialProperties(JSONProperties):
         return
 
     def assignMaterials(self, file: str):
-        self.file = file
-        # Set the material attributes
-        properties = []
+        self.begin(file)
         # Plates
-        for part in self.model.getPlates():
-            plate = Plate(self.model, part, self.model.dict, self.model.namespace)
-            platename = plate.getName()
-            material = plate.getMaterial()
-            matname = material.getName()
-            if self.map:
-                guid = self.entitymap.getEntityId(platename)  # Use guid from name map
-            else:
-                guid = plate.getGuid()
-            propRef = self.getPropertyID(matname)
-            property = {'name': 'Material',
-                        'position': None,
-                        'entityRef': {
-                            'entityId': guid,
-                            'description': platename
-                        },
-                        'propertyId': str(uuid.uuid1()),
-                        'attributes': [
-                            {
-                                'definitionName': 'Material',
-                                'valueId': propRef
-                            }
-                        ]
-                        }
-            properties.append(property)
+        self.visitParts(self.model.plates, self.visitPlate, Plate)
         # Brackets
-        names = []
-        for part in self.model.getBrackets():
-            br = Bracket(self.model, part, self.model.dict, self.model.namespace)
-            name = br.getName()
-            material = br.getMaterial()
-            matname = material.getName()
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = br.getGuid()
-            if not guid == None and name not in names:
-                propRef = self.getPropertyID(matname)
-                property = {'name': 'Material',
-                            'position': None,
-                            'entityRef': {
-                                'entityId': guid,
-                                'description': name
-                            },
-                            'propertyId': str(uuid.uuid1()),
-                            'attributes': [
-                                {
-                                    'definitionName': 'Material',
-                                    'valueId': propRef
-                                }
-                            ]
-                            }
-                properties.append(property)
-                names.append(name)
+        self.visitParts(self.model.brackets, self.visitBracket, Bracket)
         # Stiffeners
-        for part in self.model.getStiffeners():
-            stf = Stiffener(self.model, part, self.model.dict, self.model.namespace)
-            name = stf.getName()
-            material = stf.getMaterial()
-            matname = material.getName()
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = stf.getGuid()
-            if not guid == None:
-                propRef = self.getPropertyID(matname)
-                property = {'name': 'Material',
-                            'position': None,
-                            'entityRef': {
-                                'entityId': guid,
-                                'description': name
-                            },
-                            'propertyId': str(uuid.uuid1()),
-                            'attributes': [
-                                {
-                                    'definitionName': 'Material',
-                                    'valueId': propRef
-                                }
-                            ]
-                            }
-                properties.append(property)
+        self.visitParts(self.model.stiffeners, self.visitStiffener, Stiffener)
         # Pillars
-        for part in self.model.getPillars():
-            pil = Stiffener(self.model, part, self.model.dict, self.model.namespace)
-            name = pil.getName()
-            material = pil.getMaterial()
-            matname = material.getName()
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = pil.getGuid()
-            if not guid == None:
-                propRef = self.getPropertyID(matname)
-                property = {'name': 'Material',
-                            'position': None,
-                            'entityRef': {
-                                'entityId': guid,
-                                'description': name
-                            },
-                            'propertyId': str(uuid.uuid1()),
-                            'attributes': [
-                                {
-                                    'definitionName': 'Material',
-                                    'valueId': propRef
-                                }
-                            ]
-                            }
-                properties.append(property)
-        self.properties['properties'] = properties
+        self.visitParts(self.model.pillars, self.visitPillar, Stiffener)
+        self.endProperties()
         return
 
+    def visitPlate(self, part, plate: Plate):
+        platename = plate.getName()
+        material = plate.getMaterial()
+        matname = material.getName()
+        guid = self.entityId(platename, plate)
+        propRef = self.getPropertyID(matname)
+        self.addProperty(self.propertyEntry('Material', guid, platename, 'Material', propRef))
+
+    def visitBracket(self, part, bracket: Bracket):
+        name = bracket.getName()
+        material = bracket.getMaterial()
+        matname = material.getName()
+        guid = self.entityId(name, bracket)
+        if not guid == None:
+            propRef = self.getPropertyID(matname)
+            self.addProperty(self.propertyEntry('Material', guid, name, 'Material', propRef), name)
+
+    def visitStiffener(self, part, stiffener: Stiffener):
+        name = stiffener.getName()
+        material = stiffener.getMaterial()
+        matname = material.getName()
+        guid = self.entityId(name, stiffener)
+        if not guid == None:
+            propRef = self.getPropertyID(matname)
+            self.addProperty(self.propertyEntry('Material', guid, name, 'Material', propRef))
+
+    def visitPillar(self, part, pillar: Stiffener):
+        self.visitStiffener(part, pillar)
+
 
 class BracketProperties(JSONProperties):
-    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap: str):
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap):
         super().__init__()
         self.model = ocxmodel
         self.map = map
         if self.map:
-            self.entitymap = EntitiesMap(ocxmodel, entitymap)
+            self.entitymap = self.loadEntityMap(ocxmodel, entitymap)
         self.dict.update(self.attributeDefinitions('BracketParameters'))
         self.propertyValues()
 
     def propertyValues(self):
-        # Loop over brackets
-        valuedict = {}
-        propdict = {}
-        ib = 0
-        for br in self.model.getBrackets():
-            bracket = Bracket(self.model, br, self.model.dict, self.model.namespace)
-            guid = bracket.getGuid()
-            prop = bracket.getBracketParameters()
-            id = prop.getPropertiesID()
-            values = prop.getProperties()
-            propdict[id] = values
-
-        for id in propdict:
-            vals = propdict[id]
-            properties = []
-            for key in vals:
-                value = '{:.3f}'.format(vals[key])
-                attr={
-                    'key': key,
-                    'value': value
-                }
-                properties.append(attr)
-            valuedict[id] = properties
+        # One attribute value for each bracket type in the catalog
+        catalog = self.model.getBracketCatalog()
         attributes = []
-        for id in valuedict:
-            # json fields
-            ib = ib + 1
-            name = 'Type'+ str(ib)
-            attr = {'valueId': id,
-                    'value': name,
-                    'metaData': valuedict[id]}
-            attributes.append(attr)
+        for id in catalog.getTypes():
+            name = catalog.typeName(id)
+            parameters = catalog.getParameters(id)
+            properties = [{'key': key, 'value': '{:.3f}'.format(parameters[key])} for key in parameters]
+            attributes.append({'valueId': id,
+                               'value': name,
+                               'metaData': properties})
             # create a bidirectional lookup table for the tuple (valueID,value)
             self.lookuptable[id] = name
         self.attributevalues['attributeValues'] = attributes
+        print('Bracket parameters: {} brackets of {} types'.format(len(catalog.brackets), len(attributes)))
         return
 
-
     def assignBracketParameters(self, file: str):
-        self.file = file
-        # Set the material attributes
-        properties = []
+        self.begin(file)
         # Brackets
-        names = []
-        for part in self.model.getBrackets():
-            br = Bracket(self.model, part, self.model.dict, self.model.namespace)
-            name = br.getName()
-            par = br.getBracketParameters()
-            id = par.getPropertiesID()
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = br.getGuid()
-            if not guid == None and name not in names:
-                propRef = id
-                property = {'name': 'BracketParameters',
-                            'position': None,
-                            'entityRef': {
-                                'entityId': guid,
-                                'description': name
-                            },
-                            'propertyId': str(uuid.uuid1()),
-                            'attributes': [
-                                {
-                                    'definitionName': 'BracketParameters',
-                                    'valueId': propRef
-                                }
-                            ]
-                            }
-                properties.append(property)
-                names.append(name)
-        self.properties['properties'] = properties
+        self.visitParts(self.model.brackets, self.visitBracket, Bracket)
+        self.endProperties()
         return
 
+    def visitBracket(self, part, bracket: Bracket):
+        name = bracket.getName()
+        propRef = self.model.getBracketCatalog().typeOf(bracket.getGuid())
+        guid = self.entityId(name, bracket)
+        if not guid == None:
+            self.addProperty(self.propertyEntry('BracketParameters', guid, name, 'BracketParameters', propRef), name)
+
 
 class SectionProperties(JSONProperties):
-    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap: str):
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap):
         super().__init__()
         self.model = ocxmodel
         self.map = map
         if self.map:
-            self.entitymap = EntitiesMap(ocxmodel, entitymap)
+            self.entitymap = self.loadEntityMap(ocxmodel, entitymap)
         self.dict.update(self.attributeDefinitions('Section'))
         self.propertyValues()
 
     def propertyValues(self):
         # Loop over materials
         propertyvalues = {}
-        for sec in self.model.getSections():
+        for sec in self.model.sections:
             section = BarSection(sec, self.model.dict)
             name = section.getName()
             if section.hasBar:
@@ -1017,74 +1160,34 @@ class SectionProperties(JSONProperties):
         return
 
     def assignSections(self, file: str):
-        self.file = file
-        # Set the section attributes
-        properties = []
+        self.begin(file)
         # Stiffeners
-        for part in self.model.getStiffeners():
-            stf = Stiffener(self.model, part, self.model.dict, self.model.namespace)
-            name = stf.getName()
-            section = stf.getSection()
-            secname = section.getName()
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = stf.getGuid()
-            if not guid == None:
-                propRef = self.getPropertyID(secname)
-                property = {'name': 'Section',
-                            'position': None,
-                            'entityRef': {
-                                'entityId': guid,
-                                'description': name
-                            },
-                            'propertyId': str(uuid.uuid1()),
-                            'attributes': [
-                                {
-                                    'definitionName': 'Section',
-                                    'valueId': propRef
-                                }
-                            ]
-                            }
-                properties.append(property)
+        self.visitParts(self.model.stiffeners, self.visitStiffener, Stiffener)
         # Pillars
-        for part in self.model.getPillars():
-            pil = Stiffener(self.model, part, self.model.dict, self.model.namespace)
-            name = pil.getName()
-            section = pil.getSection()
-            secname = section.getName()
-            if self.map:
-                guid = self.entitymap.getEntityId(name)  # Use guid from name map
-            else:
-                guid = pil.getGuid()
-            if not guid == None:
-                propRef = self.getPropertyID(secname)
-                property = {'name': 'Section',
-                            'position': None,
-                            'entityRef': {
-                                'entityId': guid,
-                                'description': name
-                            },
-                            'propertyId': str(uuid.uuid1()),
-                            'attributes': [
-                                {
-                                    'definitionName': 'Section',
-                                    'valueId': propRef
-                                }
-                            ]
-                            }
-                properties.append(property)
-        self.properties['properties'] = properties
+        self.visitParts(self.model.pillars, self.visitPillar, Stiffener)
+        self.endProperties()
         return
 
+    def visitStiffener(self, part, stiffener: Stiffener):
+        name = stiffener.getName()
+        section = stiffener.getSection()
+        secname = section.getName()
+        guid = self.entityId(name, stiffener)
+        if not guid == None:
+            propRef = self.getPropertyID(secname)
+            self.addProperty(self.propertyEntry('Section', guid, name, 'Section', propRef))
+
+    def visitPillar(self, part, pillar: Stiffener):
+        self.visitStiffener(part, pillar)
+
 
 class EndConnections(JSONProperties):
-    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap: str):
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap):
         super().__init__()
         self.model = ocxmodel
         self.map = map
         if self.map:
-            self.entitymap = EntitiesMap(ocxmodel, entitymap)
+            self.entitymap = self.loadEntityMap(ocxmodel, entitymap)
         self.attributedefinition['attributeDefinitions'] = [{'definitionName': 'EndConnection',
                                                              'type': 'string',
                                                              'enableColorCoding': True,
@@ -1097,41 +1200,268 @@ class EndConnections(JSONProperties):
         self.addSingleAttributeValues(values)
 
     def assignConnections(self, file: str):
-        self.file = file
-        # Set the stiffener connections
-        properties = []
+        self.begin(file)
         # Stiffeners
-        for part in self.model.getStiffeners():
-            stf = Stiffener(self.model, part, self.model.dict, self.model.namespace)
-            name = stf.getName()
-            if stf.hasConnections():
-                ic = 0
-                connections = stf.getConnectionConfigurations()
-                for config in connections:
-                    configuration = ConnectionConfiguration(config, self.model.dict)
-                    position = configuration.position()
-                    type = configuration.connectionType()
-                    if self.map:
-                        guid = self.entitymap.getEntityId(name)  # Use guid from name map
-                    else:
-                        guid = stf.getGuid()
-                    propRef = self.getPropertyID(type)
-                    property = {'name': 'EndConnection',
-                                'propertyId': str(uuid.uuid1()),
-                                'position':
-                                    {
-                                        'x': position[0],
-                                        'y': position[1],
-                                        'z': position[2]
-                                    },
-                                'attributes': [
-                                    {
-                                        'definitionName': 'EndConnection',
-                                        'valueId': propRef
-                                    }
-                                ]
-                                }
-                    properties.append(property)
-                    ic = ic + 1
-                self.properties['properties'] = properties
+        self.visitParts(self.model.stiffeners, self.visitStiffener, Stiffener)
+        self.endProperties()
         return
+
+    def visitStiffener(self, part, stiffener: Stiffener):
+        # Set the stiffener connections
+        if stiffener.hasConnections():
+            connections = stiffener.getConnectionConfigurations()
+            for config in connections:
+                configuration = ConnectionConfiguration(config, self.model.dict)
+                position = configuration.position()
+                type = configuration.connectionType()
+                propRef = self.getPropertyID(type)
+                property = {'name': 'EndConnection',
+                            'propertyId': self.propertyId(stiffener.getGuid(), type, list(position)),
+                            'position':
+                                {
+                                    'x': position[0],
+                                    'y': position[1],
+                                    'z': position[2]
+                                },
+                            'attributes': [
+                                {
+                                    'definitionName': 'EndConnection',
+                                    'valueId': propRef
+                                }
+                            ]
+                            }
+                self.addProperty(property)
+
+
+# Collects the part attributes in columns and writes them to a columnar file for dataframe tools.
+# A .parquet file is written with pyarrow if it is installed, otherwise the columns are saved in a numpy .npz archive.
+# The table is generated by PropertyExporter in the same pass over the parts as the JSON properties
+class PartTable(JSONProperties):
+    columns = ['guid', 'name', 'type', 'panel', 'material', 'grade', 'thickness', 'section', 'tightness',
+               'functionType', 'dryWeight', 'cogX', 'cogY', 'cogZ']
+
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap):
+        super().__init__()
+        self.model = ocxmodel
+        self.map = False  # The table uses the OCX guids
+        self.table = {}
+        self.grades = {}  # Material grade with the material name as key
+        self.parents = {}  # Parent panel guid with the child guid as key
+        self.panels = {}  # Panel tightness and functionType with the panel guid as key
+        self.unit = OCXUnit()
+
+    def begin(self, file: str):
+        self.file = file
+        self.table = {column: [] for column in PartTable.columns}
+        dict = self.model.dict
+        for mat in self.model.materials:
+            material = Material(mat, dict)
+            if material.hasGrade():
+                self.grades[material.getName()] = material.getGrade()
+        for part in self.model.panels:
+            panel = Panel(self.model, part, dict, self.model.namespace)
+            guid = panel.getGuid()
+            self.panels[guid] = (part.get(dict['tightness']), panel.functionType())
+            for child in self.model.getPanelChildren(guid):
+                self.parents[child] = guid
+
+    def reusePart(self, part, fingerprint=None) -> bool:
+        return False  # The table is always written in full
+
+    def visitPlate(self, part, plate: Plate):
+        self.addRow(part, plate, self.plateThickness(part), '', plate.functionType())
+
+    def visitBracket(self, part, bracket: Bracket):
+        self.addRow(part, bracket, self.plateThickness(part), '', bracket.functionType())
+
+    def visitStiffener(self, part, stiffener: Stiffener):
+        self.addRow(part, stiffener, numpy.nan, stiffener.getSection().getName(), None)
+
+    def visitPillar(self, part, pillar: Stiffener):
+        self.visitStiffener(part, pillar)
+
+    def plateThickness(self, part) -> float:
+        dict = self.model.dict
+        material = part.find(dict['platematerial'])
+        if material is not None:
+            thickness = material.find(dict['thickness'])
+            if thickness is not None:
+                return self.unit.numericValue(thickness)
+        return numpy.nan
+
+    def addRow(self, part, object, thickness: float, section: str, function):
+        dict = self.model.dict
+        guid = object.getGuid()
+        panel = self.parents.get(guid, '')
+        tightness, panelfunction = self.panels.get(panel, (None, None))
+        if function is None:
+            function = panelfunction  # Stiffeners have the function of the parent panel
+        material = object.getMaterial().getName() or ''
+        weight = numpy.nan
+        cog = [numpy.nan, numpy.nan, numpy.nan]
+        properties = part.find(dict['physicalproperties'])
+        if properties is not None:
+            dryweight = properties.find(dict['dryweight'])
+            if dryweight is not None:
+                weight = self.unit.numericValue(dryweight)
+            center = properties.find(dict['centerofgravity'])
+            if center is not None:
+                axes = [center.find(dict[axis]) for axis in ('x', 'y', 'z')]
+                if any(axis is None for axis in axes):
+                    Message(part, 'CenterOfGravity without all of the x, y and z coordinates')
+                else:
+                    cog = [self.unit.numericValue(axis) for axis in axes]
+        row = [guid, object.getName() or '', object.getType(), panel, material, self.grades.get(material, ''),
+               thickness, section, tightness or '', function or '', weight] + cog
+        for column, value in zip(PartTable.columns, row):
+            self.table[column].append(value)
+
+    # The worker fragments are column chunks
+    def beginFragment(self):
+        self.table = {column: [] for column in PartTable.columns}
+
+    def endFragment(self) -> tuple:
+        return self.table, {}, 0
+
+    def mergeFragment(self, fragment: dict, partrecords: dict, reused: int):
+        for column in PartTable.columns:
+            self.table[column].extend(fragment[column])
+
+    def endProperties(self):
+        self.writeTable()
+
+    def writeJson(self):
+        return  # Written by endProperties()
+
+    def writeTable(self):
+        columns = {column: numpy.array(self.table[column]) for column in PartTable.columns}
+        path = Path(self.file)
+        if path.suffix == '.parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                print('pyarrow is not installed, writing the part table as a numpy archive')
+                path = path.with_suffix('.npz')
+            else:
+                pyarrow.parquet.write_table(pyarrow.table(columns), str(path))
+                print('Wrote {} parts to {}'.format(len(columns['guid']), path))
+                return
+        numpy.savez(path, **columns)
+        print('Wrote {} parts to {}'.format(len(columns['guid']), path))
+
+
+# Generates several property files in one pass over the structure parts.
+# Each part wrapper is built once and handed to all enabled generators, which share one entity map.
+class PropertyExporter:
+    generators = {'material': MaterialProperties,
+                  'bracket': BracketProperties,
+                  'section': SectionProperties,
+                  'tightness': TightnessProperty,
+                  'function': FunctionProperty,
+                  'endconnection': EndConnections,
+                  'table': PartTable}
+
+    def __init__(self, ocxmodel: OCXmodel, map: bool, entitymap: str):
+        self.model = ocxmodel
+        self.map = map
+        self.entitymap = None
+        if map:
+            self.entitymap = EntitiesMap(ocxmodel, entitymap)
+        self.enabled = []  # Tuples of (generator, output file)
+        # The part lists visited in order as tuples of (model part list, visitor, wrapper)
+        self.parttypes = [('plates', 'visitPlate', Plate),
+                          ('brackets', 'visitBracket', Bracket),
+                          ('stiffeners', 'visitStiffener', Stiffener),
+                          ('pillars', 'visitPillar', Stiffener)]
+        self.processes = 1
+        self.chunksize = 5000
+        self.fingerprint = None  # The part fingerprints of the incremental output
+
+    # The names of the generators writing Sesam JSON properties
+    @staticmethod
+    def propertyNames() -> list:
+        return [name for name in PropertyExporter.generators if name != 'table']
+
+    def enable(self, name: str, file: str) -> JSONProperties:
+        generator = PropertyExporter.generators[name](self.model, self.map, self.entitymap)
+        self.enabled.append((generator, file))
+        return generator
+
+    # Generate the properties in chunks of parts on a pool of worker processes.
+    # The workers are forked and share the imported model. The property fragments of the chunks are merged
+    # in chunk order, so the output is the same as from a single process
+    def parallel(self, processes: int, chunksize=5000):
+        self.processes = processes
+        self.chunksize = chunksize
+
+    def run(self):
+        try:
+            for generator, file in self.enabled:
+                generator.begin(file)
+            if self.processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+                self.runParallel()
+            else:
+                for parts, visitor, wrapper in self.parttypes:
+                    self.visitParts(getattr(self.model, parts), visitor, wrapper)
+            for generator, file in self.enabled:
+                generator.endProperties()
+        finally:
+            for generator, file in self.enabled:
+                generator.abortProperties()
+
+    def runParallel(self):
+        global _exporter
+        chunks = []  # Tuples of (part type index, first part, last part)
+        for index, (parts, visitor, wrapper) in enumerate(self.parttypes):
+            nparts = len(getattr(self.model, parts))
+            for start in range(0, nparts, self.chunksize):
+                chunks.append((index, start, min(start + self.chunksize, nparts)))
+        for generator, file in self.enabled:
+            generator.flush()
+        _exporter = self
+        try:
+            with multiprocessing.get_context('fork').Pool(self.processes) as pool:
+                for fragments in pool.imap(_visitChunk, chunks):
+                    for (generator, file), fragment in zip(self.enabled, fragments):
+                        generator.mergeFragment(*fragment)
+        finally:
+            _exporter = None
+        print('Generated the properties of {} chunks on {} processes'.format(len(chunks), self.processes))
+
+    # Runs in a worker process: return the property fragments of each generator for a chunk of parts
+    def visitChunk(self, index: int, start: int, stop: int) -> list:
+        parts, visitor, wrapper = self.parttypes[index]
+        for generator, file in self.enabled:
+            generator.beginFragment()
+        self.visitParts(getattr(self.model, parts)[start:stop], visitor, wrapper)
+        return [generator.endFragment() for generator, file in self.enabled]
+
+    def visitParts(self, parts: list, visitor: str, wrapper):
+        model = self.model
+        incremental = any(generator.incremental for generator, file in self.enabled)
+        if incremental and self.fingerprint is None:
+            self.fingerprint = PartFingerPrint(model)
+        for part in parts:
+            object = None  # The wrapper is only built if a generator needs it
+            fingerprint = None
+            if incremental:
+                fingerprint = self.fingerprint.hexdigest(part)
+            for generator, file in self.enabled:
+                if not generator.reusePart(part, fingerprint):
+                    if object is None:
+                        object = wrapper(model, part, model.dict, model.namespace)
+                    getattr(generator, visitor)(part, object)
+                    generator.endPart()
+
+    def writeJson(self):
+        for generator, file in self.enabled:
+            generator.writeJson()
+
+
+# The exporter shared with the forked worker processes
+_exporter = None
+
+
+def _visitChunk(chunk: tuple) -> list:
+    return _exporter.visitChunk(*chunk)
@@ -10,6 +10,7 @@ import xml.etree.ElementTree as ET
 import numpy
 import os
 import re
+import uuid
 
 import OCXGeometry
 import OCXParser
@@ -104,6 +105,28 @@ class OCXschema:
         self.parsed = True
         return
 
+    # The legal values of a global attribute or simple type restricted by an enumeration.
+    # Empty if the schema has no such enumeration
+    def getEnumeration(self, name: str) -> list:
+        if not self.parsed:
+            return []
+        root = self.tree.getroot()
+        simple = None
+        for attribute in self.attributes:
+            if attribute.get('name') == name:
+                simple = attribute.find('xs:simpleType', self.namespace)
+                if simple is None and attribute.get('type') is not None:
+                    name = attribute.get('type').split(':')[-1]
+                break
+        if simple is None:
+            for type in root.findall('xs:simpleType', self.namespace):
+                if type.get('name') == name:
+                    simple = type
+                    break
+        if simple is None:
+            return []
+        return [e.get('value') for e in simple.findall('.//xs:enumeration', self.namespace)]
+
     # Create the type dictionary/lookup tables
     def makeDictionary(self):
         self.type = {}
@@ -185,11 +208,14 @@ class OCXmodel:
         self.logging = log
         # Create the schema parser and get the namespaces
         sparser = OCXschema(self.ocxschema.resolve())
+        self.schema = sparser
         self.namespace = sparser.getNameSpace()
         self.schema_version = sparser.version
         self.dict = sparser.dict  # The dictionary of parsable ocx elements
         self.guids = {}  # GUID lookup table
         self.frametable = {}  # Frametable dict with guid as key
+        self.bracketcatalog = None  # The bracket parameter catalog is built on first use
+        self.referenceindex = None  # The GUIDRef definitions and references
 
     # Generic function to retrieve the GUID from an object
     def getGUID(self, object):
@@ -240,6 +266,8 @@ class OCXmodel:
         self.pillars = self.dom.getPillars()
         # Guid lookup table
         self.createGUIDTable()
+        # GUIDRef definitions and references
+        self.referenceindex = ReferenceIndex(self.root, self.dict)
         # Frame lookup table
         self.createFrameTable()
         # Find all panel children
@@ -255,6 +283,8 @@ class OCXmodel:
         print('Number of brackets   : ', len(self.brackets))
         print('Number of materials  : ', len(self.materials))
         print('Number of sections   : ', len(self.sections))
+        print('Number of references : ', self.referenceindex.numberOfReferences())
+        print('Dangling references  : ', len(self.referenceindex.getDangling()))
         print('')
         return
 
@@ -408,6 +438,145 @@ class OCXmodel:
     def get_dict(self):
         return self.dict
 
+    def getBracketCatalog(self):
+        if self.bracketcatalog is None:
+            self.bracketcatalog = BracketCatalog(self)
+        return self.bracketcatalog
+
+    def getReferenceIndex(self):
+        return self.referenceindex
+
+    def getEnumeration(self, name: str) -> list:
+        return self.schema.getEnumeration(name)
+
+
+# Catalog of the distinct bracket parameter sets.
+# The parameters of each bracket are canonicalized once and the brackets are grouped by their parameter set in
+# a single pass, so the many brackets of a model collapse to the few bracket types used by reporting and instancing
+class BracketCatalog:
+    def __init__(self, model: OCXmodel, decimals=3):
+        self.model = model
+        self.decimals = decimals  # Parameters equal to this number of decimals give the same type
+        self.keys = {}  # The type key with the canonical parameter set as key
+        self.types = {}  # The bracket guids of each type with the type key as key, in the order first found
+        self.parameters = {}  # The parameters of each type with the type key as key
+        self.names = {}  # The type name with the type key as key
+        self.brackets = {}  # The type key with the bracket guid as key
+        self.build()
+
+    def build(self):
+        model = self.model
+        for br in model.brackets:
+            guid = model.getGUID(br)
+            parameters = self.bracketParameters(br)
+            canonical = tuple(sorted((key, round(float(parameters[key]), self.decimals)) for key in parameters))
+            key = self.keys.get(canonical)
+            if key is None:
+                # A name based id so the same parameter set has the same key in all models
+                key = str(uuid.uuid3(uuid.NAMESPACE_OID, repr(canonical)))
+                self.keys[canonical] = key
+                self.types[key] = []
+                self.parameters[key] = dict(canonical)
+                self.names[key] = 'Type' + str(len(self.types))
+            self.types[key].append(guid)
+            self.brackets[guid] = key
+
+    # The numeric BracketParameters of the bracket with the parameter name as key
+    def bracketParameters(self, br) -> dict:
+        dict = self.model.dict
+        element = br.find(dict['bracketparameters']) if 'bracketparameters' in dict else None
+        if element is None:
+            return {}
+        unit = OCXCommon.OCXUnit()
+        return {child.tag.rsplit('}', 1)[-1]: unit.numericValue(child) for child in element
+                if child.get('numericvalue') is not None}
+
+    def getTypes(self) -> list:
+        return list(self.types)
+
+    def getBrackets(self, key: str) -> list:
+        return self.types[key]
+
+    def getParameters(self, key: str) -> dict:
+        return self.parameters[key]
+
+    def typeName(self, key: str) -> str:
+        return self.names[key]
+
+    def typeOf(self, guid: str):
+        return self.brackets.get(guid)
+
+    def printCatalog(self):
+        print('Bracket catalog: {} brackets of {} types'.format(len(self.brackets), len(self.types)))
+        for key in self.types:
+            print('{:>10}: {:6} brackets {}'.format(self.names[key], len(self.types[key]), self.parameters[key]))
+
+
+# Index of the GUIDRef definitions and the references to them, built in one pass over the model tree.
+# A definition is an element with a GUIDRef attribute. A reference is an element with a refType attribute
+# (MaterialRef, SectionRef, OcxItemPtr, ...) pointing at the GUIDRef of a definition.
+# The source of a reference is the nearest enclosing definition
+class ReferenceIndex:
+    def __init__(self, root, dict: dict):
+        self.guidref = dict['guidref']
+        self.reftype = dict.get('reftype', 'refType')
+        self.definitions = {}  # The first definition with the guid as key
+        self.duplicates = {}  # The further definitions with the guid as key
+        self.references = {}  # Tuples of (reference, source) with the referenced guid as key
+        self.build(root)
+
+    def build(self, root):
+        guidref = self.guidref
+        stack = [(root, None)]
+        while len(stack) > 0:
+            element, source = stack.pop()
+            guid = element.get(guidref)
+            if guid is not None:
+                if self.isReference(element):
+                    self.references.setdefault(guid, []).append((element, source))
+                else:
+                    if guid in self.definitions:
+                        self.duplicates.setdefault(guid, []).append(element)
+                    else:
+                        self.definitions[guid] = element
+                    source = element
+            # Reversed so the elements are indexed in document order
+            for child in reversed(element):
+                stack.append((child, source))
+
+    # The refType attribute is a global schema attribute, but is also accepted unqualified
+    def isReference(self, element) -> bool:
+        return element.get(self.reftype) is not None or element.get('refType') is not None
+
+    def numberOfReferences(self) -> int:
+        return sum(len(references) for references in self.references.values())
+
+    def getDefinition(self, guid: str):
+        return self.definitions.get(guid)
+
+    def isDefined(self, guid: str) -> bool:
+        return guid in self.definitions
+
+    # Tuples of (reference, source) of the references to the guid
+    def getReferences(self, guid: str) -> list:
+        return self.references.get(guid, [])
+
+    # The definitions referencing the guid
+    def referencedBy(self, guid: str) -> list:
+        return [source for reference, source in self.references.get(guid, [])]
+
+    # The references to guids without a definition with the referenced guid as key
+    def getDangling(self) -> dict:
+        return {guid: references for guid, references in self.references.items() if guid not in self.definitions}
+
+    # The referenced guids with more than one definition. The target of these references is ambiguous
+    def getAmbiguous(self) -> dict:
+        return {guid: [self.definitions[guid]] + self.duplicates[guid] for guid in self.duplicates
+                if guid in self.references}
+
+    def getDuplicates(self) -> dict:
+        return self.duplicates
+
 
 class FrameTable:
     def __init__(self, table, dict, namespace, log=False):
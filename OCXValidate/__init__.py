@@ -5,283 +5,958 @@
 #  notice and this notice are preserved.  This file is offered as-is,
 #  without any warranty.
 
+import concurrent.futures
+import json
 import logging
-from OCXCommon import Material
-from OCXParser import OCXmodel, Panel, Plate
-from OCXCommon import StructurePart
+import multiprocessing
+import pickle
+import time
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from pathlib import Path
+from OCXCommon import ContentHash, WeightRollUp, OCXUnit
+from OCXParser import OCXmodel
 
+ERROR = 'error'
+WARNING = 'warning'
+INFO = 'info'
+
+
+# A validation finding on a model element
+class Finding:
+    def __init__(self, rule: str, severity: str, guid: str, message: str, line=None):
+        self.rule = rule
+        self.severity = severity
+        self.guid = guid
+        self.message = message
+        self.line = line  # The line in the model file if known
+
+    def __str__(self):
+        return self.message
+
+    def asDict(self) -> dict:
+        return {'rule': self.rule, 'severity': self.severity, 'guid': self.guid, 'message': self.message,
+                'line': self.line}
+
+
+# Shared state of a validation pass: the model, one view for each visited element and the cached enumerations
+class ValidationContext:
+    # The element types in visiting order as tuples of (type, model attribute)
+    elementtypes = [('panel', 'panels'),
+                    ('plate', 'plates'),
+                    ('bracket', 'brackets'),
+                    ('stiffener', 'stiffeners'),
+                    ('pillar', 'pillars'),
+                    ('material', 'materials')]
 
-class Validator:
     def __init__(self, ocxmodel: OCXmodel):
         self.model = ocxmodel
         self.dict = ocxmodel.dict
         self.namespace = ocxmodel.namespace
-        self.logger = logging.getLogger(__name__)
+        self.unit = OCXUnit()
+        self.enumerations = {}
 
+    def elements(self, type: str) -> list:
+        return getattr(self.model, dict(ValidationContext.elementtypes)[type])
 
-    def checkModel(self):
-        print('Performing QA checks on model {}'.format(self.model.getModelName()))
-        print('-------------------------------------')
-        self.checkPanelElements()
-        self.checkPhysicalProperties()
-        self.checkDuplicates()
-        self.checkWeights()
-        self.checkFunctionType()
-        self.checkTightness()
-        self.checkPartMaterial()
-        self.checkMaterial()
+    # The legal values of the attribute. Empty if the schema has no enumeration for the attribute
+    def enumeration(self, name: str) -> set:
+        if name not in self.enumerations:
+            self.enumerations[name] = set(self.model.getEnumeration(name))
+        return self.enumerations[name]
+
+    def wrap(self, type: str, element):
+        return ElementView(self, type, element)
+
+
+# The accessors of a model element used by the rules. The view carries the element type given by the engine
+class ElementView:
+    def __init__(self, context: ValidationContext, type: str, element):
+        self.context = context
+        self.dict = context.dict
+        self.type = type
+        self.element = element
+
+    def getGuid(self) -> str:
+        return self.element.get(self.dict['guidref'])
+
+    def getType(self) -> str:
+        return self.element.tag.rsplit('}', 1)[-1]
+
+    def getName(self) -> str:
+        return self.element.get('name')
+
+    def getId(self) -> str:
+        return self.element.get('id')
+
+    # The value of an attribute. Global schema attributes are namespace qualified
+    def attribute(self, name: str):
+        qualified = self.dict.get(name.lower())
+        value = None if qualified is None else self.element.get(qualified)
+        if value is None:
+            value = self.element.get(name)
+        return value
+
+    # The numeric value of the quantity sub element with the dictionary key, None if there is none
+    def quantity(self, key: str, parent=None):
+        parent = self.element if parent is None else parent
+        tag = self.dict.get(key)
+        quantity = None if tag is None else parent.find(tag)
+        if quantity is None or quantity.get('numericvalue') is None:
+            return None
+        return self.context.unit.numericValue(quantity)
+
+    def hasPysicalProperties(self) -> bool:
+        return self.element.find(self.dict['physicalproperties']) is not None
+
+    def getDryWeight(self) -> float:
+        weight = self.quantity('dryweight', self.element.find(self.dict['physicalproperties']))
+        return 0.0 if weight is None else weight
+
+    def isVirtual(self) -> bool:
+        return self.attribute('isVirtual') in ('true', '1')
+
+    def functionType(self):
+        return self.attribute('functionType')
+
+    def hasMaterial(self) -> bool:
+        return self.element.find(self.dict['platematerial']) is not None
+
+    def hasGrade(self) -> bool:
+        return self.attribute('grade') is not None
+
+    def getGrade(self):
+        return self.attribute('grade')
+
+
+# Base class of the validation rules.
+# A rule lists the element types it checks. check() is called once for every element of these types and returns
+# the findings on the element. finish() is called after the pass and returns the findings over the whole model
+class Rule:
+    name = ''
+    title = ''  # Printed above the findings of the rule
+    types = []
+
+    def __init__(self, context: ValidationContext):
+        self.context = context
+        self.model = context.model
+        self.dict = context.dict
+
+    def finding(self, guid: str, message: str, severity=WARNING) -> Finding:
+        return Finding(self.name, severity, guid, message)
+
+    @staticmethod
+    def localName(element) -> str:
+        return element.tag.rsplit('}', 1)[-1]
+
+    def check(self, element, wrapper) -> list:
+        return []
+
+    def finish(self) -> list:
+        return []
+
+    # Rules collecting state over several parts return the state gathered since the last call.
+    # The states of the shards checked in parallel are merged before finish()
+    def state(self):
+        return None
+
+    def merge(self, state):
         return
 
+    def summary(self, findings: list):
+        return
 
-    def checkWeights(self): # Check if reported dry weight of Panel is equal to the sum of child weights
-            print('Checking Panel dry weights')
-            ok = True
-            for object in self.model.getPanels():
-                panel = Panel(self.model, object, self.dict, self.namespace)
-                if panel.hasPysicalProperties():
-                    if not panel.isVirtual():
-                        pw = panel.getDryWeight()
-                        children = self.model.getPanelChildren(panel.getGuid())
-                        cw = 0
-                        for child in children:
-                            object = self.model.getObject(child)
-                            part = StructurePart( object, self.dict)
-                            if part.hasPysicalProperties():
-                                cw = cw + part.getDryWeight()
-                        r = abs(1-cw/pw)
-                        if r > 0.1:
-                            print('Panel with name {} and GUID {}:'.format(panel.getName(),panel.getGuid()))
-                            print('  The Panel DryWeight = {:12.3f} is different from the sum of child weights ={:12.3f}.'\
-                                   .format(pw, cw))
-                            ok = False
-            if ok:
-                print('Panel dry weights OK')
-            print('-------------------------------------')
-            return
 
+class PanelElementsRule(Rule):
+    name = 'panelElements'
+    title = 'Panel elements check:'
+    types = ['panel']
+    # Sub elements that are not allowed to be empty
+    elements = [('composedof', 'ComposedOf'), ('stiffenedby', 'StiffenedBy'), ('cutby', 'CutBy'),
+                ('splitby', 'SplitBy')]
 
-    def checkDuplicates(self):
-        ndupl = len(self.model.getDuplicates())
-        if ndupl > 0:  # Non-unique quids
-            print('Duplicate GUID check')
-            msg =('There are {} non unique guids:'.format(ndupl))
-            print(msg)
-            for object in self.model.getDuplicates():
-                part = StructurePart( object, self.dict)
-                name = part.getName()
-                id = part.getId()
-                tag = part.getType()
-                guid = part.getGuid()
-                msg =('Part {} with name {}, id {}  and GUID {} is a duplicate.'.format(tag, name, id, guid))
-                print(msg)
+    def check(self, element, panel) -> list:
+        findings = []
+        for key, name in PanelElementsRule.elements:
+            sub = element.find(self.dict[key])
+            if sub is not None and sub.find('.//*') is None:
+                findings.append(self.finding(panel.getGuid(), '{} with guid {} has {} with no content'.format(
+                    panel.getType(), panel.getGuid(), name)))
+        return findings
+
+    def summary(self, findings: list):
+        if len(findings) > 0:
+            print('Panels with sub-elements without content: {}'.format(len(findings)))
+        else:
+            print('Panel elements OK')
+
+
+class PhysicalPropertiesRule(Rule):
+    name = 'physicalProperties'
+    title = 'PhysicalProperty existance check on Bracket, Plate & Stiffener:'
+    types = ['plate', 'bracket', 'stiffener']
+
+    def check(self, element, part) -> list:
+        if not part.hasPysicalProperties():
+            return [self.finding(part.getGuid(), '{} with guid {} has no PhysicalProperty'.format(
+                part.getType(), part.getGuid()), INFO)]
+        return []
+
+    def summary(self, findings: list):
+        if len(findings) > 0:
+            print('Structure parts without PhysicalProperty: {}'.format(len(findings)))
+        else:
+            print('PhysicalProperty check OK')
+
+
+class DuplicatesRule(Rule):
+    name = 'duplicates'
+    title = 'Duplicate GUID check'
+
+    # The further definitions of a guid are taken from the reference index built by the model import
+    def finish(self) -> list:
+        findings = []
+        for guid, duplicates in self.model.getReferenceIndex().getDuplicates().items():
+            for element in duplicates:
+                findings.append(self.finding(guid, 'Part {} with name {}, id {}  and GUID {} is a duplicate.'
+                                             .format(self.localName(element), element.get('name'),
+                                                     element.get('id'), guid), ERROR))
+        return findings
+
+    def summary(self, findings: list):
+        if len(findings) > 0:
+            print('There are {} non unique guids.'.format(len(findings)))
         else:
             print('Duplicate GUID check OK')
-        print('-------------------------------------')
-        return
 
-    def checkTightness(self):
-        # loop over Panels
-        print('Panel tightness check')
-        n = 0
-        ni = 0
-        for part in self.model.getPanels():
-            panel = Panel(self.model, part, self.dict, self.namespace)
-            guid = panel.getGuid()
-            type = panel.getType()
-            tightness = part.get(self.dict['tightness'])
-            if tightness == None:
-                OCXCommon.Message(panel,' has no mandatory tightness')
-                n = n + 1
-            else:
-                values = self.model.getEnumeration('tightness')
-                if tightness not in values:
-                    msg =  '{} with guid {} has illegal tightness value {}'.format(type, guid, tightness)
-                    print(msg)
-                    ni = ni +1
-        if n > 0:
-            msg =('There are {} panel(s) without mandatory tightness attribute.'.format(n))
-            print(msg)
-        elif ni > 0:
-            msg =('There are {} panel(s) with illegal tightness value.'.format(ni))
-            print('Legal values are: {}'.format(self.model.getEnumeration('tightness')))
-            print(msg)
+
+# Check that every GUIDRef reference resolves to exactly one definition.
+# Uses the reference index built by the model import
+class ReferencesRule(Rule):
+    name = 'references'
+    title = 'GUIDRef reference check:'
+
+    def finish(self) -> list:
+        findings = []
+        index = self.model.getReferenceIndex()
+        for guid, references in index.getDangling().items():
+            for reference, source in references:
+                findings.append(self.finding(self.sourceGuid(source), '{} {} refers to the GUIDRef {} which does '
+                                             'not exist.'.format(self.describe(source), self.localName(reference),
+                                                                 guid), ERROR))
+        for guid, definitions in index.getAmbiguous().items():
+            findings.append(self.finding(guid, 'The GUIDRef {} referenced by {} elements is defined {} times: {}.'
+                                         .format(guid, len(index.getReferences(guid)), len(definitions),
+                                                 ', '.join(self.localName(definition) for definition in definitions)),
+                                         ERROR))
+        return findings
+
+    def sourceGuid(self, source) -> str:
+        return '' if source is None else self.model.getGUID(source)
+
+    def describe(self, source) -> str:
+        if source is None:
+            return 'The'
+        return '{} with name {} and GUID {}:'.format(self.localName(source), source.get('name'),
+                                                    self.model.getGUID(source))
+
+    def summary(self, findings: list):
+        if len(findings) > 0:
+            print('There are {} dangling or ambiguous references.'.format(len(findings)))
         else:
-            print('Tightness check OK')
-        print('-------------------------------------')
-        return
+            print('GUIDRef references OK')
 
-    def checkPhysicalProperties(self):
-            # Check Existence of properties
-            nprops = 0
-            for object in self.model.getPlates():
-                part = StructurePart(object, self.dict)
-                if not part.hasPysicalProperties():
-                    self.logger.info('{} with guid {} has no PhysicalProperty'.format(part.getType(), part.getGuid()))
-                    nprops = nprops + 1
-            for object in self.model.getBrackets():
-                part = StructurePart(object, self.dict)
-                if not part.hasPysicalProperties():
-                    self.logger.info('{} with guid {} has no PhysicalProperty'.format(part.getType(), part.getGuid()))
-                    nprops = nprops + 1
-            for object in self.model.getStiffeners():
-                part = StructurePart(object, self.dict)
-                if not part.hasPysicalProperties():
-                    self.logger.info('{} with guid {} has no PhysicalProperty'.format(part.getType(), part.getGuid()))
-                    nprops = nprops + 1
-            if nprops > 0:
-                print('PhysicalProperty existance check on Bracket, Plate & Stiffener:')
-                print('Structure parts without PhysicalProperty: {}'.format(nprops))
+
+# Check if reported dry weight of Panel is equal to the sum of child weights.
+# The part weights are collected during the pass and rolled up to the panels when the pass is finished
+class WeightsRule(Rule):
+    name = 'weights'
+    title = 'Checking Panel dry weights'
+    types = ['panel', 'plate', 'bracket', 'stiffener', 'pillar']
+
+    def __init__(self, context: ValidationContext):
+        super().__init__(context)
+        self.weights = {}  # The part dry weight with the guid as key
+        self.panels = []  # Tuples of (guid, name, dry weight) of the non virtual panels with weights
+
+    def check(self, element, part) -> list:
+        if part.hasPysicalProperties():
+            if part.type == 'panel':
+                if not part.isVirtual():
+                    self.panels.append((part.getGuid(), part.getName(), part.getDryWeight()))
             else:
-                print('PhysicalProperty check OK')
-            print('-------------------------------------')
-            return
+                self.weights[part.getGuid()] = part.getDryWeight()
+        return []
 
-    def checkPartMaterial(self):
-        print('Materials existence check:')
-        # Check Existence of material on plate and brackets
-        pm = 0
-        pg = 0
-        # Loop over plates
-        for part in self.model.getPlates():
-            plate = Plate(self.model, part, self.dict, self.namespace)
-            type = plate.getType()
-            guid = plate.getGuid()
-            if not plate.hasMaterial():
-                msg = '{} with guid {} has no material'.format(type, guid)
-                print(msg)
-                pm = pm + 1
-        # Loop over brackets
-        for part in self.model.getBrackets():
-            plate = Plate(self.model, part, self.dict, self.namespace)
-            type = plate.getType()
-            guid = plate.getGuid()
-            if not plate.hasMaterial():
-                msg = '{} with guid {} has no material'.format(type, guid)
-                print(msg)
-                pm = pm + 1
-        if pm > 0:
-            print('Structure parts without Material: {}'.format(pm))
+    def state(self):
+        state = (self.weights, self.panels)
+        self.weights = {}
+        self.panels = []
+        return state
+
+    def merge(self, state):
+        weights, panels = state
+        self.weights.update(weights)
+        self.panels.extend(panels)
+
+    def finish(self) -> list:
+        findings = []
+        names = {guid: name for guid, name, pw in self.panels}
+        rollup = WeightRollUp(self.weights, {guid: self.model.getPanelChildren(guid) for guid in names},
+                              {guid: pw for guid, name, pw in self.panels})
+        for guid, pw, cw in rollup.deviating(0.1):
+            name = names[guid]
+            findings.append(self.finding(guid, 'Panel with name {} and GUID {}:\n  The Panel DryWeight = {:12.3f}'
+                                               ' is different from the sum of child weights ={:12.3f}.'
+                                         .format(name, guid, pw, cw)))
+        return findings
+
+    def summary(self, findings: list):
+        if len(findings) == 0:
+            print('Panel dry weights OK')
+
+
+# Base class of the rules checking an attribute against the legal values of an enumeration.
+# A missing value is an error and an illegal value a warning
+class EnumerationRule(Rule):
+    types = ['panel']
+    subject = 'panel'
+    attribute = ''  # The attribute and the enumeration name
+
+    def value(self, element, wrapper):
+        return None
+
+    def check(self, element, wrapper) -> list:
+        value = self.value(element, wrapper)
+        if value is None:
+            return [self.finding(wrapper.getGuid(), '{} with guid {} has no mandatory {}'.format(
+                wrapper.getType(), wrapper.getGuid(), self.attribute), ERROR)]
+        legal = self.context.enumeration(self.attribute)
+        if len(legal) > 0 and value not in legal:
+            return [self.finding(wrapper.getGuid(), '{} with guid {} has illegal {} value {}'.format(
+                wrapper.getType(), wrapper.getGuid(), self.attribute, value), WARNING)]
+        return []
+
+    def summary(self, findings: list):
+        missing = sum(1 for finding in findings if finding.severity == ERROR)
+        if missing > 0:
+            print('There are {} {}(s) without mandatory {}.'.format(missing, self.subject, self.attribute))
+        elif len(findings) > 0:
+            print('Legal values are: {}'.format(sorted(self.context.enumeration(self.attribute))))
+            print('There are {} {}(s) with illegal {} value.'.format(len(findings), self.subject, self.attribute))
+        else:
+            print('{} check OK'.format(self.attribute))
+
+
+class TightnessRule(EnumerationRule):
+    name = 'tightness'
+    title = 'Panel tightness check'
+    attribute = 'tightness'
+
+    def value(self, element, panel):
+        return element.get(self.dict['tightness'])
+
+
+class FunctionTypeRule(EnumerationRule):
+    name = 'functionType'
+    title = 'Panel functionType check'
+    attribute = 'functionType'
+
+    def value(self, element, panel):
+        return panel.functionType()
+
+
+class PartMaterialRule(Rule):
+    name = 'partMaterial'
+    title = 'Materials existence check:'
+    types = ['plate', 'bracket']
+
+    def check(self, element, plate) -> list:
+        if not plate.hasMaterial():
+            return [self.finding(plate.getGuid(), '{} with guid {} has no material'.format(
+                plate.getType(), plate.getGuid()), ERROR)]
+        return []
+
+    def summary(self, findings: list):
+        if len(findings) > 0:
+            print('Structure parts without Material: {}'.format(len(findings)))
         else:
             print('Materials check OK')
-        print('-------------------------------------')
-        return
 
-    def checkMaterial(self):
-        print('Materials check:')
-        # Check Existence of material grade
-        pm = 0
-        pg = 0
-        # Loop over materials
-        for mat in self.model.getMaterials():
-            material = Material(mat, self.dict, False)
-            type = material.getType()
-            guid = material.getGuid()
-            if not material.hasGrade():
-                pm = pm + 1
-                msg = '{} with guid {} has no mandatory material grade'.format(type, guid)
-                print(msg)
-            else:
-                grade = material.getGrade()
-                values = self.model.getEnumeration('grade')
-                if grade not in values:
-                    msg =  '{} with guid {} has illegal material grade {}'.format(type, guid, grade)
-                    print(msg)
-                    pg = pg + 1
-            if material.getDensity()== None:
-                msg = '{} with guid {} has no mandatory Density'.format(type, guid)
-                print(msg)
-            if material.getYoungsModulus()== None:
-                msg = '{} with guid {} has no mandatory YoungsModulus'.format(type, guid)
-                print(msg)
-            if material.getPoissonRatio()== None:
-                msg = '{} with guid {} has no mandatory PoissonRatio'.format(type, guid)
-                print(msg)
-            if material.getYieldStress()== None:
-                msg = '{} with guid {} has no mandatory YieldStress'.format(type, guid)
-                print(msg)
-        if pm > 0:
-            print('Materials without mandatory grade: {}'.format(pm))
-        elif pg > 0:
-            msg = ('There are {} materials(s) with illegal material grade.'.format(pg))
-            print('Legal values are: {}'.format(self.model.getEnumeration('grade')))
-            print(msg)
+
+class MaterialGradeRule(EnumerationRule):
+    name = 'materialGrade'
+    title = 'Materials check:'
+    types = ['material']
+    subject = 'material'
+    attribute = 'grade'
+
+    def value(self, element, material):
+        if not material.hasGrade():
+            return None
+        return material.getGrade()
+
+
+class MaterialPropertiesRule(Rule):
+    name = 'materialProperties'
+    title = 'Material properties check:'
+    types = ['material']
+    # The mandatory material properties as tuples of (name, dictionary key)
+    properties = [('Density', 'density'), ('YoungsModulus', 'youngsmodulus'),
+                  ('PoissonRatio', 'poissonratio'), ('YieldStress', 'yieldstress')]
+
+    def check(self, element, material) -> list:
+        findings = []
+        for name, key in MaterialPropertiesRule.properties:
+            if material.quantity(key) is None:
+                findings.append(self.finding(material.getGuid(), '{} with guid {} has no mandatory {}'.format(
+                    material.getType(), material.getGuid(), name)))
+        return findings
+
+    def summary(self, findings: list):
+        if len(findings) > 0:
+            print('Missing mandatory material properties: {}'.format(len(findings)))
         else:
-            print('Material grade check OK')
-        print('-------------------------------------')
-        return
+            print('Material properties check OK')
 
-    def checkPanelElements(self):
-        print('Panel elements check:')
-        # Check for empty sub elements. This is not allowed
-        pm = 0
-        # Loop over Panels
-        for part in self.model.getPanels():
-            panel = Panel(self.model, part, self.dict, self.namespace)
-            type = panel.getType()
-            guid = panel.getGuid()
-            element = part.find(self.dict['composedof'])
-            if not element == None:
-                children = element.find('.//*')
-                if children == None:
-                    msg = '{} with guid {} has ComposedOf with no content'.format(type, guid)
-                    print(msg)
-                    pm = pm + 1
-            element = part.find(self.dict['stiffenedby'])
-            if not element == None:
-                children = element.find('.//*')
-                if children == None:
-                    msg = '{} with guid {} has StiffenedBy with no content'.format(type, guid)
-                    print(msg)
-                    pm = pm + 1
-            element = part.find(self.dict['cutby'])
-            if not element == None:
-                children = element.find('.//*')
-                if children == None:
-                    msg = '{} with guid {} has CutBy with no content'.format(type, guid)
-                    print(msg)
-                    pm = pm + 1
-            element = part.find(self.dict['splitby'])
-            if not element == None:
-                children = element.find('.//*')
-                if children == None:
-                    msg = '{} with guid {} has SplitBy with no content'.format(type, guid)
-                    print(msg)
-                    pm = pm + 1
-        if pm > 0:
-            print('Panels with sub-elements without content: {}'.format(pm))
+
+# Runs a set of rules in a single pass over the model elements.
+# Each element is wrapped once and handed to the rules registered for its type
+class RuleEngine:
+    def __init__(self, ocxmodel: OCXmodel, rules: list):
+        self.context = ValidationContext(ocxmodel)
+        self.rules = [rule(self.context) for rule in rules]
+        self.dispatch = {}  # The rules with the element type as key
+        for rule in self.rules:
+            for type in rule.types:
+                self.dispatch.setdefault(type, []).append(rule)
+        self.findings = {rule.name: [] for rule in self.rules}
+        self.seconds = {rule.name: 0.0 for rule in self.rules}  # The wall time of each rule
+        self.items = {rule.name: 0 for rule in self.rules}  # The number of elements visited by each rule
+        self.cache = None  # The findings cache file of the incremental validation
+        self.contenthash = None
+        self.previous = {}  # The cached records of the previous run with (type, guid) as key
+        self.records = {}  # Tuples of (fingerprint, findings, states) with (type, guid) as key
+        self.states = {}  # The rule states of the parts not yet merged with the rule name as key
+
+    # Reuse the findings of the parts not changed since the last run.
+    # The fingerprint of a panel covers its child parts, so a panel is checked again if any child has changed
+    def incremental(self, cachefile: str):
+        self.cache = Path(cachefile)
+        self.contenthash = ContentHash(self.context.dict['guidref'])
+        if not self.cache.is_file():
+            return
+        try:
+            with open(self.cache, 'rb') as fd:
+                key, records = pickle.load(fd)
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError):
+            return
+        # The findings are only valid for the same set of rules and the same schema
+        if key == self.cacheKey():
+            self.previous = records
+
+    # The rule names and the stamp of the schema the enumerations are read from
+    def cacheKey(self) -> tuple:
+        schema = Path(self.context.model.ocxschema)
+        stamp = None
+        if schema.is_file():
+            stat = schema.stat()
+            stamp = (str(schema.resolve()), stat.st_size, stat.st_mtime_ns)
+        return [rule.name for rule in self.rules], stamp
+
+    def save(self):
+        if self.cache is None:
+            return
+        records = {key: record for key, record in self.records.items() if record is not None}
+        reused = sum(1 for key, record in records.items()
+                     if self.previous.get(key) is not None and self.previous[key][0] == record[0])
+        print('Reused the findings of {} of {} parts'.format(reused, len(self.records)))
+        try:
+            with open(self.cache, 'wb') as fd:
+                pickle.dump((self.cacheKey(), records), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            print('Could not write the findings cache {}'.format(self.cache))
+
+    def visit(self, type: str, elements: list):
+        rules = self.dispatch.get(type)
+        if rules is None:
+            return
+        for rule in rules:
+            self.items[rule.name] += len(elements)
+        for element in elements:
+            if self.cache is not None:
+                self.visitIncremental(type, element, rules)
+                continue
+            wrapper = self.context.wrap(type, element)
+            for rule in rules:
+                start = time.perf_counter()
+                self.findings[rule.name].extend(rule.check(element, wrapper))
+                self.seconds[rule.name] += time.perf_counter() - start
+
+    # Check a part or reuse the cached findings and rule states if the part fingerprint has not changed.
+    # The state of each rule is taken after every check and merged when the pass is finished
+    def visitIncremental(self, type: str, element, rules: list):
+        key = (type, self.context.model.getGUID(element))
+        fingerprint = self.contenthash.hexdigest(element)
+        record = self.previous.get(key)
+        if key in self.records or record is None or record[0] != fingerprint:
+            wrapper = self.context.wrap(type, element)
+            findings = {}
+            states = {}
+            for rule in rules:
+                start = time.perf_counter()
+                findings[rule.name] = rule.check(element, wrapper)
+                self.seconds[rule.name] += time.perf_counter() - start
+                state = rule.state()
+                if state is not None:
+                    states[rule.name] = state
+            record = (fingerprint, findings, states)
+        for rule in rules:
+            self.findings[rule.name].extend(record[1].get(rule.name, []))
+            if rule.name in record[2]:
+                self.states.setdefault(rule.name, []).append(record[2][rule.name])
+        # Parts with duplicate guids are always checked
+        if key in self.records:
+            self.records[key] = None
         else:
-            print('Panel elements OK')
+            self.records[key] = record
+
+    def mergeStates(self):
+        for rule in self.rules:
+            for state in self.states.get(rule.name, []):
+                rule.merge(state)
+        self.states = {}
+
+    def finish(self):
+        self.mergeStates()
+        for rule in self.rules:
+            start = time.perf_counter()
+            self.findings[rule.name].extend(rule.finish())
+            self.seconds[rule.name] += time.perf_counter() - start
+
+    def run(self) -> list:
+        for type, attribute in ValidationContext.elementtypes:
+            if type in self.dispatch:
+                self.visit(type, self.context.elements(type))
+        self.finish()
+        return self.getFindings()
+
+    # Partition the elements into shards of one panel with its child parts.
+    # The parts outside panels and the materials are sharded in groups of about the same size
+    def shards(self, groupsize=1000) -> list:
+        model = self.context.model
+        parent = {}  # The panel guid with the child guid as key
+        panels = {}  # The shard of each panel as a dict of the elements with the type as key
+        for panel in self.context.elements('panel'):
+            guid = model.getGUID(panel)
+            panels.setdefault(guid, {}).setdefault('panel', []).append(panel)
+            for child in model.getPanelChildren(guid) or []:
+                parent[child] = guid
+        others = []  # Tuples of (type, element) outside panels
+        for type, attribute in ValidationContext.elementtypes:
+            if type == 'panel' or type not in self.dispatch:
+                continue
+            for element in self.context.elements(type):
+                guid = parent.get(model.getGUID(element))
+                if guid is None:
+                    others.append((type, element))
+                else:
+                    panels[guid].setdefault(type, []).append(element)
+        shards = []
+        for shard in panels.values():
+            shards.append([(type, shard[type]) for type, attribute in ValidationContext.elementtypes
+                           if type in shard])
+        for start in range(0, len(others), groupsize):
+            shard = {}
+            for type, element in others[start:start + groupsize]:
+                shard.setdefault(type, []).append(element)
+            shards.append(list(shard.items()))
+        return shards
+
+    # Check the shards on a pool of forked worker processes sharing the model.
+    # The findings are merged in shard order and the cross part checks run on the merged states
+    def runParallel(self, processes: int) -> list:
+        global _engine
+        if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return self.run()
+        self.shardlist = self.shards()
+        chunksize = max(1, len(self.shardlist) // (4 * processes))
+        _engine = self
+        try:
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                for findings, states, records, seconds, items in pool.imap(_checkShard, range(len(self.shardlist)),
+                                                                           chunksize):
+                    for rule in self.rules:
+                        self.findings[rule.name].extend(findings[rule.name])
+                        rule.merge(states[rule.name])
+                        self.seconds[rule.name] += seconds[rule.name]
+                        self.items[rule.name] += items[rule.name]
+                    for key, record in records.items():
+                        self.records[key] = None if key in self.records else record
+        finally:
+            _engine = None
+        print('Checked {} shards on {} processes'.format(len(self.shardlist), processes))
+        self.finish()
+        return self.getFindings()
+
+    # Runs in a worker process: the findings, the rule states, the cache records and the rule timings of a shard
+    def checkShard(self, index: int) -> tuple:
+        self.findings = {rule.name: [] for rule in self.rules}
+        self.seconds = {rule.name: 0.0 for rule in self.rules}
+        self.items = {rule.name: 0 for rule in self.rules}
+        self.records = {}
+        for type, elements in self.shardlist[index]:
+            self.visit(type, elements)
+        self.mergeStates()
+        return self.findings, {rule.name: rule.state() for rule in self.rules}, self.records, self.seconds, \
+            self.items
+
+    # All findings in rule order
+    def getFindings(self) -> list:
+        findings = []
+        for rule in self.rules:
+            findings.extend(self.findings[rule.name])
+        return findings
+
+    # The wall time, visited elements and number of findings by severity of each rule.
+    # The time of the parallel checks is the sum over the worker processes
+    def getStatistics(self) -> list:
+        statistics = []
+        for rule in self.rules:
+            findings = self.findings[rule.name]
+            statistics.append({'rule': rule.name, 'title': rule.title, 'seconds': self.seconds[rule.name],
+                               'items': self.items[rule.name], 'findings': len(findings),
+                               ERROR: sum(1 for finding in findings if finding.severity == ERROR),
+                               WARNING: sum(1 for finding in findings if finding.severity == WARNING),
+                               INFO: sum(1 for finding in findings if finding.severity == INFO)})
+        return statistics
+
+    def report(self, logger):
+        for rule in self.rules:
+            print(rule.title)
+            for finding in self.findings[rule.name]:
+                if finding.severity == INFO:
+                    logger.info(finding.message)
+                else:
+                    print(finding.message)
+            rule.summary(self.findings[rule.name])
+            print('-------------------------------------')
+
+
+# Validates the model file against the OCX xsd.
+# xmlschema is used if it is installed. It validates the model lazily while the file is read and the compiled
+# schema is cached in the file <xsd>.pickle as long as the xsd is unchanged. Otherwise the model is validated with lxml
+# while it is parsed. lxml stops at the first violation. Without either package the validation is skipped with a warning.
+# xmlschema only reports the element path of a violation. The lines of the paths are found in an expat pass
+# over the model which is only made if there are violations.
+# The validation can run in a separate process while the model is imported
+class SchemaValidator:
+    name = 'schema'
+    title = 'Schema validation:'
+
+    def __init__(self, schema: str, maxerrors=1000):
+        self.schema = Path(schema)
+        self.cache = self.schema.parent / (self.schema.name + '.pickle')
+        self.maxerrors = maxerrors  # The validation stops after this number of errors
+        self.findings = []
+        self.seconds = 0.0
+        self.items = 0  # The number of validated files
+        self.worker = None
+        self.future = None
+        self.compiled = None  # The compiled lxml schema
+
+    # The compiled xmlschema schema, loaded from the cache if the xsd is unchanged
+    def compile(self, xmlschema):
+        stat = self.schema.stat()
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if self.cache.is_file():
+            try:
+                with open(self.cache, 'rb') as fd:
+                    cached, schema = pickle.load(fd)
+                if cached == stamp:
+                    return schema
+            except (OSError, pickle.UnpicklingError, ValueError, EOFError, AttributeError, ImportError):
+                pass
+        schema = xmlschema.XMLSchema(str(self.schema))
+        try:
+            with open(self.cache, 'wb') as fd:
+                pickle.dump((stamp, schema), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            print('Could not write the schema cache {}'.format(self.cache))
+        return schema
+
+    # Tuples of (line, element path, message) of the schema violations
+    def errors(self, ocxfile: str):
+        try:
+            import xmlschema
+        except ImportError:
+            xmlschema = None
+        if xmlschema is not None:
+            schema = self.compile(xmlschema)
+            resource = xmlschema.XMLResource(ocxfile, lazy=True)
+            for error in schema.iter_errors(resource):
+                message = error.reason if error.reason is not None else str(error)
+                yield getattr(error, 'sourceline', None), error.path, message
+            return
+        from lxml import etree
+        if self.compiled is None:
+            self.compiled = etree.XMLSchema(etree.parse(str(self.schema)))
+        try:
+            for event, element in etree.iterparse(ocxfile, events=('end',), schema=self.compiled):
+                element.clear(keep_tail=True)  # The schema is checked on the parser events, the tree is not needed
+        except etree.XMLSyntaxError as error:
+            for entry in error.error_log:
+                yield entry.line, None, entry.message
+
+    # The path without namespace prefixes and first sibling indexes, as the index is only given for repeated tags
+    @staticmethod
+    def normalPath(path: str) -> str:
+        steps = []
+        for step in path.split('/'):
+            step = step.rsplit('}', 1)[-1].rsplit(':', 1)[-1]
+            if step.endswith('[1]'):
+                step = step[:-3]
+            steps.append(step)
+        return '/'.join(steps)
+
+    # The line of each of the normalised element paths in one expat pass over the model
+    def pathLines(self, ocxfile: str, paths: set) -> dict:
+        lines = {}
+        names = []  # The path steps of the open elements
+        counts = [{}]  # The count of the child tags of the open elements
+        parser = xml.parsers.expat.ParserCreate()
+
+        def startElement(name, attributes):
+            name = name.rsplit(':', 1)[-1]
+            siblings = counts[-1]
+            siblings[name] = siblings.get(name, 0) + 1
+            names.append(name if siblings[name] == 1 else '{}[{}]'.format(name, siblings[name]))
+            counts.append({})
+            path = '/' + '/'.join(names)
+            if path in paths and path not in lines:
+                lines[path] = parser.CurrentLineNumber
+
+        def endElement(name):
+            names.pop()
+            counts.pop()
+
+        parser.StartElementHandler = startElement
+        parser.EndElementHandler = endElement
+        with open(ocxfile, 'rb') as fd:
+            parser.ParseFile(fd)
+        return lines
+
+    def validate(self, ocxfile: str) -> list:
+        start = time.perf_counter()
+        errors = []
+        try:
+            for error in self.errors(str(ocxfile)):
+                if len(errors) == self.maxerrors:
+                    print('Schema validation stopped after {} errors'.format(self.maxerrors))
+                    break
+                errors.append(error)
+        except ImportError:
+            self.findings = [Finding(SchemaValidator.name, WARNING, '',
+                                     'Schema validation skipped: install xmlschema or lxml to validate against {}'
+                                     .format(self.schema.name))]
+            self.seconds = time.perf_counter() - start
+            return self.findings
+        paths = set(SchemaValidator.normalPath(path) for line, path, message in errors
+                    if line is None and path is not None)
+        lines = self.pathLines(str(ocxfile), paths) if len(paths) > 0 else {}
+        self.findings = []
+        for line, path, message in errors:
+            if line is None and path is not None:
+                line = lines.get(SchemaValidator.normalPath(path))
+                message = '{}: {}'.format(path, message)
+            text = message if line is None else 'Line {}: {}'.format(line, message)
+            self.findings.append(Finding(SchemaValidator.name, ERROR, '', text, line))
+        self.items = 1
+        self.seconds = time.perf_counter() - start
+        return self.findings
+
+    # Validate the model in a worker process. The findings are collected by wait()
+    def start(self, ocxfile: str):
+        self.worker = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+        try:
+            self.future = self.worker.submit(_validateSchema, str(self.schema), str(ocxfile), self.maxerrors)
+        except BaseException:
+            self.worker.shutdown()
+            self.worker = None
+            raise
+
+    def wait(self) -> list:
+        if self.future is not None:
+            try:
+                self.findings, self.seconds = self.future.result()
+                self.items = 1
+            finally:
+                self.worker.shutdown()
+                self.worker = None
+                self.future = None
+        return self.findings
+
+    def getFindings(self) -> list:
+        return self.findings
+
+    def getStatistics(self) -> list:
+        return [{'rule': SchemaValidator.name, 'title': SchemaValidator.title, 'seconds': self.seconds,
+                 'items': self.items, 'findings': len(self.findings),
+                 ERROR: sum(1 for finding in self.findings if finding.severity == ERROR),
+                 WARNING: sum(1 for finding in self.findings if finding.severity == WARNING),
+                 INFO: sum(1 for finding in self.findings if finding.severity == INFO)}]
+
+    def report(self):
+        print(SchemaValidator.title)
+        for finding in self.findings:
+            print(finding.message)
+        errors = sum(1 for finding in self.findings if finding.severity == ERROR)
+        if len(self.findings) == 0:
+            print('The model is valid against the schema {}'.format(self.schema.name))
+        elif errors > 0:
+            print('There are {} schema violations.'.format(errors))
         print('-------------------------------------')
-        return
 
-    def checkFunctionType(self):
-        # loop over Panels
-        print('Panel functionType check')
-        n = 0
-        ni = 0
-        for part in self.model.getPanels():
-            panel = Panel(self.model, part, self.dict, self.namespace)
-            guid = panel.getGuid()
-            type = panel.getType()
-            function = panel.functionType()
-            if function  == None:
-                msg = Message(panel,' has no mandatory functionType')
-                print(msg)
-                n = n + 1
-            else:
-                values = self.model.getEnumeration('functionType')
-                if function not in values:
-                    msg =  '{} with guid {} has illegal functionType {}'.format(type, guid, function)
-                    print(msg)
-                    ni = ni +1
-        if n > 0:
-            msg =('There are {} panel(s) without mandatory functionType.'.format(n))
-            print(msg)
-        elif ni > 0:
-            msg =('There are {} panel(s) with illegal functionType value.'.format(ni))
-            print('Legal values are: {}'.format(self.model.getEnumeration('functionType')))
-            print(msg)
-        else:
-            print('functionType check OK')
+
+# The findings and rule statistics of the validation runs on a model, exported for CI pipelines
+class ValidationReport:
+    def __init__(self, name: str):
+        self.name = name  # The model name
+        self.findings = []
+        self.statistics = []  # The statistics of each rule run
+
+    # Add the findings and statistics of a RuleEngine or SchemaValidator
+    def add(self, engine):
+        self.findings.extend(engine.getFindings())
+        self.statistics.extend(engine.getStatistics())
+
+    # One JSON object on each line: a 'rule' record with the statistics of each rule followed by a 'finding'
+    # record for each finding
+    def writeJsonLines(self, file: str):
+        with open(file, 'w') as fd:
+            for statistics in self.statistics:
+                fd.write(json.dumps(dict(record='rule', model=self.name, **statistics)) + '\n')
+            for finding in self.findings:
+                fd.write(json.dumps(dict(record='finding', model=self.name, **finding.asDict())) + '\n')
+        print('Wrote {} findings to {}'.format(len(self.findings), file))
+
+    # A test suite for the model with a test case for each rule.
+    # A rule with errors fails, the warnings and infos are written to the test case output
+    def writeJUnit(self, file: str):
+        findings = {}
+        for finding in self.findings:
+            findings.setdefault(finding.rule, []).append(finding)
+        suite = ET.Element('testsuite', name=self.name, tests=str(len(self.statistics)),
+                           failures=str(sum(1 for statistics in self.statistics if statistics[ERROR] > 0)),
+                           errors='0', time='{:.6f}'.format(sum(statistics['seconds'] for statistics in self.statistics)))
+        for statistics in self.statistics:
+            case = ET.SubElement(suite, 'testcase', classname='OCXValidate.' + self.name, name=statistics['rule'],
+                                 time='{:.6f}'.format(statistics['seconds']))
+            properties = ET.SubElement(case, 'properties')
+            for key in ('items', 'findings', ERROR, WARNING, INFO):
+                ET.SubElement(properties, 'property', name=key, value=str(statistics[key]))
+            errors = [finding for finding in findings.get(statistics['rule'], []) if finding.severity == ERROR]
+            others = [finding for finding in findings.get(statistics['rule'], []) if finding.severity != ERROR]
+            if len(errors) > 0:
+                failure = ET.SubElement(case, 'failure', type=statistics['rule'],
+                                        message='{} errors'.format(len(errors)))
+                failure.text = '\n'.join('{} {}'.format(finding.guid, finding.message) for finding in errors)
+            if len(others) > 0:
+                output = ET.SubElement(case, 'system-out')
+                output.text = '\n'.join('{} {} {}'.format(finding.severity, finding.guid, finding.message)
+                                         for finding in others)
+        ET.ElementTree(suite).write(file, encoding='utf-8', xml_declaration=True)
+        print('Wrote the JUnit report to {}'.format(file))
+
+
+class Validator:
+    rules = [PanelElementsRule, PhysicalPropertiesRule, DuplicatesRule, ReferencesRule, WeightsRule,
+             FunctionTypeRule, TightnessRule, PartMaterialRule, MaterialGradeRule, MaterialPropertiesRule]
+
+    def __init__(self, ocxmodel: OCXmodel):
+        self.model = ocxmodel
+        self.dict = ocxmodel.dict
+        self.namespace = ocxmodel.namespace
+        self.logger = logging.getLogger(__name__)
+        self.findings = []
+        self.processes = 1
+        self.cache = None
+        self.report = ValidationReport(ocxmodel.ocxfile.name)
+
+    # Check the parts on a pool of worker processes
+    def parallel(self, processes: int):
+        self.processes = processes
+
+    # Keep the findings of each part in the cache file and only check the parts changed since the last run
+    def incremental(self, cachefile: str):
+        self.cache = cachefile
+
+    # Run the rules in one pass over the model and print the findings
+    def runRules(self, rules: list) -> list:
+        engine = RuleEngine(self.model, rules)
+        if self.cache is not None:
+            engine.incremental(self.cache)
+        self.findings = engine.runParallel(self.processes)
+        engine.save()
+        engine.report(self.logger)
+        self.report.add(engine)
+        return self.findings
+
+    # Report the findings of a schema validation started before the model import
+    def checkSchema(self, schema: SchemaValidator) -> list:
+        findings = schema.wait()
+        schema.report()
+        self.report.add(schema)
+        return findings
+
+    def writeJsonLines(self, file: str):
+        self.report.writeJsonLines(file)
+
+    def writeJUnit(self, file: str):
+        self.report.writeJUnit(file)
+
+    def checkModel(self):
+        print('Performing QA checks on model {}'.format(self.model.ocxfile.name))
         print('-------------------------------------')
-        return
+        return self.runRules(Validator.rules)
+
+    def checkWeights(self):
+        return self.runRules([WeightsRule])
+
+    def checkDuplicates(self):
+        return self.runRules([DuplicatesRule])
+
+    def checkReferences(self):
+        return self.runRules([ReferencesRule])
+
+    def checkTightness(self):
+        return self.runRules([TightnessRule])
+
+    def checkPhysicalProperties(self):
+        return self.runRules([PhysicalPropertiesRule])
+
+    def checkPartMaterial(self):
+        return self.runRules([PartMaterialRule])
+
+    def checkMaterial(self):
+        return self.runRules([MaterialGradeRule, MaterialPropertiesRule])
+
+    def checkPanelElements(self):
+        return self.runRules([PanelElementsRule])
+
+    def checkFunctionType(self):
+        return self.runRules([FunctionTypeRule])
+
+
+# The engine shared with the forked worker processes
+_engine = None
+
+
+def _checkShard(index: int) -> tuple:
+    return _engine.checkShard(index)
+
+
+def _validateSchema(schema: str, ocxfile: str, maxerrors: int) -> tuple:
+    validator = SchemaValidator(schema, maxerrors)
+    findings = validator.validate(ocxfile)
+    return findings, validator.seconds
@@ -7,7 +7,7 @@
 
 import argparse
 import os, pathlib, logging
-from  OCXDiff import DiffAgent
+from  OCXDiff import DiffAgent, StreamDiff, RevisionChain
 from OCXParser import OCXmodel
 from OCXCommon import StructurePart
 from OCXJson import TrackChanges
@@ -30,6 +30,16 @@ def main():
     argp.add_argument("-log", "--logfile", default='diffOCX.log', type=str, help="Output logging information. This is useful for debugging")
     argp.add_argument("-level", "--level", default='WARNING', type=str, help='Log level. DEBUG is most verbose')
     argp.add_argument("-m", "--map", default=False, type=bool, help="Map OCX guids to input guids")
+    argp.add_argument("-s", "--stream", action='store_true',
+                      help="Compare the models in bounded memory without importing them. The changed parts are listed "
+                           "in the output file. The JSON property files are not written")
+    argp.add_argument("-r", "--runsize", default=200000, type=int, help="Number of parts in each sorted run of the streaming diff")
+    argp.add_argument("-t", "--tolerance", default=0.0, type=float,
+                      help="Geometric diff tolerance. Modified parts with geometry changes within the tolerance are reported as unchanged")
+    argp.add_argument("-c", "--chain", default='', type=str,
+                      help="Comma separated list of model revisions in order. Writes the change history of each part to the output file")
+    argp.add_argument("-j", "--processes", default=None, type=int,
+                      help="Number of worker processes importing the revisions of the chain. The default is at most 4")
     argp.add_argument("-e", "--entitymap", default="midship_2011_entities_meta.json", type=str, help="Entity map from Sesam Insight") # Used to filter guids
 
     options = argp.parse_args()
@@ -55,10 +65,26 @@ def main():
     logger.info('Baseline model: {}'.format(options.baseline))
     logger.info('Revised model : {}'.format(options.new))
 
+    if options.chain:
+        chain = RevisionChain(options.chain.split(','), options.schema, options.output, options.log,
+                              options.processes)
+        chain.compare()
+        chain.writeTimelines()
+        chain.printTimings()
+        return
+    if options.stream:
+        diff = StreamDiff(options.baseline, options.new, options.schema, options.output, options.log, options.runsize)
+        diff.compare()
+        diff.writeReport()
+        diff.printTimings()
+        return
     diff = DiffAgent(options.baseline,options.new, options.schema,options.logfile, True)
+    if options.tolerance > 0:
+        diff.geometricDiff(options.tolerance)
     diff.dryWeightChange('JSON_outputfiles/dryweightchange_properties.json',options.map, options.entitymap)
     diff.revisedChanges('JSON_outputfiles/revisedmodel_properties.json',options.map, options.entitymap)
     diff.baselineChanges('JSON_outputfiles/baselinemodel_properties.json',options.map, options.entitymap)
+    diff.printTimings()
 
 '''
     nd = 0
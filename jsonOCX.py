@@ -13,6 +13,15 @@ from OCXCommon import StructurePart
 from OCXJson import TightnessProperty, EntitiesMap
 
 
+def jsonFormat(properties: OCXJson.JSONProperties, options):
+    if options.stream:
+        properties.streamJson(options.compact, options.fast)
+    else:
+        properties.jsonFormat(options.compact, options.fast)
+    if options.incremental:
+        properties.incrementalJson()
+
+
 def main():
     # Construct the argument parser
     argp = argparse.ArgumentParser(prog='diffOCX',
@@ -29,26 +38,40 @@ def main():
     argp.add_argument("-log", "--logfile", default=__name__ + '.log', type=str,
                       help="Output logging information. This is useful for debugging")
     argp.add_argument("-level", "--level", default='DEBUG', type=str, help='Log level. DEBUG is most verbose')
+    argp.add_argument("-s", "--stream", action='store_true', help="Write the properties to file while they are generated")
+    argp.add_argument("-c", "--compact", action='store_true', help="Write compact JSON without indentation")
+    argp.add_argument("-f", "--fast", action='store_true', help="Use the orjson encoder if it is installed")
+    argp.add_argument("-i", "--incremental", action='store_true',
+                      help="Only regenerate the properties of parts changed since the last run")
+    argp.add_argument("-j", "--processes", default=1, type=int,
+                      help="Number of worker processes generating the properties")
+    argp.add_argument("-k", "--chunksize", default=5000, type=int, help="Number of parts in each worker chunk")
+    argp.add_argument("-t", "--table", default='', type=str,
+                      help="Also write the part attributes to a columnar .parquet or .npz file")
+    argp.add_argument("-p", "--properties", default='material,bracket', type=str,
+                      help="Comma separated properties to generate: {}"
+                      .format(', '.join(OCXJson.PropertyExporter.propertyNames())))
     options = argp.parse_args()
+    properties = [name.strip() for name in options.properties.split(',')]
+    unknown = [name for name in properties if name not in OCXJson.PropertyExporter.propertyNames()]
+    if len(unknown) > 0:
+        print('Unknown properties: {}'.format(', '.join(unknown)))
+        print('Allowed properties are: {}'.format(', '.join(OCXJson.PropertyExporter.propertyNames())))
+        return
 
     # Set up the logger
     model = OCXParser.OCXmodel(options.model, options.schema, options.log)
     model.importModel()
-    json = OCXJson.MaterialProperties(model, options.map, options.entitymap)
-    json.assignMaterials('JSON_outputfiles/material_properties.json')
-    json.writeJson()
-    json = OCXJson.BracketProperties(model, options.map, options.entitymap)
-    json.assignBracketParameters('JSON_outputfiles/bracket_properties.json')
-    json.writeJson()
-#    json = OCXJson.SectionProperties(model, options.map, options.entitymap)
-#    json.assignSections('JSON_outputfiles/section_properties.json')
-#    json.writeJson()
-#    json = OCXJson.TightnessProperty(model, options.map, options.entitymap)
-#    json.tightnessProperty('JSON_outputfiles/tightness_properties.json')
-#    json.writeJson()
-#    json = OCXJson.FunctionProperty(model, options.map, options.entitymap)
-#    json.functionType('JSON_outputfiles/function_properties.json')
-#    json.writeJson()
+    # Generate the enabled properties in one pass over the parts
+    exporter = OCXJson.PropertyExporter(model, options.map, options.entitymap)
+    exporter.parallel(options.processes, options.chunksize)
+    for name in properties:
+        json = exporter.enable(name, 'JSON_outputfiles/{}_properties.json'.format(name))
+        jsonFormat(json, options)
+    if options.table:
+        exporter.enable('table', options.table)
+    exporter.run()
+    exporter.writeJson()
 
 #  json.createMap()
 #  json.writeJson()
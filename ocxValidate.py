@@ -9,8 +9,7 @@ import argparse
 import os,  logging
 from pathlib import Path
 import OCXValidate
-from OCXCommon import Material, BarSection, ConnectionConfiguration, Property
-from OCXParser import Panel, OCXmodel, Plate, Stiffener, Bracket
+from OCXParser import OCXmodel
 
 
 def main():
@@ -27,6 +26,15 @@ def main():
     argp.add_argument("-o", "--output", default='ocxdiff.txt', type=str, help="Name of output file for report")
     argp.add_argument("-l", "--log", default=False, type=bool, help="Output logging information. This is useful for debugging")
     argp.add_argument("-log", "--logfile", default='diffOCX.log', type=str, help="Output logging information. This is useful for debugging")
+    argp.add_argument("-j", "--processes", default=1, type=int, help="Number of worker processes checking the parts")
+    argp.add_argument("-i", "--incremental", action='store_true',
+                      help="Only check the parts changed since the last run. The findings are cached in <model>.findings")
+    argp.add_argument("-jsonl", "--jsonlines", default=None, type=str,
+                      help="Write the findings and rule timings to this JSON Lines file")
+    argp.add_argument("-junit", "--junit", default=None, type=str,
+                      help="Write the findings and rule timings to this JUnit XML file")
+    argp.add_argument("-x", "--xsd", action='store_true',
+                      help="Validate the model against the schema in a separate process while it is imported")
     argp.add_argument("-level", "--level", default='WARNING', type=str, help='Log level. DEBUG is most verbose')
 
     options = argp.parse_args()
@@ -45,15 +53,27 @@ def main():
     else:
         logger.setLevel(logging.INFO)
     logger.info('Starting checking OCX model {}'.format(options.model))
+    schema = None
+    if options.xsd:
+        schema = OCXValidate.SchemaValidator(options.schema)
+        schema.start(options.model)
     #The model to parse
     model = OCXmodel(options.model, options.schema, options.log)
     model.importModel()
-    model.printDryWeight()
 
 
     # Create the model validator
     validate = OCXValidate.Validator(model)
+    validate.parallel(options.processes)
+    if options.incremental:
+        validate.incremental(options.model + '.findings')
+    if schema is not None:
+        validate.checkSchema(schema)
     validate.checkModel()
+    if options.jsonlines is not None:
+        validate.writeJsonLines(options.jsonlines)
+    if options.junit is not None:
+        validate.writeJUnit(options.junit)
 
 
 #        print('Object properties test: Type={}, id={}, name={}, Has props: {}, Has description:{}'\
@@ -0,0 +1,47 @@
+#  #!/usr/bin/env python3
+#  GNU All-Permissive License
+#  Copying and distribution of this file, with or without modification,
+#  are permitted in any medium without royalty provided the copyright
+#  notice and this notice are preserved.  This file is offered as-is,
+#  without any warranty.
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+OCX = 'http://data.dnvgl.com/Schemas/ocxXSD'
+
+# A minimal OCX schema with the global elements and attributes used by the tests
+SCHEMA = ('<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:ocx="' + OCX + '" targetNamespace="' + OCX +
+          '" elementFormDefault="qualified">\n'
+          '<xs:element name="ocxXML"/>\n'
+          '<xs:element name="Vessel"/>\n'
+          '<xs:element name="Panel"/>\n'
+          '<xs:element name="Plate"/>\n'
+          '<xs:element name="Stiffener"/>\n'
+          '<xs:element name="Bracket"/>\n'
+          '<xs:element name="Pillar"/>\n'
+          '<xs:element name="Material"/>\n'
+          '<xs:element name="MaterialRef"/>\n'
+          '<xs:element name="OcxItemPtr"/>\n'
+          '<xs:attribute name="GUIDRef" type="xs:string"/>\n'
+          '<xs:attribute name="refType" type="xs:QName"/>\n'
+          '</xs:schema>\n')
+
+
+@pytest.fixture
+def schema(tmp_path) -> Path:
+    file = tmp_path / 'ocx.xsd'
+    file.write_text(SCHEMA)
+    return file
+
+
+# Write an OCX model with the xml of the parts inside the vessel
+def writeModel(file: Path, parts: str) -> Path:
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text('<ocx:ocxXML xmlns:ocx="' + OCX + '" schemaVersion="2.8"><ocx:Vessel>' + parts +
+                    '</ocx:Vessel></ocx:ocxXML>\n')
+    return file
@@ -0,0 +1,51 @@
+#  #!/usr/bin/env python3
+#  GNU All-Permissive License
+#  Copying and distribution of this file, with or without modification,
+#  are permitted in any medium without royalty provided the copyright
+#  notice and this notice are preserved.  This file is offered as-is,
+#  without any warranty.
+
+import xml.etree.ElementTree as ET
+
+from OCXCommon import StructurePart, ContentHash
+from conftest import OCX
+
+DICT = {key: '{' + OCX + '}' + name for key, name in
+        (('guidref', 'GUIDRef'), ('physicalproperties', 'PhysicalProperties'), ('dryweight', 'DryWeight'))}
+
+
+def part(xml: str):
+    return ET.fromstring(xml.format(ocx=OCX))
+
+
+def test_structure_part():
+    plate = StructurePart(part('<ocx:Plate xmlns:ocx="{ocx}" ocx:GUIDRef="{{A-1}}" name="PL1" id="p1">'
+                               '<ocx:PhysicalProperties><ocx:DryWeight numericvalue="12.5" unit="Ukg"/>'
+                               '</ocx:PhysicalProperties></ocx:Plate>'), DICT)
+    assert (plate.getType(), plate.getName(), plate.getId()) == ('Plate', 'PL1', 'p1')
+    assert plate.getGuid() == '{A-1}'
+    assert plate.getCleanGuid() == 'A-1'
+    assert plate.hasPysicalProperties()
+    assert plate.getDryWeight() == 12.5
+
+
+def test_structure_part_without_weight():
+    plate = StructurePart(part('<ocx:Plate xmlns:ocx="{ocx}" name="PL2"/>'), DICT)
+    assert plate.getCleanGuid() == ''
+    assert not plate.hasPysicalProperties()
+    assert plate.getDryWeight() == 0.0
+
+
+def test_references_are_marked_by_ref_type():
+    guidref = '{' + OCX + '}GUIDRef'
+    reftype = '{' + OCX + '}refType'
+    xml = ('<ocx:Plate xmlns:ocx="{ocx}" ocx:GUIDRef="PL1">'
+           '<ocx:OcxItemPtr ocx:GUIDRef="{}" ocx:refType="ocx:Material"/></ocx:Plate>')
+    definitions = {'M1': 'a', 'M2': 'b'}
+    contenthash = ContentHash(guidref, reftype=reftype)
+    digests = [contenthash.hexdigestReferences(part(xml.format(guid, ocx='{ocx}')), definitions.get)
+               for guid in ('M1', 'M1', 'M2')]
+    assert digests[0] == digests[1]
+    assert digests[0] != digests[2]
+    definitions['M1'] = 'c'  # A changed definition changes the hash of the referencing part
+    assert contenthash.hexdigestReferences(part(xml.format('M1', ocx='{ocx}')), definitions.get) != digests[0]
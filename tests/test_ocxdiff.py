@@ -0,0 +1,36 @@
+#  #!/usr/bin/env python3
+#  GNU All-Permissive License
+#  Copying and distribution of this file, with or without modification,
+#  are permitted in any medium without royalty provided the copyright
+#  notice and this notice are preserved.  This file is offered as-is,
+#  without any warranty.
+
+import pytest
+
+pytest.importorskip('OCC')
+
+import OCXDiff
+from conftest import writeModel
+
+PANEL = ('<ocx:Panel ocx:GUIDRef="PA1" name="PA1">'
+         '<ocx:Plate ocx:GUIDRef="PL1" name="PL1" thickness="{}"/>'
+         '<ocx:Plate ocx:GUIDRef="PL2" name="PL2" thickness="10"/>'
+         '</ocx:Panel>')
+
+
+def test_import():
+    assert OCXDiff.DiffAgent is not None
+    assert OCXDiff.StreamDiff is not None
+    assert OCXDiff.RevisionChain is not None
+
+
+# Dated export folders hold revisions with the same file name
+def test_stream_diff_same_file_names(tmp_path, schema):
+    baseline = writeModel(tmp_path / 'a' / 'model.xml', PANEL.format(10))
+    revision = writeModel(tmp_path / 'b' / 'model.xml', PANEL.format(12))
+    diff = OCXDiff.StreamDiff(str(baseline), str(revision), str(schema), str(tmp_path / 'diff.txt'))
+    diff.compare()
+    assert 'PL1' in diff.modifiedParts()
+    assert 'PL2' not in diff.modifiedParts()
+    assert len(diff.newParts()) == 0
+    assert len(diff.deletedParts()) == 0
@@ -0,0 +1,31 @@
+#  #!/usr/bin/env python3
+#  GNU All-Permissive License
+#  Copying and distribution of this file, with or without modification,
+#  are permitted in any medium without royalty provided the copyright
+#  notice and this notice are preserved.  This file is offered as-is,
+#  without any warranty.
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+pytest.importorskip('OCC')
+
+from OCXParser import ReferenceIndex
+from conftest import OCX
+
+DICT = {'guidref': '{' + OCX + '}GUIDRef', 'reftype': '{' + OCX + '}refType'}
+
+
+def test_reference_index_classifies_by_ref_type():
+    root = ET.fromstring('<ocx:Vessel xmlns:ocx="' + OCX + '">'
+                         '<ocx:Material ocx:GUIDRef="M1"/>'
+                         '<ocx:Plate ocx:GUIDRef="PL1">'
+                         '<ocx:MaterialRef ocx:GUIDRef="M1" ocx:refType="ocx:Material"/>'
+                         '<ocx:OcxItemPtr ocx:GUIDRef="M1" ocx:refType="ocx:Material"/>'
+                         '</ocx:Plate></ocx:Vessel>')
+    index = ReferenceIndex(root, DICT)
+    assert index.numberOfReferences() == 2
+    assert [source.get(DICT['guidref']) for reference, source in index.getReferences('M1')] == ['PL1', 'PL1']
+    assert not index.isDefined('PL2')
+    assert index.getDefinition('M1').tag == '{' + OCX + '}Material'
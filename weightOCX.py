@@ -0,0 +1,60 @@
+#  #!/usr/bin/env python3
+#  GNU All-Permissive License
+#  Copying and distribution of this file, with or without modification,
+#  are permitted in any medium without royalty provided the copyright
+#  notice and this notice are preserved.  This file is offered as-is,
+#  without any warranty.
+
+import argparse
+import time
+import numpy
+import OCXParser
+from OCXDiff import FingerPrint
+
+
+def main():
+    # Construct the argument parser
+    argp = argparse.ArgumentParser(prog='weightOCX',
+                                   usage='%(prog)s [options]',
+                                   description="Summarise the dry weights of the OCX model rolled up to the panels.")
+    # Add the arguments to the parser
+    argp.add_argument("-model", type=str, help="The OCX model.", default='OCX_Models/Submission_V1.xml')
+    argp.add_argument("-schema", type=str, help="URI to OCX schema xsd", default='OCX_Models/OCX_Schema_V282.xsd')
+    argp.add_argument("-l", "--log", action='store_true',
+                      help="Output logging information. This is useful for debugging")
+    argp.add_argument("-n", "--top", default=10, type=int, help="Number of the heaviest panels to list")
+    argp.add_argument("-d", "--deviation", default=0.1, type=float,
+                      help="List the panels where the rolled up child weights deviate more than this relative limit "
+                           "from the reported panel weight")
+
+    options = argp.parse_args()
+    # The part weights are taken from the fingerprint cache shared with diffOCX if the model is unchanged
+    fingerprint = FingerPrint(options.model, options.schema)
+    if not fingerprint.load():
+        model = OCXParser.OCXmodel(options.model, options.schema, options.log)
+        model.importModel()
+        fingerprint.build(model)
+    start = time.perf_counter()
+    rollup = fingerprint.rollUp()
+    seconds = time.perf_counter() - start
+    print('Parts with weight          : {:12}'.format(len(fingerprint.weights)))
+    print('Panels                     : {:12}'.format(len(rollup.panels)))
+    print('Rolled up panel weights    : {:12.3f}'.format(float(rollup.rolledup.sum())))
+    print('Parts outside panels       : {:12.3f}'.format(rollup.rootweight))
+    print('Total dry weight           : {:12.3f}'.format(rollup.totalWeight()))
+    print('Reported total dry weight  : {:12.3f}'.format(rollup.reportedWeight()))
+    print('Roll-up time               : {:12.3f} s'.format(seconds))
+    print('-------------------------------------')
+    print('The {} heaviest panels:'.format(min(options.top, len(rollup.panels))))
+    for i in numpy.argsort(-rollup.rolledup, kind='stable')[:options.top]:
+        print('{:40} {:12.3f}'.format(rollup.panels[i], rollup.rolledup[i]))
+    print('-------------------------------------')
+    deviating = rollup.deviating(options.deviation)
+    print('Panels with child weights deviating more than {:.0%} from the panel weight: {}'
+          .format(options.deviation, len(deviating)))
+    for guid, reported, rolledup in deviating:
+        print('{:40} {:12.3f} {:12.3f}'.format(guid, reported, rolledup))
+
+
+if __name__ == "__main__":
+    main()